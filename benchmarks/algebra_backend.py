@@ -0,0 +1,100 @@
+'''
+Compares the conformance backends: SPARQL text, rdflib algebra and native.
+
+Usage: python -m benchmarks.algebra_backend [shapes] [nodes]
+
+A schema of node shapes is generated, each targeting a class and
+requiring a value of a property (with a datatype) and at most one value
+of another property, together with data for every class. For both
+query backends, the translation of the shapes (for the text backend
+including rdflib's parsing and algebra translation of the query text) and
+the evaluation are timed; the native backend only evaluates.
+'''
+import sys
+import time
+
+from rdflib import Graph, Namespace, Literal
+from rdflib import SH, RDF, XSD
+from rdflib.plugins.sparql import prepareQuery
+from rdflib.plugins.sparql.evaluate import evalQuery
+
+from slsparser.shapels import parse, Op
+from slsparser.utilities import Normalizer, CLEAN_RULES
+from ssf.unaryquery import to_uq
+from ssf.algebra import to_algebra_query
+from ssf.native import Evaluator
+
+EX = Namespace('http://example.org/')
+
+
+def schema(shapes: int) -> Graph:
+    graph = Graph()
+    for i in range(shapes):
+        shape = EX[f'shape{i}']
+        graph.add((shape, RDF.type, SH.NodeShape))
+        graph.add((shape, SH.targetClass, EX[f'class{i}']))
+        required = EX[f'required{i}']
+        graph.add((shape, SH.property, required))
+        graph.add((required, SH.path, EX[f'p{i}']))
+        graph.add((required, SH.minCount, Literal(1)))
+        graph.add((required, SH.datatype, XSD.integer))
+        single = EX[f'single{i}']
+        graph.add((shape, SH.property, single))
+        graph.add((single, SH.path, EX[f'q{i}']))
+        graph.add((single, SH.maxCount, Literal(1)))
+    return graph
+
+
+def data(shapes: int, nodes: int) -> Graph:
+    graph = Graph()
+    for i in range(shapes):
+        for j in range(nodes):
+            node = EX[f'node{i}_{j}']
+            graph.add((node, RDF.type, EX[f'class{i}']))
+            graph.add((node, EX[f'p{i}'], Literal(j)))
+            graph.add((node, EX[f'q{i}'], Literal(j)))
+            if j % 10 == 0:
+                graph.add((node, EX[f'q{i}'], Literal(-j)))
+    return graph
+
+
+def _timed(label: str, function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    print(f'{label:<36}{time.perf_counter() - start:8.3f} s')
+    return result
+
+
+def run(shapes: int, nodes: int):
+    print(f'shapes: {shapes}, nodes per shape: {nodes}')
+    definitions, targets = parse(schema(shapes), indexed=True)
+    normalizer = Normalizer(definitions, CLEAN_RULES)
+    prepared = [normalizer(definitions[name]) for name in targets
+                if targets[name].op != Op.BOT]
+    graph = data(shapes, nodes)
+
+    texts = _timed('sparql: generate text', lambda: [to_uq(s) for s in prepared])
+    queries = _timed('sparql: parse and translate text',
+                     lambda: [prepareQuery(text) for text in texts])
+    text_results = _timed('sparql: evaluate', lambda: [
+        {row['v'] for row in evalQuery(graph, query, {})['bindings']}
+        for query in queries])
+
+    memo = {}
+    queries = _timed('algebra: build',
+                     lambda: [to_algebra_query(s, memo) for s in prepared])
+    algebra_results = _timed('algebra: evaluate', lambda: [
+        {row['v'] for row in evalQuery(graph, query, {})['bindings']}
+        for query in queries])
+
+    evaluator = Evaluator(graph)
+    native_results = _timed('native: evaluate',
+                            lambda: [evaluator(s) for s in prepared])
+
+    same = text_results == algebra_results == native_results
+    print(f'{"same results":<36}{str(same):>8}')
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 50,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 10)
@@ -0,0 +1,101 @@
+'''
+Compiles very deep shapes without raising the recursion limit.
+
+Usage: python -m benchmarks.deep_shapes [depth]
+
+Two shapes graphs are generated:
+- a chain of node shapes where every shape requires a :next value
+  conforming to the next shape (sh:qualifiedValueShape), giving nested
+  COUNTRANGE nodes that cannot be flattened
+- a chain of nested sh:or lists
+Every step (parsing, normalization and translation) is timed.
+'''
+import sys
+import time
+
+from rdflib import Graph, Namespace, Literal, BNode
+from rdflib import SH, RDF
+from rdflib.collection import Collection
+
+from slsparser.shapels import parse, SANode
+from slsparser.utilities import Normalizer, CLEAN_RULES
+from ssf.unaryquery import to_uq
+from ssf.sfquery import to_sfquery
+
+EX = Namespace('http://example.org/')
+
+
+def qualified_chain(depth: int) -> Graph:
+    graph = Graph()
+    for i in range(depth):
+        shape = EX[f'shape{i}']
+        propertyshape = EX[f'property{i}']
+        graph.add((shape, RDF.type, SH.NodeShape))
+        graph.add((shape, SH.property, propertyshape))
+        graph.add((propertyshape, SH.path, EX.next))
+        graph.add((propertyshape, SH.qualifiedValueShape, EX[f'shape{i + 1}']))
+        graph.add((propertyshape, SH.qualifiedMinCount, Literal(1)))
+    graph.add((EX[f'shape{depth}'], RDF.type, SH.NodeShape))
+    graph.add((EX[f'shape{depth}'], SH.hasValue, EX.end))
+    return graph
+
+
+def or_chain(depth: int) -> Graph:
+    graph = Graph()
+    for i in range(depth):
+        shape = EX[f'shape{i}']
+        graph.add((shape, RDF.type, SH.NodeShape))
+        alternatives = BNode()
+        Collection(graph, alternatives, [EX[f'shape{i + 1}'], EX[f'leaf{i}']])
+        graph.add((shape, SH['or'], alternatives))
+        graph.add((EX[f'leaf{i}'], SH.hasValue, EX[f'value{i}']))
+    graph.add((EX[f'shape{depth}'], RDF.type, SH.NodeShape))
+    graph.add((EX[f'shape{depth}'], SH.hasValue, EX.end))
+    return graph
+
+
+def _depth(node: SANode) -> int:
+    depth = 0
+    level = [node]
+    while level:
+        depth += 1
+        level = [c for n in level for c in n.children if type(c) == SANode]
+    return depth
+
+
+def _timed(label: str, function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    print(f'{label:<28}{time.perf_counter() - start:8.3f} s')
+    return result
+
+
+def run(depth: int):
+    print(f'recursion limit: {sys.getrecursionlimit()}, depth: {depth}')
+
+    print('\nqualified value shape chain')
+    graph = qualified_chain(depth)
+    _timed('parse', parse, graph)
+    definitions, _ = _timed('parse (indexed)', parse, graph, True, True)
+    normalizer = Normalizer(definitions, CLEAN_RULES)
+    shape = _timed('normalize', normalizer, definitions[EX.shape0])
+    print(f'{"tree depth":<28}{_depth(shape):8}')
+    query = _timed('to_uq', to_uq, shape)
+    print(f'{"query size (chars)":<28}{len(query):8}')
+
+    print('\nnested sh:or chain')
+    graph = or_chain(depth)
+    _timed('parse', parse, graph)
+    definitions, _ = _timed('parse (indexed)', parse, graph, True, True)
+    # no rules: the nested disjunctions are not flattened
+    normalizer = Normalizer(definitions, rules=[])
+    shape = _timed('normalize', normalizer, definitions[EX.shape0])
+    print(f'{"tree depth":<28}{_depth(shape):8}')
+    query = _timed('to_uq', to_uq, shape)
+    print(f'{"query size (chars)":<28}{len(query):8}')
+    query = _timed('to_sfquery', to_sfquery, shape)
+    print(f'{"query size (chars)":<28}{len(query):8}')
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,53 @@
+'''
+Compares validation on rdflib's memory store with the encoded store.
+
+Usage: python -m benchmarks.encoded_store [shapes] [nodes]
+
+Uses the schema and data of benchmarks.algebra_backend. The memory of
+the rdflib graph is measured with tracemalloc; for the encoded graph
+the size of the arrays is reported (the terms are shared with the rdflib
+graph). Validation is timed with the native and the encoded backend,
+and on the encoded graph saved to a (temporary) file and memory-mapped.
+'''
+import os
+import sys
+import tempfile
+import tracemalloc
+
+from ssf.conformance import CompiledSchema
+from ssf.encoded import EncodedGraph
+from benchmarks.algebra_backend import schema, data, _timed
+
+
+def run(shapes: int, nodes: int):
+    tracemalloc.start()
+    graph = data(shapes, nodes)
+    graph_memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f'shapes: {shapes}, nodes per shape: {nodes}, triples: {len(graph)}')
+    print(f'{"rdflib graph (MB)":<36}{graph_memory / 2**20:8.1f}')
+
+    encoded = _timed('encode', EncodedGraph.from_graph, graph)
+    arrays = [encoded.spo, encoded.pos, encoded.osp,
+              encoded.s_offsets, encoded.p_offsets, encoded.o_offsets]
+    print(f'{"encoded arrays (MB)":<36}{sum(a.nbytes for a in arrays) / 2**20:8.1f}')
+
+    shapes_graph = schema(shapes)
+    native = CompiledSchema(shapes_graph, 'native')
+    compiled = CompiledSchema(shapes_graph, 'encoded')
+    native_result = _timed('native: validate', native.validate, graph)
+    encoded_result = _timed('encoded: validate', compiled.validate, encoded)
+    print(f'{"same results":<36}{str(native_result == encoded_result):>8}')
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'graph.ssfg')
+        _timed('save', encoded.save, path)
+        print(f'{"file size (MB)":<36}{os.path.getsize(path) / 2**20:8.1f}')
+        opened = _timed('open', EncodedGraph.open, path)
+        mapped_result = _timed('memory-mapped: validate', compiled.validate, opened)
+        print(f'{"same results":<36}{str(native_result == mapped_result):>8}')
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 2000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 50)
@@ -0,0 +1,95 @@
+'''
+Compares the general and the specialized graph_paths queries of the
+common path shapes: a property, an inverse property and short sequences
+of (inverse) properties.
+
+Usage: python -m benchmarks.graph_paths [nodes] [triples]
+
+A random graph over a few properties is generated. For every path, the
+size of the query and rdflib's evaluation time are reported for both
+constructions, as well as whether the rows (the triples on the paths)
+are those that ssf.fragment.Extractor traces. (rdflib evaluates the
+renaming subqueries of the general construction wrongly, so its rows
+need not be.) The fragment query of a schema with these paths is
+compared in size as well.
+'''
+import random
+import sys
+
+from rdflib import Graph, Namespace
+
+from slsparser.shapels import SANode, Op
+from slsparser.pathls import PANode, POp
+from ssf.fragment import Extractor
+from ssf import sfquery
+from ssf.sfquery import graph_paths
+from benchmarks.algebra_backend import _timed
+
+EX = Namespace('http://example.org/')
+
+
+def _prop(name: str) -> PANode:
+    return PANode(POp.PROP, [EX[name]])
+
+
+def _inv(path: PANode) -> PANode:
+    return PANode(POp.INV, [path])
+
+
+PATHS = {
+    'p': _prop('p'),
+    '^p': _inv(_prop('p')),
+    'p/q': PANode(POp.COMP, [_prop('p'), _prop('q')]),
+    'p/^q': PANode(POp.COMP, [_prop('p'), _inv(_prop('q'))]),
+    'p/q/r': PANode(POp.COMP, [_prop('p'), _prop('q'), _prop('r')]),
+}
+
+
+def data(nodes: int, triples: int) -> Graph:
+    rng = random.Random(0)
+    graph = Graph()
+    for _ in range(triples):
+        graph.add((EX[f'n{rng.randrange(nodes)}'], EX[rng.choice('pqr')],
+                   EX[f'n{rng.randrange(nodes)}']))
+    return graph
+
+
+def _rows(graph: Graph, query: str):
+    return {tuple(row) for row in graph.query(query) if row.s is not None}
+
+
+def _fragment_query_size(specialized: bool) -> int:
+    # the fragment query of >= 1 E.TOP for every path E
+    shape = SANode(Op.AND, [SANode(Op.COUNTRANGE, [1, None, path, SANode(Op.TOP, [])])
+                            for path in PATHS.values()])
+    general = sfquery.graph_paths
+    if not specialized:
+        sfquery.graph_paths = lambda path: general(path, False)
+    try:
+        return len(sfquery.to_sfquery(shape))
+    finally:
+        sfquery.graph_paths = general
+
+
+def run(nodes: int, triples: int):
+    graph = data(nodes, triples)
+    print(f'nodes: {nodes}, triples: {len(graph)}')
+    extractor = Extractor(graph)
+
+    for name, path in PATHS.items():
+        expected = {(t, *triple, h) for t in graph.all_nodes()
+                    for h, path_triples in extractor.traces(path, t).items()
+                    for triple in path_triples}
+        for label, specialized in [('general', False), ('specialized', True)]:
+            query = str(graph_paths(path, specialized))
+            print(f'{f"{name}: {label}: query size (B)":<36}{len(query):8}')
+            rows = _timed(f'{name}: {label}: evaluate', _rows, graph, query)
+            print(f'{f"{name}: {label}: correct rows":<36}{str(rows == expected):>8}')
+
+    print(f'{"fragment query: general (B)":<36}{_fragment_query_size(False):8}')
+    print(f'{"fragment query: specialized (B)":<36}{_fragment_query_size(True):8}')
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 100,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 300)
@@ -0,0 +1,64 @@
+'''
+Measures the bulk N-Triples loader against rdflib's parser.
+
+Usage: python -m benchmarks.ntriples_loader [triples] [processes]
+
+An N-Triples file with the given number of triples (10M by default) is
+generated in a temporary directory: typed nodes with IRI, integer and
+language-tagged string values. It is loaded with ssf.loader (with one
+process and with the given number of processes, by default the number of
+CPUs); rdflib's Graph.parse is timed on the first 200k triples only.
+'''
+import os
+import sys
+import tempfile
+import time
+from itertools import islice
+
+from rdflib import Graph
+
+from ssf.loader import load
+
+EX = 'http://example.org/'
+
+
+def generate(path: str, triples: int):
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(triples // 4):
+            node = f'<{EX}node{i}>'
+            f.write(f'{node} <http://www.w3.org/1999/02/22-rdf-syntax-ns#type> <{EX}class{i % 100}> .\n'
+                    f'{node} <{EX}knows> <{EX}node{(i * 7919) % (triples // 4)}> .\n'
+                    f'{node} <{EX}age> "{i % 120}"^^<http://www.w3.org/2001/XMLSchema#integer> .\n'
+                    f'{node} <{EX}name> "name {i}"@en .\n')
+
+
+def _rate(label: str, triples: int, function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    seconds = time.perf_counter() - start
+    print(f'{label:<28}{seconds:8.1f} s {triples / seconds:12,.0f} triples/s')
+    return result
+
+
+def run(triples: int, processes: int):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'data.nt')
+        generate(path, triples)
+        print(f'triples: {triples}, file size: {os.path.getsize(path) / 2**20:.0f} MB, '
+              f'CPUs: {os.cpu_count()}')
+
+        sample = os.path.join(directory, 'sample.nt')
+        with open(path) as f, open(sample, 'w') as out:
+            out.writelines(islice(f, 200000))
+        _rate('rdflib Graph.parse (sample)', 200000,
+              lambda: Graph().parse(sample, format='nt'))
+
+        graph = _rate('ssf.loader, 1 process', triples, load, path, 1)
+        if processes > 1:
+            _rate(f'ssf.loader, {processes} processes', triples, load, path, processes)
+        print(f'{"terms":<28}{len(graph.terms):8}')
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 10000000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count())
@@ -0,0 +1,98 @@
+'''
+Compares the shape fragment queries of --frag with and without
+--ontology.
+
+Usage: python -m benchmarks.ontology_rewrite [shapes] [depth] [nodes]
+
+A class hierarchy (a binary tree of the given depth) is generated as the
+ontology, together with a schema of node shapes that each target a class
+of the hierarchy and require the values of a property to have the root
+class (sh:class), and data with nodes of every class (so that all
+targets conform). The data graph also contains the rdfs:subClassOf
+triples, which the queries without ontology need. Both queries are
+generated and evaluated with rdflib; the fragments are compared without
+the rdfs:subClassOf triples (which only the query without ontology
+returns). rdflib evaluates the property paths of the query without
+ontology very slowly, hence the small default sizes.
+'''
+import random
+import sys
+
+from rdflib import Graph, Namespace, BNode
+from rdflib import SH, RDF, RDFS
+
+from slsparser.shapels import parse
+from ssf.incremental import IncrementalCompiler
+from ssf.ssf import _fragment_rules, _union_query
+from benchmarks.algebra_backend import _timed
+
+EX = Namespace('http://example.org/')
+
+
+def _classes(depth: int):
+    return [EX[f'class{i}'] for i in range(2 ** (depth + 1) - 1)]
+
+
+def ontology(depth: int) -> Graph:
+    graph = Graph()
+    classes = _classes(depth)
+    for i in range(1, len(classes)):
+        graph.add((classes[i], RDFS.subClassOf, classes[(i - 1) // 2]))
+    return graph
+
+
+def schema(shapes: int, depth: int) -> Graph:
+    rng = random.Random(0)
+    classes = _classes(depth)
+    graph = Graph()
+    for i in range(shapes):
+        shape = EX[f'shape{i}']
+        graph.add((shape, RDF.type, SH.NodeShape))
+        graph.add((shape, SH.targetClass, rng.choice(classes)))
+        property_shape = BNode()
+        graph.add((shape, SH.property, property_shape))
+        graph.add((property_shape, SH.path, EX.knows))
+        graph.add((property_shape, SH['class'], classes[0]))
+    return graph
+
+
+def data(depth: int, nodes: int) -> Graph:
+    rng = random.Random(1)
+    graph = ontology(depth)
+    classes = _classes(depth)
+    instances = [EX[f'node{i}_{j}'] for i in range(len(classes)) for j in range(nodes)]
+    for k, node in enumerate(instances):
+        graph.add((node, RDF.type, classes[k // nodes]))
+        graph.add((node, EX.knows, rng.choice(instances)))
+    return graph
+
+
+def _fragment(graph: Graph, query: str):
+    return {(row.s, row.p, row.o) for row in graph.query(query)}
+
+
+def run(shapes: int, depth: int, nodes: int):
+    print(f'shapes: {shapes}, classes: {2 ** (depth + 1) - 1}, nodes per class: {nodes}')
+    definitions, targets = parse(schema(shapes, depth), indexed=True)
+    graph = data(depth, nodes)
+    print(f'triples: {len(graph)}')
+
+    path_query = _timed('path: translate', lambda: _union_query(
+        IncrementalCompiler(_fragment_rules(False)).compile(definitions, targets)))
+    onto = ontology(depth)
+    values_query = _timed('ontology: translate', lambda: _union_query(
+        IncrementalCompiler(_fragment_rules(False, onto)).compile(definitions, targets)))
+    print(f'{"path: query size (kB)":<36}{len(path_query) / 1024:8.1f}')
+    print(f'{"ontology: query size (kB)":<36}{len(values_query) / 1024:8.1f}')
+
+    path_fragment = _timed('path: evaluate', _fragment, graph, path_query)
+    values_fragment = _timed('ontology: evaluate', _fragment, graph, values_query)
+    print(f'{"fragment triples":<36}{len(values_fragment):8}')
+    same = {t for t in path_fragment if t[1] != RDFS.subClassOf} == values_fragment
+    print(f'{"same fragment":<36}{str(same):>8}')
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 3,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 2,
+        int(sys.argv[3]) if len(sys.argv) > 3 else 3)
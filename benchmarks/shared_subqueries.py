@@ -0,0 +1,104 @@
+'''
+Compares the fragment queries of a schema with and without the shared
+conformance queries of ssf.shared.
+
+Usage: python -m benchmarks.shared_subqueries [shapes] [nodes]
+
+A schema is generated in which every node shape targets a class of its
+own and refers to the same address shape (sh:node) and the same
+property shape (sh:property), as schemas do with common parts. The
+sizes of the queries are compared; the fragments are evaluated with
+rdflib (the materialization in a named graph of the dataset) and
+compared with ssf.fragment. (rdflib evaluates the renaming subqueries of
+the fragment queries wrongly, and slowly: the defaults are small, and
+the queries return extra triples of the nodes that do not conform.)
+'''
+import sys
+
+from rdflib import Dataset, Graph, Namespace, Literal, BNode
+from rdflib import SH, RDF, XSD
+
+from slsparser.shapels import parse
+from ssf.fragment import extract, prepare
+from ssf.sfquery import to_sfquery
+from ssf.shared import compile_shared
+from ssf.ssf import _union_query
+from benchmarks.algebra_backend import _timed
+
+EX = Namespace('http://example.org/')
+
+
+def schema(shapes: int) -> Graph:
+    graph = Graph()
+    graph.add((EX.Address, RDF.type, SH.NodeShape))
+    for path, datatype in [(EX.street, XSD.string), (EX.zip, XSD.integer)]:
+        property_shape = BNode()
+        graph.add((EX.Address, SH.property, property_shape))
+        graph.add((property_shape, SH.path, path))
+        graph.add((property_shape, SH.minCount, Literal(1)))
+        graph.add((property_shape, SH.datatype, datatype))
+    graph.add((EX.named, SH.path, EX.name))
+    graph.add((EX.named, SH.minCount, Literal(1)))
+    graph.add((EX.named, SH.maxCount, Literal(1)))
+
+    for i in range(shapes):
+        shape = EX[f'shape{i}']
+        graph.add((shape, RDF.type, SH.NodeShape))
+        graph.add((shape, SH.targetClass, EX[f'class{i}']))
+        graph.add((shape, SH.property, EX.named))
+        address = BNode()
+        graph.add((shape, SH.property, address))
+        graph.add((address, SH.path, EX.address))
+        graph.add((address, SH.node, EX.Address))
+    return graph
+
+
+def data(shapes: int, nodes: int) -> Graph:
+    graph = Graph()
+    for i in range(shapes):
+        for j in range(nodes):
+            node = EX[f'node{i}_{j}']
+            address = EX[f'address{i}_{j}']
+            graph.add((node, RDF.type, EX[f'class{i}']))
+            graph.add((node, EX.name, Literal(f'name {j}')))
+            graph.add((node, EX.address, address))
+            graph.add((address, EX.street, Literal(f'street {j}')))
+            if j % 3:
+                graph.add((address, EX.zip, Literal(j)))
+    return graph
+
+
+def _fragment(dataset: Dataset, query: str):
+    return {(row.s, row.p, row.o) for row in dataset.query(query) if row.s is not None}
+
+
+def run(shapes: int, nodes: int):
+    print(f'shapes: {shapes}, nodes per shape: {nodes}')
+    definitions, targets = parse(schema(shapes), indexed=True)
+    prepared = prepare(definitions, targets)
+
+    plain = _timed('separate: translate',
+                   lambda: _union_query([to_sfquery(shape) for shape in prepared]))
+    update, queries = _timed('shared: translate', compile_shared, prepared)
+    shared = _union_query(queries)
+    print(f'{"separate: query size (kB)":<36}{len(plain) / 1024:8.1f}')
+    print(f'{"shared: update size (kB)":<36}{len(update) / 1024:8.1f}')
+    print(f'{"shared: query size (kB)":<36}{len(shared) / 1024:8.1f}')
+    print(f'{"shared: materialized subqueries":<36}{update.count("INSERT"):8}')
+
+    graph = data(shapes, nodes)
+    dataset = Dataset()
+    for triple in graph:
+        dataset.add(triple)
+    plain_fragment = _timed('separate: evaluate', _fragment, dataset, plain)
+    _timed('shared: materialize', dataset.update, update)
+    shared_fragment = _timed('shared: evaluate', _fragment, dataset, shared)
+    expected = set(extract(graph, definitions, targets))
+    for label, fragment in [('separate', plain_fragment), ('shared', shared_fragment)]:
+        print(f'{f"{label}: missing triples":<36}{len(expected - fragment):8}')
+        print(f'{f"{label}: extra triples":<36}{len(fragment - expected):8}')
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 3,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 2)
@@ -1,11 +1,36 @@
-from typing import List
+from typing import List, Tuple
+from weakref import WeakValueDictionary
 
 from enum import Enum, auto
 
+import rdflib
 from rdflib import Graph
-from rdflib import SH, RDF
 from rdflib.term import URIRef, BNode
-from rdflib.collection import Collection
+
+
+class _Terms:
+    """The terms of an rdflib namespace, bound as plain attributes
+
+    Every lookup of a term on rdflib's SH or RDF namespace checks that the
+    term is defined, which took most of the time of parsing a shapes
+    graph. Here a term is looked up on the namespace once, the first time
+    it is used.
+    """
+
+    def __init__(self, namespace):
+        self._namespace = namespace
+
+    def __getattr__(self, name: str) -> URIRef:
+        term = self._namespace[name]
+        setattr(self, name, term)
+        return term
+
+    def __getitem__(self, name: str) -> URIRef:
+        return getattr(self, name)
+
+
+SH = _Terms(rdflib.SH)
+RDF = _Terms(rdflib.RDF)
 
 
 class POp(Enum):  # Path Operator
@@ -18,31 +43,55 @@ class POp(Enum):  # Path Operator
     ID = auto() # for EQ and DISJ, no child
 
 
+def _freeze(children) -> Tuple:
+    """Turn a (nested) children list into a (nested) tuple"""
+    return tuple(_freeze(c) if isinstance(c, (list, tuple)) else c
+                 for c in children)
+
+
+def _children_key(children: Tuple) -> Tuple:
+    # Values of different types can compare equal (1 == True == Literal?),
+    # so the type is part of the interning key.
+    return tuple((type(c), _children_key(c) if type(c) == tuple else c)
+                 for c in children)
+
+
 class PANode:  # Path Algebra Node
-    """Ordered tree representing a path expression"""
+    """Ordered tree representing a path expression
+
+    PANodes are immutable and hash-consed: constructing a PANode that is
+    structurally equal to a live one returns that same object. Equality is
+    therefore identity, and the hash is computed once at construction.
+    """
+
+    __slots__ = ('pop', 'children', '_hash', '__weakref__')
 
-    def __init__(self, pop: POp, children: List):
-        self.pop = pop
-        self.children = children
+    pop: POp
+    children: Tuple
+    _hash: int
 
-    def __eq__(self, other):
-        """ Overwrite the '==' operator """
-        if not isinstance(other, PANode):
-            return False
+    _interned: 'WeakValueDictionary[Tuple, PANode]' = WeakValueDictionary()
 
-        if self.pop == POp.PROP:
-            return self.pop == other.pop and \
-              self.children[0] == other.children[0]
+    def __new__(cls, pop: POp, children: List):
+        frozen = _freeze(children)
+        key = (pop, _children_key(frozen))
+        node = cls._interned.get(key)
+        if node is None:
+            node = object.__new__(cls)
+            object.__setattr__(node, 'pop', pop)
+            object.__setattr__(node, 'children', frozen)
+            object.__setattr__(node, '_hash', hash(key))
+            cls._interned[key] = node
+        return node
 
-        if len(self.children) != len(other.children):
-            return False
-        same_children = True
-        for child_self, child_other in zip(self.children, other.children):
-            if type(child_self) == BNode and type(child_other) == BNode:
-                continue
-            same_children = same_children and child_self == child_other
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{type(self).__name__} is immutable')
 
-        return self.pop == other.pop and same_children
+    def __hash__(self):
+        return self._hash
+
+    def __reduce__(self):
+        return (PANode, (self.pop, self.children))
 
     def __repr__(self):
         """ Pretty representation of the PANode tree """
@@ -55,6 +104,40 @@ class PANode:  # Path Algebra Node
         return out
 
 
+_LATEX_ESCAPES = {'\\': r'\textbackslash{}', '{': r'\{', '}': r'\}', '_': r'\_',
+                  '#': r'\#', '%': r'\%', '&': r'\&', '$': r'\$',
+                  '^': r'\textasciicircum{}', '~': r'\textasciitilde{}'}
+
+
+def term_as_latex(term, namespace_manager=None) -> str:
+    """an RDF term (or a list of terms) in LaTeX, as N3 (prefixed with
+    namespace_manager if given)"""
+    if isinstance(term, tuple):
+        return r'\{' + ', '.join(term_as_latex(t, namespace_manager)
+                                 for t in term) + r'\}'
+    text = term.n3(namespace_manager) if hasattr(term, 'n3') else str(term)
+    return r'\texttt{' + ''.join(_LATEX_ESCAPES.get(c, c) for c in text) + '}'
+
+
+def pa_as_latex(node: PANode, namespace_manager=None) -> str:
+    """the path expression as a LaTeX formula"""
+    if node.pop == POp.PROP:
+        return term_as_latex(node.children[0], namespace_manager)
+    if node.pop == POp.ID:
+        return r'\mathrm{id}'
+
+    children = [pa_as_latex(c, namespace_manager) for c in node.children]
+    if node.pop == POp.INV:
+        return '(' + children[0] + ')^{-}'
+    if node.pop == POp.ZEROORONE:
+        return '(' + children[0] + ')^{?}'
+    if node.pop == POp.KLEENE:
+        return '(' + children[0] + ')^{*}'
+    if node.pop == POp.ALT:
+        return '(' + r' \cup '.join(children) + ')'
+    return '(' + ' / '.join(children) + ')'  # POp.COMP
+
+
 def parse(graph: Graph, path) -> PANode:
     if type(path) == URIRef:
         return _parse_prop(path)
@@ -75,7 +158,7 @@ def _parse_path(graph: Graph, path: BNode) -> PANode:
 
     # Composition of paths
     if (path, RDF.first, None) in graph:
-        shacl_list = Collection(graph, path)
+        shacl_list = list(graph.items(path))
         children = []
         for item in shacl_list:
             step = parse(graph, item)
@@ -102,7 +185,7 @@ def _parse_path(graph: Graph, path: BNode) -> PANode:
     # Alternative paths
     if (path, SH.alternativePath, None) in graph:
         first = next(graph.objects(path, SH.alternativePath))
-        shacl_list = Collection(graph, first)
+        shacl_list = list(graph.items(first))
         children = []
         for item in shacl_list:
             step = parse(graph, item)
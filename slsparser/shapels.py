@@ -2,14 +2,20 @@ from __future__ import annotations
 from typing import List, Optional, Tuple
 from itertools import repeat
 from enum import Enum, auto
+from weakref import WeakValueDictionary
 
+import rdflib
 from rdflib import Graph
-from rdflib import SH, RDF, RDFS
-from rdflib.term import URIRef, Literal, BNode, Node
-from rdflib.collection import Collection
+from rdflib.term import URIRef, Literal, Node
 
 from slsparser.pathls import parse as pparse
 from slsparser.pathls import PANode, POp
+from slsparser.pathls import _freeze, _children_key, _Terms
+from slsparser.pathls import pa_as_latex, term_as_latex
+
+SH = _Terms(rdflib.SH)  # (see pathls._Terms)
+RDF = _Terms(rdflib.RDF)
+RDFS = _Terms(rdflib.RDFS)
 
 class Op(Enum):
     HASVALUE = auto() # Op.HASVALUE val
@@ -44,30 +50,49 @@ class Op(Enum):
     BOT = auto() # Op.BOT
 
     COUNTRANGE = auto() # Op.COUNTRANGE num num/None PANode SANode
+    EXACTLY1 = auto() # Op.EXACTLY1 PANode
+    # EXACTLY1 E is COUNTRANGE 1 1 E TOP, only introduced by optimizations
 
 
 class SANode:  # Shape Algebra Node
-    def __init__(self, op: Op, children: List, constraintComponent: URIRef | Tuple[URIRef, ...]| None = None):
-        self.op = op
-        self.children = children
-        self.constraintComponent = constraintComponent
-
-    def __eq__(self, other):
-        """ Overwrite the '==' operator """
-        if not isinstance(other, SANode):
-            return False
-        
-        if len(self.children) != len(other.children):
-            return False
+    """Immutable, hash-consed node of the shape algebra
+
+    Constructing an SANode that is structurally equal to a live one returns
+    that same object, so equal subshapes are shared (the trees are DAGs),
+    equality is identity and nodes can be used as dictionary keys.
+    """
+
+    __slots__ = ('op', 'children', 'constraintComponent', '_hash',
+                 '__weakref__')
+
+    op: Op
+    children: Tuple
+    constraintComponent: Optional[URIRef | Tuple[URIRef, ...]]
+    _hash: int
+
+    _interned: WeakValueDictionary[Tuple, SANode] = WeakValueDictionary()
+
+    def __new__(cls, op: Op, children: List, constraintComponent: URIRef | Tuple[URIRef, ...]| None = None):
+        frozen = _freeze(children)
+        key = (op, _children_key(frozen), constraintComponent)
+        node = cls._interned.get(key)
+        if node is None:
+            node = object.__new__(cls)
+            object.__setattr__(node, 'op', op)
+            object.__setattr__(node, 'children', frozen)
+            object.__setattr__(node, 'constraintComponent', constraintComponent)
+            object.__setattr__(node, '_hash', hash(key))
+            cls._interned[key] = node
+        return node
 
-        same_children = True
-        for child_self, child_other in zip(self.children, other.children):
-            if type(child_self) == BNode and type(child_other) == BNode:
-                continue
-            same_children = same_children and child_self == child_other
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{type(self).__name__} is immutable')
 
-        return (self.op == other.op) and same_children and\
-            self.constraintComponent == other.constraintComponent
+    def __hash__(self):
+        return self._hash
+
+    def __reduce__(self):
+        return (SANode, (self.op, self.children, self.constraintComponent))
 
     def __repr__(self):
         """ Pretty representation of the SANode tree """
@@ -80,6 +105,125 @@ class SANode:  # Shape Algebra Node
         return out
 
 
+def sa_as_latex(node: SANode, namespace_manager=None) -> str:
+    """the shape as a LaTeX formula (in the notation of the shape algebra)
+
+    The IRIs and literals are written as N3, prefixed with
+    namespace_manager if given.
+    """
+    term = lambda t: term_as_latex(t, namespace_manager)
+    path = lambda p: pa_as_latex(p, namespace_manager)
+    shape = lambda s: sa_as_latex(s, namespace_manager)
+
+    if node.op == Op.TOP:
+        return r'\top'
+    if node.op == Op.BOT:
+        return r'\bot'
+    if node.op == Op.HASVALUE:
+        return r'\mathrm{hasValue}(' + term(node.children[0]) + ')'
+    if node.op == Op.HASSHAPE:
+        return r'\mathrm{hasShape}(' + term(node.children[0]) + ')'
+    if node.op == Op.TEST:
+        return r'\mathrm{test}(' + ', '.join(term(c) for c in node.children) + ')'
+    if node.op == Op.NOT:
+        return r'\neg ' + shape(node.children[0])
+    if node.op in [Op.AND, Op.OR]:
+        connective = r' \wedge ' if node.op == Op.AND else r' \vee '
+        return '(' + connective.join(shape(c) for c in node.children) + ')'
+    if node.op == Op.FORALL:
+        return r'\forall ' + path(node.children[0]) + '.' + shape(node.children[1])
+    if node.op == Op.COUNTRANGE:
+        mincount, maxcount, e, psi = node.children
+        at_least = r'{\geq_{' + str(mincount) + '}} ' + path(e) + '.' + shape(psi)
+        at_most = r'{\leq_{' + str(maxcount) + '}} ' + path(e) + '.' + shape(psi)
+        if maxcount is None:
+            return at_least
+        if int(mincount) == 0:
+            return at_most
+        return '(' + at_least + r' \wedge ' + at_most + ')'
+    if node.op == Op.EXACTLY1:
+        return r'{=_{1}} ' + path(node.children[0]) + r'.\top'
+    if node.op == Op.CLOSED:
+        return r'\mathrm{closed}(\{' + ', '.join(path(c) for c in node.children) + r'\})'
+
+    names = {Op.EQ: 'eq', Op.DISJ: 'disj', Op.LESSTHAN: 'lessThan',
+             Op.LESSTHANEQ: 'lessThanEq', Op.UNIQUELANG: 'uniqueLang'}
+    return r'\mathrm{' + names[node.op] + '}(' + \
+        ', '.join(path(c) for c in node.children) + ')'
+
+
+class ShapesIndex:
+    """Read-only index of a shapes graph, built in one sweep over its triples
+
+    The parser looks up every SHACL parameter of every shape separately.
+    On an rdflib Graph each lookup is a pattern match on the store, on this
+    index it is a dictionary lookup. It provides the part of the Graph
+    interface the parsers use, so it can be passed wherever they expect a
+    graph.
+    """
+
+    def __init__(self, graph: Graph):
+        self.spo = {}  # a mapping: subject, (a mapping: predicate, objects)
+        self.pos = {}  # a mapping: predicate, (a mapping: object, subjects)
+        for s, p, o in graph:
+            self.spo.setdefault(s, {}).setdefault(p, []).append(o)
+            self.pos.setdefault(p, {}).setdefault(o, []).append(s)
+
+    def objects(self, subject: Optional[Node] = None,
+                predicate: Optional[Node] = None):
+        if subject is not None:
+            props = self.spo.get(subject, {})
+            if predicate is not None:
+                return iter(props.get(predicate, []))
+            return (o for objs in props.values() for o in objs)
+        if predicate is not None:
+            return iter(list(self.pos.get(predicate, {})))
+        return (o for subjs in self.pos.values() for o in subjs)
+
+    def subjects(self, predicate: Optional[Node] = None,
+                 object: Optional[Node] = None):
+        if predicate is None:
+            raise ValueError('ShapesIndex.subjects needs a predicate')
+        objs = self.pos.get(predicate, {})
+        if object is not None:
+            return iter(objs.get(object, []))
+        return iter(list(dict.fromkeys(s for subjs in objs.values()
+                                       for s in subjs)))
+
+    def predicates(self, subject: Optional[Node] = None,
+                   object: Optional[Node] = None):
+        if subject is None or object is not None:
+            raise ValueError('ShapesIndex.predicates needs only a subject')
+        return iter(self.spo.get(subject, {}))
+
+    def value(self, subject: Optional[Node] = None,
+              predicate: Node = RDF.value, object: Optional[Node] = None,
+              default=None, any: bool = True):
+        if subject is None or object is not None:
+            raise ValueError('ShapesIndex.value needs only a subject')
+        values = self.spo.get(subject, {}).get(predicate, [])
+        return values[0] if values else default
+
+    def items(self, list: Node):
+        """the members of an rdf list"""
+        seen = set()
+        while list is not None and list != RDF.nil:
+            if list in seen:
+                raise ValueError('List contains a recursive rdf:rest reference')
+            seen.add(list)
+            item = self.value(list, RDF.first)
+            if item is not None:
+                yield item
+            list = self.value(list, RDF.rest)
+
+    def __contains__(self, triple) -> bool:
+        s, p, o = triple
+        objs = self.spo.get(s, {}).get(p, [])
+        if o is None:
+            return len(objs) > 0
+        return o in objs
+
+
 def _extract_nodeshapes(graph: Graph) -> List[Node]:
     # this defines what nodeshapes are parsed, should follow the spec on what a
     # node shape is. (of type sh:NodeShape, object of sh:node, objects of sh:not...)
@@ -94,20 +238,29 @@ def _extract_nodeshapes(graph: Graph) -> List[Node]:
                     list(graph.objects(predicate=SH.xone))
 
     for llist in logical_lists:
-        for shapename in Collection(graph, llist):
+        for shapename in list(graph.items(llist)):
             if SH.path not in graph.predicates(shapename):
                 nodeshapes.append(shapename)
 
     return nodeshapes
 
 
-def parse(graph: Graph, full: bool = True):
+def parse(graph: Graph, full: bool = True, indexed: bool = False):
+    """parse the shapes graph into definitions and targets
+
+    With indexed, the shapes graph is first read into a ShapesIndex, so
+    that parsing is linear in the number of triples of the shapes graph.
+    """
     from slsparser.utilities import clean_parsetree
 
     definitions = {}  # a mapping: shapename, SANode
     target = {}  # a mapping: shapename, target shape
 
-    nodeshapes = _extract_nodeshapes(graph)
+    if indexed and not isinstance(graph, ShapesIndex):
+        graph = ShapesIndex(graph)
+
+    # the same shape may be found several times, it is parsed once
+    nodeshapes = list(dict.fromkeys(_extract_nodeshapes(graph)))
 
     for nodeshape in nodeshapes:
         definitions[nodeshape] = clean_parsetree(_nodeshape_parse(graph, nodeshape), full)
@@ -131,12 +284,12 @@ def parse(graph: Graph, full: bool = True):
 
 
 def _target_parse(graph: Graph, shapename: Node) -> SANode:
-    out = SANode(Op.OR, [])
+    disj = []
     for tnode in _extract_parameter_values(graph, shapename, SH.targetNode):
-        out.children.append(SANode(Op.HASVALUE, [tnode]))
+        disj.append(SANode(Op.HASVALUE, [tnode]))
 
     for tclass in _extract_parameter_values(graph, shapename, SH.targetClass):
-        out.children.append(SANode(
+        disj.append(SANode(
             Op.COUNTRANGE,
             [
                 Literal(1), None, PANode(POp.COMP, [
@@ -147,7 +300,7 @@ def _target_parse(graph: Graph, shapename: Node) -> SANode:
             ]))
 
     if (shapename, RDF.type, RDFS.Class) in graph:
-        out.children.append(SANode(
+        disj.append(SANode(
             Op.COUNTRANGE,
             [
                 Literal(1), None, PANode(POp.COMP, [
@@ -159,7 +312,7 @@ def _target_parse(graph: Graph, shapename: Node) -> SANode:
 
     for tsub in _extract_parameter_values(graph, shapename,
                                           SH.targetSubjectsOf):
-        out.children.append(SANode(Op.COUNTRANGE, [
+        disj.append(SANode(Op.COUNTRANGE, [
             Literal(1),
             None,
             PANode(POp.PROP, [tsub]),
@@ -167,17 +320,17 @@ def _target_parse(graph: Graph, shapename: Node) -> SANode:
 
     for tobj in _extract_parameter_values(graph, shapename,
                                           SH.targetObjectsOf):
-        out.children.append(SANode(Op.COUNTRANGE, [
+        disj.append(SANode(Op.COUNTRANGE, [
             Literal(1),
             None,
             PANode(POp.INV, [
                 PANode(POp.PROP, [tobj])]),
             SANode(Op.TOP, [])]))
 
-    if not out.children:
-        out = SANode(Op.BOT, [])
+    if not disj:
+        return SANode(Op.BOT, [])
 
-    return out
+    return SANode(Op.OR, disj)
 
 
 def _nodeshape_parse(graph: Graph, shapename: Node) -> SANode:
@@ -233,25 +386,25 @@ def _logic_parse(graph: Graph, shapename: Node) -> list[SANode]:
         conj_out.append(SANode(Op.NOT, [SANode(Op.HASSHAPE, [nshape])], SH.NotConstraintComponent))
 
     for ashape in _extract_parameter_values(graph, shapename, SH['and']):
-        shacl_list = Collection(graph, ashape)
+        shacl_list = list(graph.items(ashape))
         conj_list = [SANode(Op.HASSHAPE, [s]) for s in shacl_list]
         conj_out.append(SANode(Op.AND, conj_list, SH.AndConstraintComponent))
 
     for oshape in _extract_parameter_values(graph, shapename, SH['or']):
-        shacl_list = Collection(graph, oshape)
+        shacl_list = list(graph.items(oshape))
         disj_list = [SANode(Op.HASSHAPE, [s]) for s in shacl_list]
         conj_out.append(SANode(Op.OR, disj_list, SH.OrConstraintComponent))
 
     for xshape in _extract_parameter_values(graph, shapename, SH.xone):
-        shacl_list = Collection(graph, xshape)
+        shacl_list = list(graph.items(xshape))
         _disj_out = []
         for s in shacl_list:
-            single_xone = SANode(Op.AND, [SANode(Op.HASSHAPE, [s])])
+            single_xone = [SANode(Op.HASSHAPE, [s])]
             for not_s in shacl_list:
                 if s != not_s:
-                    single_xone.children.append(
+                    single_xone.append(
                         SANode(Op.NOT, [SANode(Op.HASSHAPE, [not_s])]))
-            _disj_out.append(single_xone)
+            _disj_out.append(SANode(Op.AND, single_xone))
         if _disj_out:
             conj_out.append(SANode(Op.OR, _disj_out, SH.XoneConstraintComponent))
 
@@ -399,11 +552,11 @@ def _value_parse(graph: Graph, shapename: Node) -> list[SANode]:
 def _in_parse(graph: Graph, shapename: Node) -> list[SANode]:
     conj_out = []
     for sh_in in _extract_parameter_values(graph, shapename, SH['in']):
-        shacl_list = Collection(graph, sh_in)
-        disj = SANode(Op.OR, [], SH.InConstraintComponent)
+        shacl_list = list(graph.items(sh_in))
+        disj = []
         for val in shacl_list:
-            disj.children.append(SANode(Op.HASVALUE, [val]))
-        conj_out.append(disj)
+            disj.append(SANode(Op.HASVALUE, [val]))
+        conj_out.append(SANode(Op.OR, disj, SH.InConstraintComponent))
     return conj_out
 
 
@@ -415,7 +568,7 @@ def _closed_parse(graph: Graph, shapename: Node) -> list[SANode]:
                                         SH.ignoredProperties)
     sh_ignored = []
     for ig in ignored:
-        shacl_list = Collection(graph, ig)
+        shacl_list = list(graph.items(ig))
         sh_ignored += list(shacl_list)
 
     direct_props = []
@@ -500,14 +653,14 @@ def _qual_parse(graph: Graph, path: PANode, shapename: Node) -> list[SANode]:
         result_qvs = SANode(Op.HASSHAPE, [qvs])  # normal qualifiedvalueshape
 
         if len(sibl) > 0:  # if there is a sibling, wrap it in an Op.AND
-            result_qvs = SANode(Op.AND, [result_qvs])
-
-        # for every sibling, add its negation, unless it is itself
-        for s in sibl:
-            if s == qvs:
-                continue
-            result_qvs.children.append(SANode(Op.NOT, [
-                SANode(Op.HASSHAPE, [s])]))
+            conj_qvs = [result_qvs]
+            # for every sibling, add its negation, unless it is itself
+            for s in sibl:
+                if s == qvs:
+                    continue
+                conj_qvs.append(SANode(Op.NOT, [
+                    SANode(Op.HASSHAPE, [s])]))
+            result_qvs = SANode(Op.AND, conj_qvs)
 
         smallest_min = _min_literal(qual_min)
         largest_max = _max_literal(qual_max)
@@ -552,7 +705,7 @@ def _lang_parse(graph: Graph, path: PANode, shapename: Node) -> list[SANode]:
     # sh:languageIn
     literal_list = []
     for langin in _extract_parameter_values(graph, shapename, SH.languageIn):
-        shacl_list = Collection(graph, langin)
+        shacl_list = list(graph.items(langin))
         literal_list += [tag for tag in shacl_list]
 
     if literal_list:
@@ -1,78 +1,195 @@
-from typing import Optional, Dict
+from typing import Optional, Dict, List, Set, Callable
 from rdflib import Literal
 from slsparser.shapels import SANode, Op
 
 
-def expand_shape(definitions: Dict, node: SANode) -> SANode:
-    """Removes all hasshape references and replaces them with shapes"""
+class ShapeCycleError(ValueError):
+    """The shape definitions reference each other recursively"""
 
-    if node.op == Op.HASSHAPE:
-        if node.children[0] not in definitions:
-            return SANode(Op.TOP, [])  # mimics real SHACL semantics
-        return expand_shape(definitions, definitions[node.children[0]])
+    def __init__(self, cycle: List):
+        self.cycle = cycle
+        super().__init__('Recursive shape definitions: ' +
+                         ' -> '.join(str(name) for name in cycle + cycle[:1]))
 
-    new_children = []
-    for child in node.children:
-        new_child = child
-        if type(child) == SANode:
-            new_child = expand_shape(definitions, child)
-        new_children.append(new_child)
-    return SANode(node.op, new_children)
 
+def postorder(root, dependencies: Callable, combine: Callable,
+              memo: Optional[Dict] = None):
+    """Bottom-up evaluation of a tree (or DAG) without recursion
+
+    dependencies(node) lists the nodes of which combine(node, memo) needs
+    the result; those are computed first, with an explicit stack, and
+    combine reads them from memo. Every node is combined once and its
+    result is stored in memo, which can be shared between calls. Without
+    a memo, the intermediate results are dropped as soon as all nodes that
+    depend on them are combined.
+    """
+    release = memo is None
+    if release:
+        memo = {}
+        waiting = {}  # a mapping: node, number of dependents not combined
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            for dep in dependencies(node):
+                if dep not in waiting:
+                    waiting[dep] = 0
+                    stack.append(dep)
+                waiting[dep] += 1
+
+    stack = [root]
+    while stack:
+        node = stack[-1]
+        if node in memo:
+            stack.pop()
+            continue
+        pending = [dep for dep in dependencies(node) if dep not in memo]
+        if pending:
+            stack.extend(reversed(pending))
+            continue
+        stack.pop()
+        memo[node] = combine(node, memo)
+        if release:
+            for dep in dependencies(node):
+                waiting[dep] -= 1
+                if waiting[dep] == 0:
+                    del memo[dep]
+
+    return memo[root]
+
+
+def expand_shape(definitions: Dict, node: SANode, memo: Optional[Dict] = None) -> SANode:
+    """Removes all hasshape references and replaces them with shapes
+
+    Every (sub)shape is expanded only once and the result is shared by all
+    of its references. Passing the same memo dict to several calls on the
+    same definitions shares the expansions between those calls.
+
+    Reference cycles are detected before expanding; they raise a
+    ShapeCycleError.
+    """
+    if memo is None:
+        memo = {}
+
+    cycles = reference_cycles(definitions, node, memo)
+    if cycles:
+        raise ShapeCycleError(cycles[0])
+
+    return _expand(definitions, node, memo)
+
+
+def _expand(definitions: Dict, node: SANode, memo: Dict) -> SANode:
+    def dependencies(node: SANode) -> List[SANode]:
+        if node.op == Op.HASSHAPE:
+            name = node.children[0]
+            if name not in definitions:
+                return []
+            return [definitions[name]]
+        return [child for child in node.children if type(child) == SANode]
+
+    def combine(node: SANode, memo: Dict) -> SANode:
+        if node.op == Op.HASSHAPE:
+            name = node.children[0]
+            if name not in definitions:
+                return SANode(Op.TOP, [])  # mimics real SHACL semantics
+            return memo[definitions[name]]
 
-def negation_normal_form(node: SANode) -> SANode:
-    # The input should be a node without that has no HASSHAPE in its tree (it is expanded)
-    if node.op != Op.NOT:
         new_children = []
         for child in node.children:
-            if type(child) != SANode:
-                new_children.append(child)
-            else:
-                new_children.append(negation_normal_form(child))
+            new_child = child
+            if type(child) == SANode:
+                new_child = memo[child]
+            new_children.append(new_child)
         return SANode(node.op, new_children)
 
-    nnode = node.children[0]
-    if nnode.op == Op.AND:
-        new_children = []
-        for child in nnode.children:
-            new_children.append(
-                negation_normal_form(SANode(Op.NOT, [child])))
-        return SANode(Op.OR, new_children)
+    return postorder(node, dependencies, combine, memo)
 
-    if nnode.op == Op.OR:
-        new_children = []
-        for child in nnode.children:
-            new_children.append(
-                negation_normal_form(SANode(Op.NOT, [child])))
-        return SANode(Op.AND, new_children)
 
-    if nnode.op == Op.NOT:
-        return nnode.children[0]
+def shape_references(node: SANode, skip: Optional[Dict] = None) -> Set:
+    """The names of the shapes referenced by HASSHAPE nodes in node
+
+    Subtrees that are keys of skip (e.g. an expansion memo) are not visited.
+    """
+    references = set()
+    visited = set()
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        if current in visited or (skip is not None and current in skip):
+            continue
+        visited.add(current)
+        if current.op == Op.HASSHAPE:
+            references.add(current.children[0])
+            continue
+        stack.extend(c for c in current.children if type(c) == SANode)
+    return references
 
-    if nnode.op == Op.COUNTRANGE:
-        new_children = []
-        if nnode.children[1] is not None: 
-            new_children.append(SANode(Op.COUNTRANGE, 
-                                       [nnode.children[1], None, 
-                                        nnode.children[2], 
-                                        negation_normal_form(
-                                            SANode(Op.NOT, [nnode.children[3]]))]))
-        if nnode.children[0] != 0:
-            new_children.append(SANode(Op.COUNTRANGE, 
-                                       [0, nnode.children[0],
-                                        nnode.children[2],
-                                        negation_normal_form(
-                                            SANode(Op.NOT, [nnode.children[3]]))]))
-
-        return SANode(Op.OR, new_children)
-
-    if nnode.op == Op.FORALL:
-        return SANode(Op.COUNTRANGE, [Literal(1), None, 
-                                      nnode.children[0],
-                                      negation_normal_form(
-                                        SANode(Op.NOT, [nnode.children[1]]))])
-    # We do not consider HASSHAPE as this function works on expanded shapes
-    return node
+
+def reference_cycles(definitions: Dict, node: Optional[SANode] = None,
+                     skip: Optional[Dict] = None) -> List[List]:
+    """The reference cycles among the shapes reachable from node
+
+    Without node, all defined shapes are considered. Every cycle is given
+    as the list of names of a strongly connected component of the reference
+    graph (Tarjan's algorithm, without recursion).
+    """
+    edges = {}
+    if node is None:
+        todo = list(definitions)
+    else:
+        todo = list(shape_references(node, skip))
+    while todo:
+        name = todo.pop()
+        if name in edges:
+            continue
+        edges[name] = []
+        if name in definitions:
+            edges[name] = list(shape_references(definitions[name], skip))
+            todo.extend(edges[name])
+
+    index = {}
+    lowlink = {}
+    on_stack = set()
+    component_stack = []
+    cycles = []
+    for root in edges:
+        if root in index:
+            continue
+        work = [(root, iter(edges[root]))]
+        index[root] = lowlink[root] = len(index)
+        component_stack.append(root)
+        on_stack.add(root)
+        while work:
+            name, successors = work[-1]
+            for succ in successors:
+                if succ not in index:
+                    index[succ] = lowlink[succ] = len(index)
+                    component_stack.append(succ)
+                    on_stack.add(succ)
+                    work.append((succ, iter(edges[succ])))
+                    break
+                if succ in on_stack:
+                    lowlink[name] = min(lowlink[name], index[succ])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[name])
+                if lowlink[name] == index[name]:
+                    component = []
+                    while True:
+                        member = component_stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == name:
+                            break
+                    if len(component) > 1 or name in edges[name]:
+                        cycles.append(component[::-1])
+    return cycles
+
+
+def negation_normal_form(node: SANode) -> SANode:
+    # The input should be a node without that has no HASSHAPE in its tree (it is expanded)
+    return Normalizer({}, rules=[], expand=False)(node)
 
 
 def clean_parsetree(sanode: SANode, full: bool = True) -> SANode:
@@ -94,17 +211,26 @@ def clean_parsetree(sanode: SANode, full: bool = True) -> SANode:
         - TOP else
     """
     
+    def dependencies(sanode: SANode) -> List[SANode]:
+        if full and sanode.constraintComponent is not None:
+            return []
+        return [child for child in sanode.children if type(child) == SANode]
+
+    return postorder(sanode, dependencies,
+                     lambda sanode, memo: _clean_node(sanode, memo, full))
+
+
+def _clean_node(sanode: SANode, memo: Dict, full: bool) -> SANode:
+    if full and sanode.constraintComponent is not None:
+        return sanode
+
     new_children = []
     for child in sanode.children:
         if type(child) == SANode:
-            new_child = clean_parsetree(child, full)
-            new_children.append(new_child)
+            new_children.append(memo[child])
         else:
             new_children.append(child)
 
-    if full and sanode.constraintComponent is not None:
-        return sanode
-
     new_node = SANode(sanode.op, new_children)
 
     if new_node.op == Op.NOT:
@@ -118,7 +244,7 @@ def clean_parsetree(sanode: SANode, full: bool = True) -> SANode:
             return SANode(Op.BOT, [])
 
         if any(map(lambda c: c.op == Op.TOP, new_node.children)):
-            new_node.children = list(filter(lambda c: c.op != Op.TOP, new_node.children))
+            new_node = SANode(Op.AND, list(filter(lambda c: c.op != Op.TOP, new_node.children)))
             if not new_node.children:
                 return SANode(Op.TOP, [])
             #return new_node
@@ -128,7 +254,7 @@ def clean_parsetree(sanode: SANode, full: bool = True) -> SANode:
             return SANode(Op.TOP, [])
 
         if any(map(lambda c: c.op == Op.BOT, new_node.children)):
-            new_node.children = list(filter(lambda c: c.op != Op.BOT, new_node.children))
+            new_node = SANode(Op.OR, list(filter(lambda c: c.op != Op.BOT, new_node.children)))
             if not new_node.children:
                 return SANode(Op.BOT, [])
             #return new_node
@@ -148,3 +274,240 @@ def clean_parsetree(sanode: SANode, full: bool = True) -> SANode:
         return SANode(Op.BOT, [])
     
     return new_node
+
+
+## NORMALIZATION
+# The normalization engine expands shape references, pushes negations down
+# to the atoms (negation normal form) and applies a list of rewrite rules,
+# all in a single bottom-up pass over the shape. A rule is a function that
+# takes a node, whose children are already normalized, and returns its
+# replacement or None if the rule does not apply.
+
+
+def _rule_empty(node: SANode) -> Optional[SANode]:
+    if node.op == Op.AND and not node.children:
+        return SANode(Op.TOP, [])
+    if node.op == Op.OR and not node.children:
+        return SANode(Op.BOT, [])
+
+
+def _rule_single(node: SANode) -> Optional[SANode]:
+    if node.op in [Op.AND, Op.OR] and len(node.children) == 1:
+        return node.children[0]
+
+
+def _rule_flatten(node: SANode) -> Optional[SANode]:
+    if node.op in [Op.AND, Op.OR] and \
+            any(map(lambda c: c.op == node.op, node.children)):
+        new_children = []
+        for child in node.children:
+            if child.op == node.op:
+                new_children += child.children
+            else:
+                new_children.append(child)
+        return SANode(node.op, new_children)
+
+
+def _rule_not_top(node: SANode) -> Optional[SANode]:
+    if node.op == Op.NOT and node.children[0].op == Op.TOP:
+        return SANode(Op.BOT, [])
+
+
+def _rule_not_bot(node: SANode) -> Optional[SANode]:
+    if node.op == Op.NOT and node.children[0].op == Op.BOT:
+        return SANode(Op.TOP, [])
+
+
+def _rule_and_bot(node: SANode) -> Optional[SANode]:
+    if node.op == Op.AND and any(map(lambda c: c.op == Op.BOT, node.children)):
+        return SANode(Op.BOT, [])
+
+
+def _rule_and_top(node: SANode) -> Optional[SANode]:
+    if node.op == Op.AND and any(map(lambda c: c.op == Op.TOP, node.children)):
+        return SANode(Op.AND, list(filter(lambda c: c.op != Op.TOP, node.children)))
+
+
+def _rule_or_top(node: SANode) -> Optional[SANode]:
+    if node.op == Op.OR and any(map(lambda c: c.op == Op.TOP, node.children)):
+        return SANode(Op.TOP, [])
+
+
+def _rule_or_bot(node: SANode) -> Optional[SANode]:
+    if node.op == Op.OR and any(map(lambda c: c.op == Op.BOT, node.children)):
+        return SANode(Op.OR, list(filter(lambda c: c.op != Op.BOT, node.children)))
+
+
+def _rule_or_tops(node: SANode) -> Optional[SANode]:
+    # keep a single TOP: the disjunction is still conformed to by every node,
+    # but the shape fragments of the other disjuncts are kept
+    if node.op == Op.OR and \
+            len(list(filter(lambda c: c.op == Op.TOP, node.children))) > 1:
+        new_children = list(filter(lambda c: c.op != Op.TOP, node.children))
+        return SANode(Op.OR, new_children + [SANode(Op.TOP, [])])
+
+
+def _rule_forall_top(node: SANode) -> Optional[SANode]:
+    if node.op == Op.FORALL and node.children[1].op == Op.TOP:
+        return SANode(Op.TOP, [])
+
+
+def _rule_forall_bot(node: SANode) -> Optional[SANode]:
+    if node.op == Op.FORALL and node.children[1].op == Op.BOT:
+        return SANode(Op.COUNTRANGE, [Literal(0), Literal(0), node.children[0], SANode(Op.TOP, [])])
+
+
+def _rule_countrange_bot(node: SANode) -> Optional[SANode]:
+    if node.op == Op.COUNTRANGE and node.children[3].op == Op.BOT:
+        if int(node.children[0]) == 0:
+            return SANode(Op.TOP, [])
+        return SANode(Op.BOT, [])
+
+
+def _rule_countrange_unbounded(node: SANode) -> Optional[SANode]:
+    if node.op == Op.COUNTRANGE and int(node.children[0]) == 0 and \
+            node.children[1] is None:
+        return SANode(Op.TOP, [])
+
+
+# Rules that preserve conformance (the rules of clean_parsetree)
+CLEAN_RULES = [
+    _rule_empty, _rule_single, _rule_flatten,
+    _rule_not_top, _rule_not_bot,
+    _rule_and_bot, _rule_and_top,
+    _rule_or_top, _rule_or_bot,
+    _rule_forall_top, _rule_forall_bot,
+    _rule_countrange_bot, _rule_countrange_unbounded
+]
+
+# Rules that preserve both conformance and shape fragments
+FRAGMENT_RULES = [
+    _rule_empty, _rule_single, _rule_flatten,
+    _rule_not_top, _rule_not_bot,
+    _rule_and_bot, _rule_and_top,
+    _rule_or_bot, _rule_or_tops
+]
+
+
+class Normalizer:
+    """Normalizes shapes in a single bottom-up pass
+
+    Depending on the options, the HASSHAPE references are expanded with the
+    given definitions and the shape is put in negation normal form. Every
+    node that is built is rewritten with the rules (see CLEAN_RULES and
+    FRAGMENT_RULES). Results are memoized per (sub)shape and polarity, so a
+    Normalizer should be reused for all shapes of a schema.
+
+    Shapes that reach a reference cycle raise a ShapeCycleError.
+    """
+
+    def __init__(self, definitions: Dict, rules: List[Callable] = CLEAN_RULES,
+                 expand: bool = True, nnf: bool = True):
+        self.definitions = definitions
+        self.rules = rules
+        self.expand = expand
+        self.nnf = nnf
+        self.memo = {}
+
+        # the reference cycles are found once, up front, for all definitions
+        self.cyclic = {}  # a mapping: shapename, the cycle it is part of
+        if expand:
+            for cycle in reference_cycles(definitions):
+                for name in cycle:
+                    self.cyclic[name] = cycle
+
+    def __call__(self, node: SANode) -> SANode:
+        # the tasks of the traversal are pairs (node, negated)
+        return postorder((node, False), self._dependencies, self._combine,
+                         self.memo)
+
+    def _build(self, op: Op, children: List) -> SANode:
+        node = SANode(op, children)
+        applied = True
+        while applied:
+            applied = False
+            for rule in self.rules:
+                new_node = rule(node)
+                if new_node is not None and new_node is not node:
+                    node = new_node
+                    applied = True
+                    break
+        return node
+
+    def _dependencies(self, task) -> List:
+        node, negated = task
+
+        if self.expand and node.op == Op.HASSHAPE:
+            name = node.children[0]
+            if name in self.cyclic:
+                raise ShapeCycleError(self.cyclic[name])
+            if name not in self.definitions:
+                # mimics real SHACL semantics
+                return [(SANode(Op.TOP, []), negated)]
+            return [(self.definitions[name], negated)]
+
+        if self.nnf and node.op == Op.NOT:
+            return [(node.children[0], not negated)]
+
+        if not negated:
+            return [(child, False) for child in node.children
+                    if type(child) == SANode]
+
+        if node.op in [Op.AND, Op.OR]:
+            return [(child, True) for child in node.children]
+        if node.op == Op.COUNTRANGE:
+            return [(node.children[3], False)]
+        if node.op == Op.FORALL:
+            return [(node.children[1], True)]
+        return [(node, False)]
+
+    def _combine(self, task, memo: Dict) -> SANode:
+        node, negated = task
+
+        if self.expand and node.op == Op.HASSHAPE:
+            name = node.children[0]
+            if name not in self.definitions:
+                return memo[(SANode(Op.TOP, []), negated)]
+            return memo[(self.definitions[name], negated)]
+
+        if self.nnf and node.op == Op.NOT:
+            return memo[(node.children[0], not negated)]
+
+        if not negated:
+            return self._build(node.op, [
+                memo[(child, False)] if type(child) == SANode else child
+                for child in node.children])
+
+        if node.op == Op.AND:
+            return self._build(Op.OR, [memo[(child, True)]
+                                       for child in node.children])
+
+        if node.op == Op.OR:
+            return self._build(Op.AND, [memo[(child, True)]
+                                        for child in node.children])
+
+        if node.op == Op.COUNTRANGE:
+            # not (n <= #E.psi <= m) is (#E.psi >= m+1) or (#E.psi <= n-1)
+            mincount, maxcount, path, shape = node.children
+            shape = memo[(shape, False)]
+            disj = []
+            if maxcount is not None:
+                disj.append(self._build(Op.COUNTRANGE, [
+                    Literal(int(maxcount) + 1), None, path, shape]))
+            if int(mincount) > 0:
+                disj.append(self._build(Op.COUNTRANGE, [
+                    Literal(0), Literal(int(mincount) - 1), path, shape]))
+            return self._build(Op.OR, disj)
+
+        if node.op == Op.FORALL:
+            return self._build(Op.COUNTRANGE, [
+                Literal(1), None, node.children[0],
+                memo[(node.children[1], True)]])
+
+        return self._build(Op.NOT, [memo[(node, False)]])
+
+
+def normalize(definitions: Dict, node: SANode,
+              rules: List[Callable] = CLEAN_RULES) -> SANode:
+    """Expands node, puts it in negation normal form and rewrites it with rules"""
+    return Normalizer(definitions, rules)(node)
@@ -0,0 +1,417 @@
+from typing import Dict, List, Optional, Sequence, Set
+
+from rdflib import Graph
+from rdflib.namespace import SH
+from rdflib.paths import (AlternativePath, InvPath, MulPath, Path,
+                          SequencePath, ZeroOrMore, ZeroOrOne)
+from rdflib.plugins.sparql import operators
+from rdflib.plugins.sparql.evaluate import evalQuery
+from rdflib.plugins.sparql.parserutils import CompValue, Expr
+from rdflib.plugins.sparql.sparql import Prologue, Query
+from rdflib.term import Literal, Variable
+
+from slsparser.shapels import SANode, Op
+from slsparser.pathls import PANode, POp
+from slsparser.utilities import postorder
+from ssf.unaryquery import uq_dependencies
+
+'''
+Translation of shapes to rdflib SPARQL algebra.
+
+This backend produces the same unary queries as ssf.unaryquery, but as
+rdflib algebra expressions (the result of rdflib's translateQuery) instead
+of query text. They are evaluated with rdflib's evalQuery, so the query
+text is never generated nor parsed.
+
+Every query is a Project on ?v; a query that is used as a subquery is
+wrapped in a ToMultiSet, like rdflib does for a subselect. The _vars
+annotations (which rdflib's evaluation uses to scope filters and binds)
+are computed as rdflib's algebra translation computes them.
+'''
+
+_V = Variable('v')
+_O = Variable('o')
+_COUNT = Variable('__agg_1__')
+_SAMPLE = Variable('__agg_2__')
+
+
+## ALGEBRA
+
+def _vars(value) -> Set[Variable]:
+    # like rdflib.plugins.sparql.algebra._addVars
+    if isinstance(value, Variable):
+        return {value}
+    if isinstance(value, CompValue):
+        return value['_vars']
+    if isinstance(value, (list, tuple)):
+        return set().union(*(_vars(v) for v in value))
+    return set()
+
+
+def _part(name: str, **values) -> CompValue:
+    part = CompValue(name, **values)
+    part['_vars'] = _part_vars(name, values)
+    return part
+
+
+def _expr(name: str, evalfn, **values) -> Expr:
+    expr = Expr(name, evalfn, **values)
+    expr['_vars'] = _part_vars(name, values)
+    return expr
+
+
+def _part_vars(name: str, values: Dict) -> Set[Variable]:
+    if name == 'RelationalExpression':
+        return set()
+    if name == 'Extend':
+        return set().union(*(_vars(v) for k, v in values.items() if k != 'expr'))
+    return _vars(list(values.values()))
+
+
+def _bgp(*triples) -> CompValue:
+    return _part('BGP', triples=list(triples))
+
+
+def _project(p: CompValue, var: Variable = _V) -> CompValue:
+    return _part('Project', p=p, PV=[var])
+
+
+def _sub(query: CompValue) -> CompValue:
+    return _part('ToMultiSet', p=query)
+
+
+def _join(parts: List[CompValue]) -> CompValue:
+    # a lazy join evaluates p2 with the bindings of p1; that is only
+    # correct for a pattern, a subquery has its own scope
+    out = parts[0]
+    for part in parts[1:]:
+        out = _part('Join', p1=out, p2=part, lazy=part.name == 'BGP')
+    return out
+
+
+def _union(parts: List[CompValue]) -> CompValue:
+    out = parts[0]
+    for part in parts[1:]:
+        out = _part('Union', p1=out, p2=part)
+    return out
+
+
+def _filter(expr: Expr, p: CompValue) -> CompValue:
+    return _part('Filter', expr=expr, p=p)
+
+
+def _as_o(query: CompValue) -> CompValue:
+    # { SELECT (?v AS ?o) WHERE { query } }
+    return _sub(_project(_part('Extend', p=_sub(query), expr=_V, var=_O), _O))
+
+
+def _grouped(body: CompValue, condition: Optional[Expr]) -> CompValue:
+    # SELECT ?v WHERE { body } GROUP BY ?v HAVING condition
+    if condition is None:
+        return _project(body)
+    aggregate = _part('AggregateJoin', p=_part('Group', p=body, expr=[_V]), A=[
+        _part('Aggregate_Count', distinct='DISTINCT', vars=_O, res=_COUNT),
+        _part('Aggregate_Sample', vars=_V, res=_SAMPLE)])
+    return _project(_filter(condition,
+                            _part('Extend', p=aggregate, expr=_SAMPLE, var=_V)))
+
+
+## EXPRESSIONS
+
+def _relation(expr, op: str, other) -> Expr:
+    return _expr('RelationalExpression', operators.RelationalExpression,
+                 expr=expr, op=op, other=other)
+
+
+def _and(exprs: List) -> Expr:
+    if len(exprs) == 1:
+        return exprs[0]
+    return _expr('ConditionalAndExpression', operators.ConditionalAndExpression,
+                 expr=exprs[0], other=exprs[1:])
+
+
+def _or(exprs: List) -> Expr:
+    return _expr('ConditionalOrExpression', operators.ConditionalOrExpression,
+                 expr=exprs[0], other=exprs[1:])
+
+
+def _builtin(name: str, arg) -> Expr:
+    return _expr(f'Builtin_{name}', getattr(operators, f'Builtin_{name}'), arg=arg)
+
+
+def _not_exists(graph: CompValue) -> Expr:
+    expr = _expr('Builtin_NOTEXISTS', operators.Builtin_EXISTS, graph=graph)
+    # like rdflib's translateExists: the pattern is an attribute (it is
+    # not evaluated as an expression), and its filters see the outer
+    # bindings
+    expr.graph = graph
+    if graph.name == 'Filter':
+        graph.no_isolated_scope = True
+    return expr
+
+
+def _count_condition(mincount: int, maxcount: Optional[int]) -> Optional[Expr]:
+    if mincount == 1 and maxcount is None:  # then it must only exist
+        return None
+    if mincount == maxcount:
+        return _relation(_COUNT, '=', Literal(mincount))
+    condition = [_relation(_COUNT, '>=', Literal(mincount))]
+    if maxcount is not None:
+        condition.append(_relation(_COUNT, '<=', Literal(maxcount)))
+    return _and(condition)
+
+
+def _test_condition(parameters: Sequence, var: Variable = _V) -> Expr:
+    # see ssf.sparql_conformance._build_filter_condition
+    test_type = parameters[0]
+
+    if test_type == SH['PatternConstraintComponent']:
+        # the parser escapes the backslashes of patterns for query text
+        pattern = str(parameters[1]).replace('\\\\', '\\')
+        flags = ''.join(str(flag) for flag in parameters[2])
+        return _expr('Builtin_REGEX', operators.Builtin_REGEX, text=var,
+                     pattern=Literal(pattern), flags=Literal(flags))
+
+    if test_type == SH['DatatypeConstraintComponent']:
+        return _relation(_builtin('DATATYPE', var), '=', parameters[1])
+
+    if test_type == SH['NodeKindConstraintComponent']:
+        kinds = {SH.IRI: ['isIRI'],
+                 SH.Literal: ['isLITERAL'],
+                 SH.BlankNode: ['isBLANK'],
+                 SH.BlankNodeOrIRI: ['isIRI', 'isBLANK'],
+                 SH.BlankNodeOrLiteral: ['isBLANK', 'isLITERAL'],
+                 SH.IRIOrLiteral: ['isIRI', 'isLITERAL']}[parameters[1]]
+        if len(kinds) == 1:
+            return _builtin(kinds[0], var)
+        return _or([_builtin(kind, var) for kind in kinds])
+
+    if test_type in ['numeric_range', 'length_range']:
+        value = var if test_type == 'numeric_range' else _builtin('STRLEN', var)
+        ops = {SH['MinExclusiveConstraintComponent']: '>',
+               SH['MaxExclusiveConstraintComponent']: '<',
+               SH['MinInclusiveConstraintComponent']: '>=',
+               SH['MaxInclusiveConstraintComponent']: '<=',
+               SH['MinLengthConstraintComponent']: '>=',
+               SH['MaxLengthConstraintComponent']: '<='}
+        return _and([_relation(value, ops[parameters[i]], parameters[i+1])
+                     for i in range(1, len(parameters)-1, 2)])
+
+    if test_type == SH['LanguageInConstraintComponent']:
+        return _relation(_builtin('LANG', var), 'IN',
+                         [Literal(str(lang)) for lang in parameters[1]])
+
+    raise ValueError(f'Unknown test: {test_type}')
+
+
+## QUERIES
+
+def _all_query() -> CompValue:
+    return _project(_union([_bgp((_V, Variable('_a'), Variable('_b'))),
+                            _bgp((Variable('_c'), Variable('_d'), _V))]))
+
+
+def _none_query() -> CompValue:
+    return _project(_filter(Literal(False), _bgp()))
+
+
+def _negate(query: CompValue) -> CompValue:
+    return _project(_part('Minus', p1=_sub(_all_query()), p2=_sub(query)))
+
+
+def _test_query(parameters: Sequence) -> CompValue:
+    return _project(_filter(_test_condition(parameters), _sub(_all_query())))
+
+
+def _equality_id_query(path: Path) -> CompValue:
+    # the only value of v for path is v itself
+    return _grouped(_bgp((_V, path, _V), (_V, path, _O)),
+                    _relation(_COUNT, '=', Literal(1)))
+
+
+def _not_equality_query(path1: Path, path2: Path) -> CompValue:
+    return _project(_union([
+        _filter(_not_exists(_bgp((_V, path2, _O))), _bgp((_V, path1, _O))),
+        _filter(_not_exists(_bgp((_V, path1, _O))), _bgp((_V, path2, _O)))]))
+
+
+def _comparison_query(path: Path, prop: Path, op: str) -> CompValue:
+    # the nodes minus those with a violating pair (a node without values
+    # for path conforms): N_G MINUS { ?v path ?e . ?v prop ?p FILTER ( ?e op ?p ) }
+    e, p = Variable('e'), Variable('p')
+    return _negate(_project(_filter(_relation(e, op, p),
+                                    _bgp((_V, path, e), (_V, prop, p)))))
+
+
+def _uniquelang_query(path: Path) -> CompValue:
+    o1, o2 = Variable('o1'), Variable('o2')
+    lang1, lang2 = _builtin('LANG', o1), _builtin('LANG', o2)
+    return _negate(_project(_filter(
+        _and([_relation(o1, '!=', o2), _relation(lang1, '=', lang2),
+              _relation(lang1, '!=', Literal(''))]),
+        _bgp((_V, path, o1), (_V, path, o2)))))
+
+
+def to_algebra_path(node: PANode) -> Path:
+    """to rdflib path"""
+    return postorder(node, lambda n: list(n.children) if n.pop != POp.PROP else [],
+                     _to_path_node)
+
+
+def _to_path_node(node: PANode, memo: Dict):
+    if node.pop == POp.PROP:
+        return node.children[0]
+
+    children = [memo[child] for child in node.children]
+
+    if node.pop == POp.INV:
+        return InvPath(children[0])
+
+    if node.pop == POp.ALT:
+        return AlternativePath(*children) if len(children) > 1 else children[0]
+
+    if node.pop == POp.COMP:
+        return SequencePath(*children) if len(children) > 1 else children[0]
+
+    if node.pop == POp.KLEENE:
+        return MulPath(children[0], ZeroOrMore)
+
+    if node.pop == POp.ZEROORONE:
+        return MulPath(children[0], ZeroOrOne)
+
+    raise ValueError(f'Cannot translate path: {node.pop}')
+
+
+def to_algebra(node: SANode, memo: Optional[Dict] = None) -> CompValue:
+    """to unary query algebra; assumes shape is expanded
+
+    Like ssf.unaryquery.to_uq, the translations of the subshapes are
+    stored in memo (if given).
+    """
+    return postorder(node, uq_dependencies, _to_algebra_node, memo)
+
+
+def _to_algebra_node(node: SANode, memo: Dict) -> CompValue:
+    if node.op == Op.HASSHAPE:
+        raise ValueError('node must be expanded')
+
+    if node.op == Op.TOP:
+        return _all_query()
+
+    if node.op == Op.BOT:
+        return _none_query()
+
+    if node.op == Op.AND:
+        return _project(_join([_sub(memo[child]) for child in node.children]))
+
+    if node.op == Op.OR:
+        return _project(_union([_sub(memo[child]) for child in node.children]))
+
+    if node.op == Op.NOT:
+        child = node.children[0]
+        if child.op == Op.TEST:
+            # the complement: a test that raises an error does not hold
+            return _negate(_test_query(child.children))
+        if child.op == Op.EQ:
+            if child.children[0].pop == POp.ID:
+                return _negate(_equality_id_query(to_algebra_path(child.children[1])))
+            return _not_equality_query(to_algebra_path(child.children[0]),
+                                       to_algebra_path(child.children[1]))
+        if child.op == Op.DISJ:
+            if child.children[0].pop == POp.ID:
+                path = to_algebra_path(child.children[1])
+                return _project(_bgp((_V, path, _V)))
+            return _project(_bgp((_V, to_algebra_path(child.children[0]), _O),
+                                 (_V, to_algebra_path(child.children[1]), _O)))
+
+        return _negate(memo[child])
+
+    if node.op == Op.CLOSED:
+        p = Variable('p')
+        properties = [to_algebra_path(child) for child in node.children]
+        return _negate(_project(_filter(_relation(p, 'NOT IN', properties),
+                                        _bgp((_V, p, _O)))))
+
+    if node.op == Op.DISJ:
+        if node.children[0].pop == POp.ID:
+            return _negate(_project(_bgp((_V, to_algebra_path(node.children[1]), _V))))
+        return _negate(_project(_bgp((_V, to_algebra_path(node.children[0]), _O),
+                                     (_V, to_algebra_path(node.children[1]), _O))))
+
+    if node.op == Op.EQ:
+        if node.children[0].pop == POp.ID:
+            return _equality_id_query(to_algebra_path(node.children[1]))
+        return _negate(_not_equality_query(to_algebra_path(node.children[0]),
+                                           to_algebra_path(node.children[1])))
+
+    if node.op == Op.FORALL:
+        path = to_algebra_path(node.children[0])
+        shape = node.children[1]
+        if shape.op == Op.TEST:
+            # the values that do not pass the test (also when it raises
+            # an error): { ?v path ?o } MINUS { ?v path ?o FILTER test }
+            values = _bgp((_V, path, _O))
+            passing = _filter(_test_condition(shape.children, _O), values)
+            return _negate(_project(_part('Minus', p1=values, p2=passing)))
+        return _negate(_project(_join([_bgp((_V, path, _O)),
+                                       _as_o(_negate(memo[shape]))])))
+
+    if node.op == Op.COUNTRANGE:
+        mincount = int(node.children[0])
+        maxcount = None if node.children[1] is None else int(node.children[1])
+        path = to_algebra_path(node.children[2])
+        shape = node.children[3]
+
+        if mincount == 0 and maxcount is None:
+            return _all_query()
+
+        # the values of v for path that conform to shape
+        if shape.op == Op.TEST:
+            body = _filter(_test_condition(shape.children, _O), _bgp((_V, path, _O)))
+        elif shape.op == Op.TOP:
+            body = _bgp((_V, path, _O))
+        elif mincount == 1 and shape.op == Op.HASVALUE:
+            return _project(_bgp((_V, path, shape.children[0])))
+        else:
+            body = _join([_bgp((_V, path, _O)), _as_o(memo[shape])])
+
+        # Optimization
+        if mincount == 0:
+            return _negate(_grouped(body, _relation(_COUNT, '>', Literal(maxcount))))
+        return _grouped(body, _count_condition(mincount, maxcount))
+
+    if node.op == Op.EXACTLY1:
+        return _grouped(_bgp((_V, to_algebra_path(node.children[0]), _O)),
+                        _count_condition(1, 1))
+
+    if node.op == Op.LESSTHAN:
+        return _comparison_query(to_algebra_path(node.children[0]),
+                                 to_algebra_path(node.children[1]), '>=')
+
+    if node.op == Op.LESSTHANEQ:
+        return _comparison_query(to_algebra_path(node.children[0]),
+                                 to_algebra_path(node.children[1]), '>')
+
+    if node.op == Op.HASVALUE:
+        return _project(_part('Extend', p=_bgp(), expr=node.children[0], var=_V))
+
+    if node.op == Op.UNIQUELANG:
+        return _uniquelang_query(to_algebra_path(node.children[0]))
+
+    if node.op == Op.TEST:
+        return _test_query(node.children)
+
+    raise ValueError(f'Unknown Op encountered: {node.op}')
+
+
+def to_algebra_query(node: SANode, memo: Optional[Dict] = None) -> Query:
+    """the unary query of node as an rdflib Query (SELECT ?v)"""
+    main = _part('SelectQuery', p=to_algebra(node, memo), PV=[_V],
+                 datasetClause=None)
+    return Query(Prologue(), main)
+
+
+def evaluate(graph: Graph, query: Query) -> Set:
+    """the values of ?v of the query on graph"""
+    return {row[_V] for row in evalQuery(graph, query, {})['bindings']
+            if _V in row}
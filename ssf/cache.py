@@ -0,0 +1,223 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+from slsparser.shapels import SANode
+from slsparser.pathls import PANode
+from slsparser.utilities import postorder
+
+'''
+Content-addressed cache of compiled shapes graphs.
+
+An entry is keyed by the contents of the shapes file, the command line
+options and the source code of the compiler, so it never has to be
+invalidated explicitly: a changed file, option or compiler gives a
+different key. An entry stores the prefixes, the parsed definitions and
+targets, and the generated output (e.g. the fragment query).
+
+Entries are written as a magic header followed by a zlib compressed
+pickle. The shape trees are stored as a flat node table (children refer
+to earlier rows), which keeps shared subtrees shared and does not recurse
+on deep trees. The cache is bounded in size: after a write, the least
+recently used entries are removed.
+'''
+
+MAGIC = b'SSFC1\n'
+MAX_CACHE_SIZE = 64 * 1024 * 1024  # bytes
+
+
+def cache_dir() -> str:
+    """$SSF_CACHE_DIR, or ~/.cache/ssf"""
+    return os.environ.get('SSF_CACHE_DIR') or \
+        os.path.join(os.path.expanduser('~'), '.cache', 'ssf')
+
+
+_code_fingerprint = None
+
+
+def code_fingerprint() -> str:
+    """a digest of the source code of the ssf and slsparser packages"""
+    global _code_fingerprint
+    if _code_fingerprint is None:
+        digest = hashlib.sha256()
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        for package in ['slsparser', 'ssf']:
+            directory = os.path.join(root, package)
+            for filename in sorted(os.listdir(directory)):
+                if filename.endswith('.py'):
+                    digest.update(filename.encode())
+                    with open(os.path.join(directory, filename), 'rb') as f:
+                        digest.update(f.read())
+        _code_fingerprint = digest.hexdigest()
+    return _code_fingerprint
+
+
+def cache_key(content: bytes, options: List[str]) -> str:
+    digest = hashlib.sha256()
+    digest.update(code_fingerprint().encode())
+    digest.update(repr(options).encode())
+    digest.update(content)
+    return digest.hexdigest()
+
+
+class CacheEntry:
+    """A compiled shapes graph as stored in the cache
+
+    The shape trees are only decoded when schema() is called, a cached
+    query can be printed without building them.
+    """
+
+    def __init__(self, namespaces: List[Tuple[str, str]], output: str,
+                 table: List, definitions: List, targets: List):
+        self.namespaces = namespaces
+        self.output = output
+        self._table = table
+        self._definitions = definitions
+        self._targets = targets
+
+    @classmethod
+    def from_schema(cls, namespaces: List[Tuple[str, str]], output: str,
+                    definitions: Dict, targets: Dict) -> 'CacheEntry':
+        table = []
+        memo = {}  # a mapping: node, row in table
+
+        def _encode(node, memo):
+            row = (type(node) == SANode,
+                   node.op.name if type(node) == SANode else node.pop.name,
+                   tuple((True, memo[c]) if _is_node(c) else (False, c)
+                         for c in node.children),
+                   getattr(node, 'constraintComponent', None))
+            table.append(row)
+            return len(table) - 1
+
+        def _index(mapping):
+            return [(name, postorder(node, _node_children, _encode, memo))
+                    for name, node in mapping.items()]
+
+        return cls(namespaces, output, table,
+                   _index(definitions), _index(targets))
+
+    def schema(self) -> Tuple[Dict, Dict]:
+        """the definitions and targets"""
+        from slsparser.shapels import Op
+        from slsparser.pathls import POp
+
+        nodes: List = []
+        for is_sanode, op, children, cc in self._table:
+            children = [nodes[c] if is_ref else c for is_ref, c in children]
+            if is_sanode:
+                nodes.append(SANode(Op[op], children, cc))
+            else:
+                nodes.append(PANode(POp[op], children))
+        return ({name: nodes[row] for name, row in self._definitions},
+                {name: nodes[row] for name, row in self._targets})
+
+    def dumps(self) -> bytes:
+        return dumps((self.namespaces, self.output, self._table,
+                      self._definitions, self._targets))
+
+    @classmethod
+    def loads(cls, data: bytes) -> 'CacheEntry':
+        return cls(*loads(data))
+
+
+def dumps(value) -> bytes:
+    return MAGIC + zlib.compress(pickle.dumps(value,
+                                              protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def loads(data: bytes):
+    if not data.startswith(MAGIC):
+        raise ValueError('Not a cache entry')
+    return pickle.loads(zlib.decompress(data[len(MAGIC):]))
+
+
+def _is_node(value) -> bool:
+    return type(value) in (SANode, PANode)
+
+
+def _node_children(node) -> List:
+    return [c for c in node.children if _is_node(c)]
+
+
+def load(key: str, directory: Optional[str] = None) -> Optional[CacheEntry]:
+    """the cached entry, or None if there is none (or it is unreadable)"""
+    return _read(key, directory, CacheEntry.loads)
+
+
+def store(key: str, entry: CacheEntry, directory: Optional[str] = None,
+          max_size: int = MAX_CACHE_SIZE):
+    """write the entry and evict the least recently used entries
+
+    Failing to write the cache is not an error, the entry is just not
+    cached.
+    """
+    _write(key, entry.dumps(), directory, max_size)
+
+
+def load_value(key: str, directory: Optional[str] = None):
+    """a value stored with store_value, or None"""
+    return _read(key, directory, loads)
+
+
+def store_value(key: str, value, directory: Optional[str] = None,
+                max_size: int = MAX_CACHE_SIZE):
+    """like store, for any picklable value"""
+    _write(key, dumps(value), directory, max_size)
+
+
+def _read(key: str, directory: Optional[str], decode):
+    path = os.path.join(directory or cache_dir(), key)
+    try:
+        with open(path, 'rb') as f:
+            value = decode(f.read())
+        os.utime(path)  # mark as recently used
+    except (OSError, ValueError, EOFError, pickle.UnpicklingError, zlib.error):
+        return None
+    return value
+
+
+def _write(key: str, data: bytes, directory: Optional[str], max_size: int):
+    directory = directory or cache_dir()
+    try:
+        os.makedirs(directory, exist_ok=True)
+        # write to a temporary file first: concurrent runs never read a
+        # partially written entry
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, os.path.join(directory, key))
+        evict(directory, max_size)
+    except OSError:
+        pass
+
+
+def evict(directory: Optional[str] = None, max_size: int = MAX_CACHE_SIZE):
+    """remove the least recently used entries until the size is at most max_size"""
+    directory = directory or cache_dir()
+    entries = []
+    for filename in os.listdir(directory):
+        if filename.startswith('.'):
+            continue
+        try:
+            stat = os.stat(os.path.join(directory, filename))
+        except OSError:
+            continue  # removed by a concurrent run
+        entries.append((stat.st_mtime, stat.st_size, filename))
+
+    size = sum(entry[1] for entry in entries)
+    for _, entry_size, filename in sorted(entries):
+        if size <= max_size:
+            break
+        try:
+            os.remove(os.path.join(directory, filename))
+        except OSError:
+            pass
+        size -= entry_size
+
+
+def clear(directory: Optional[str] = None):
+    evict(directory, 0)
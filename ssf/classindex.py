@@ -0,0 +1,129 @@
+import weakref
+from typing import Callable, Dict, FrozenSet, Optional, Set, Tuple
+
+from rdflib import Graph
+from rdflib.namespace import RDF, RDFS
+from rdflib.term import BNode, Node
+
+from slsparser.shapels import SANode, Op
+from slsparser.pathls import PANode, POp
+
+'''
+A cached index of the class hierarchy of a data graph.
+
+Every class target and every sh:class constraint is the path
+rdf:type/rdfs:subClassOf* (CLASS_PATH). Instead of evaluating the Kleene
+star for every shape, the evaluators look the classes of a node up in a
+ClassIndex: the reflexive and transitive closure of rdfs:subClassOf,
+computed once per graph. class_index keeps the index of a graph for as
+long as the graph exists, and builds it again when the rdfs:subClassOf
+triples of the graph have changed. The rdf:type triples are read when
+the classes are looked up, they can change without invalidating the
+index.
+
+When the class hierarchy is known when the shapes are translated (e.g.
+from an ontology), class_values_rule rewrites the class path away: a
+node has a class C if it has a type among the subclasses of C, which the
+queries list in a VALUES block instead of evaluating the property path.
+'''
+
+CLASS_PATH = PANode(POp.COMP, [
+    PANode(POp.PROP, [RDF.type]),
+    PANode(POp.KLEENE, [PANode(POp.PROP, [RDFS.subClassOf])])
+])
+
+
+class ClassIndex:
+    """The closure of rdfs:subClassOf in a graph"""
+
+    def __init__(self, graph: Graph):
+        self.graph = graph
+        self.edges = _subclass_edges(graph)
+        self._parents: Dict[Node, Set[Node]] = {}
+        self._children: Dict[Node, Set[Node]] = {}
+        for subclass, superclass in self.edges:
+            self._parents.setdefault(subclass, set()).add(superclass)
+            self._children.setdefault(superclass, set()).add(subclass)
+        self._superclasses: Dict[Node, FrozenSet[Node]] = {}
+        self._subclasses: Dict[Node, FrozenSet[Node]] = {}
+
+    def superclasses(self, cls: Node) -> FrozenSet[Node]:
+        """cls and all its (direct and indirect) superclasses"""
+        if cls not in self._superclasses:
+            self._superclasses[cls] = _reachable(cls, self._parents)
+        return self._superclasses[cls]
+
+    def subclasses(self, cls: Node) -> FrozenSet[Node]:
+        """cls and all its (direct and indirect) subclasses"""
+        if cls not in self._subclasses:
+            self._subclasses[cls] = _reachable(cls, self._children)
+        return self._subclasses[cls]
+
+    def classes(self) -> Dict[Node, Set[Node]]:
+        """a mapping: node, its classes (the values of CLASS_PATH)"""
+        classes: Dict[Node, Set[Node]] = {}
+        for node, cls in self.graph.subject_objects(RDF.type):
+            classes.setdefault(node, set()).update(self.superclasses(cls))
+        return classes
+
+    def is_current(self) -> bool:
+        """whether the rdfs:subClassOf triples are those of the index"""
+        return _subclass_edges(self.graph) == self.edges
+
+
+_indexes = weakref.WeakKeyDictionary()
+
+
+def class_index(graph: Graph) -> ClassIndex:
+    """the (cached) ClassIndex of graph"""
+    index = _indexes.get(graph)
+    if index is None or not index.is_current():
+        index = _indexes[graph] = ClassIndex(graph)
+    return index
+
+
+def class_values_rule(ontology: Graph) -> Callable[[SANode], Optional[SANode]]:
+    """a Normalizer rule that replaces CLASS_PATH with rdf:type and the
+    subclasses of the class in ontology
+
+    >= 1 CLASS_PATH.hasValue(C) (and <= 0 CLASS_PATH.hasValue(C)) becomes
+    >= 1 rdf:type.(hasValue(C) OR hasValue(C1) OR ...), with C1, ... the
+    subclasses of C. The rdfs:subClassOf triples of the data graph are
+    not used, nor are they part of the shape fragments.
+    """
+    index = ClassIndex(ontology)
+    rdf_type = PANode(POp.PROP, [RDF.type])
+
+    def rule(tree: SANode) -> Optional[SANode]:
+        if tree.op != Op.COUNTRANGE or tree.children[2] != CLASS_PATH \
+                or tree.children[3].op != Op.HASVALUE:
+            return None
+        bounds = (int(tree.children[0]),
+                  None if tree.children[1] is None else int(tree.children[1]))
+        if bounds not in [(1, None), (0, 0)]:
+            return None  # the number of types is not the number of classes
+
+        classes = sorted(index.subclasses(tree.children[3].children[0]))
+        if any(isinstance(cls, BNode) for cls in classes):
+            return None  # blank nodes cannot be listed in a query
+        values = [SANode(Op.HASVALUE, [cls]) for cls in classes]
+        shape = values[0] if len(values) == 1 else SANode(Op.OR, values)
+        return SANode(Op.COUNTRANGE, [tree.children[0], tree.children[1],
+                                      rdf_type, shape])
+
+    return rule
+
+
+def _reachable(start: Node, edges: Dict[Node, Set[Node]]) -> FrozenSet[Node]:
+    seen = {start}
+    todo = [start]
+    while todo:
+        for node in edges.get(todo.pop(), ()):
+            if node not in seen:
+                seen.add(node)
+                todo.append(node)
+    return frozenset(seen)
+
+
+def _subclass_edges(graph: Graph) -> FrozenSet[Tuple[Node, Node]]:
+    return frozenset(graph.subject_objects(RDFS.subClassOf))
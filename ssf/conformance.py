@@ -1,38 +1,123 @@
 import rdflib
-from typing import Optional
+from rdflib.plugins.sparql import prepareQuery
+from typing import Callable, Dict, List, Optional, Tuple
 
-from slsparser.shapels import parse
-from slsparser.utilities import expand_shape
+from slsparser.shapels import parse, Op
+from slsparser.utilities import Normalizer, CLEAN_RULES
 from ssf.unaryquery import to_uq
-
-def conforms(data_graph: rdflib.Graph, shapes_graph: rdflib.Graph):
-    not_conforms = []
-    conforms = []
-
-    schema = parse(shapes_graph)
-    shape_defs = schema[0]
-    target_defs = schema[1]
-    # Reminder: a schema consists out of two dicts
-    # Both dicts: IRI (shape name) -> SANode
-    # In the first dict, the range is the shape definitions
-    # In the second dict, the range is the target definitions if present
-
-    for shape_name in list(shape_defs):
-        if shape_name not in list(target_defs):
-            continue  # if there is no target definition, skip
-        expanded = expand_shape(shape_defs, shape_defs[shape_name])
-        shapedef_uq = to_uq(expanded)
-        targetdef_uq = to_uq(target_defs[shape_name])
-
-        rhs = _result_to_set(data_graph.query(shapedef_uq))
-        lhs = _result_to_set(data_graph.query(targetdef_uq))
-
-        if not lhs.issubset(rhs):
-            not_conforms.append(lhs.difference(rhs))
+from ssf import algebra, native
+
+BACKENDS = ['algebra', 'encoded', 'native', 'sparql']
+
+
+def conforms(data_graph: rdflib.Graph, shapes_graph: rdflib.Graph,
+             backend: str = 'algebra'):
+    """the targeted nodes that conform and those that do not, per shape
+
+    See CompiledSchema for the backends. To validate several data graphs
+    against the same shapes graph, compile it once with CompiledSchema.
+    """
+    return CompiledSchema(shapes_graph, backend).validate(data_graph)
+
+
+class CompiledSchema:
+    """A shapes graph translated to prepared queries
+
+    The shapes graph is parsed, and every shape and target is normalized
+    and translated, once; validate only evaluates the prepared queries.
+    With the algebra backend the queries are built as rdflib algebra
+    directly; with the sparql backend they are generated as query text
+    and prepared with rdflib's prepareQuery. The native backend does not
+    use queries: it evaluates the normalized shapes with ssf.native. The
+    encoded backend (which needs numpy) evaluates them with ssf.encoded,
+    on an EncodedGraph: validate accepts one instead of an rdflib graph.
+    """
+
+    def __init__(self, shapes_graph: rdflib.Graph, backend: str = 'algebra'):
+        if backend not in BACKENDS:
+            raise ValueError(f'Unknown backend: {backend}')
+        self.backend = backend
+
+        schema = parse(shapes_graph, indexed=True)
+        shape_defs = schema[0]
+        target_defs = schema[1]
+        # Reminder: a schema consists out of two dicts
+        # Both dicts: IRI (shape name) -> SANode
+        # In the first dict, the range is the shape definitions
+        # In the second dict, the range is the target definitions if present
+
+        # shared by all shapes, every (sub)shape is normalized once
+        normalizer = Normalizer(shape_defs, CLEAN_RULES)
+        memo = {}  # the algebra of the (sub)shapes, shared by all shapes
+
+        self.queries: List = []  # the distinct prepared queries
+        self.shapes: List[Tuple] = []  # shape name, shape query, target query
+        indices: Dict = {}  # a mapping: normalized shape, index in queries
+        for shape_name in list(shape_defs):
+            if shape_name not in target_defs or target_defs[shape_name].op == Op.BOT:
+                continue  # if there is no target definition, skip
+
+            prepared = []
+            for node in [normalizer(shape_defs[shape_name]),
+                         normalizer(target_defs[shape_name])]:
+                if node not in indices:
+                    indices[node] = len(self.queries)
+                    self.queries.append(self._prepare(node, memo))
+                prepared.append(indices[node])
+            self.shapes.append((shape_name, *prepared))
+
+    def _prepare(self, node, memo: Dict):
+        if self.backend == 'algebra':
+            return algebra.to_algebra_query(node, memo)
+        if self.backend in ['encoded', 'native']:
+            return node
+        return prepareQuery(to_uq(node))
+
+    def _selector(self, data_graph: rdflib.Graph) -> Callable:
+        # select(query, nodes): the nodes that conform to the query,
+        # among nodes if it is not None
+        if self.backend in ['encoded', 'native']:
+            # one evaluator: the shapes share their subshapes and paths
+            if self.backend == 'encoded':
+                from ssf import encoded
+                if not isinstance(data_graph, encoded.EncodedGraph):
+                    data_graph = encoded.EncodedGraph.from_graph(data_graph)
+                evaluator = encoded.Evaluator(data_graph)
+            else:
+                evaluator = native.Evaluator(data_graph)
+            return lambda node, nodes: evaluator(node) if nodes is None \
+                else evaluator.select(node, nodes)
+
+        if self.backend == 'algebra':
+            evaluate = lambda query: algebra.evaluate(data_graph, query)
         else:
-            conforms.append(lhs)
+            evaluate = lambda query: _result_to_set(data_graph.query(query))
+        results = {}  # every query is evaluated once
+
+        def select(query, nodes):
+            if id(query) not in results:
+                results[id(query)] = evaluate(query)
+            if nodes is None:
+                return results[id(query)]
+            return results[id(query)].intersection(nodes)
+        return select
+
+    def validate(self, data_graph: rdflib.Graph):
+        """the targeted nodes that conform and those that do not, per shape"""
+        not_conforms = []
+        conforms = []
+
+        select = self._selector(data_graph)
+        for _, shape_query, target_query in self.shapes:
+            lhs = select(self.queries[target_query], None)
+            rhs = select(self.queries[shape_query], lhs)
+
+            if len(rhs) != len(lhs):
+                not_conforms.append(lhs.difference(rhs))
+            else:
+                conforms.append(set(lhs))
 
-    return conforms, not_conforms
+        return conforms, not_conforms
 
 
 def _result_to_set(result: rdflib.query.Result) -> set:
@@ -55,7 +140,6 @@ def _result_to_set(result: rdflib.query.Result) -> set:
 # and for the shape fragment queries.
 
 from slsparser.shapels import SANode
-from slsparser.shapels import Op
 
 def optimize_conformance(node: SANode) -> Optional[SANode]:
     '''
@@ -87,7 +171,7 @@ def optimize_conformance(node: SANode) -> Optional[SANode]:
         else:
             new_children.append(child)
 
-    node.children = new_children
+    node = SANode(node.op, new_children)
 
     if node.op == Op.NOT and node.children[0] == Op.TOP:
         return SANode(Op.BOT, [])
@@ -102,7 +186,7 @@ def optimize_conformance(node: SANode) -> Optional[SANode]:
         return SANode(Op.TOP, [])
     
     if node.op == Op.AND and any(map(lambda c: c.op == Op.TOP, node.children)):
-        node.children = list(filter(lambda c: c.op != Op.TOP, node.children))
+        node = SANode(Op.AND, list(filter(lambda c: c.op != Op.TOP, node.children)))
         if len(node.children) == 1:
             return node.children[1]
         elif len(node.children) == 0:
@@ -110,7 +194,7 @@ def optimize_conformance(node: SANode) -> Optional[SANode]:
         return node
         
     if node.op == Op.OR and any(map(lambda c: c.op == Op.BOT, node.children)):
-        node.children = list(filter(lambda c: c.op != Op.BOT, node.children))
+        node = SANode(Op.OR, list(filter(lambda c: c.op != Op.BOT, node.children)))
         if len(node.children) == 1:
             return node.children[1]
         elif len(node.children) == 0:
@@ -0,0 +1,721 @@
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple, Union
+
+import numpy as np
+from rdflib import Graph
+from rdflib.namespace import RDF, RDFS
+from rdflib.plugins.sparql.evalutils import _ebv
+from rdflib.term import Literal, Node
+from rdflib.util import from_n3
+
+from slsparser.shapels import SANode, Op
+from slsparser.pathls import PANode, POp
+from slsparser.utilities import postorder
+from ssf.algebra import _relation
+from ssf.classindex import CLASS_PATH
+from ssf.native import _E, _P, _dependencies
+from ssf.nodeset import NodeSet, from_ids
+from ssf.predicates import OPERATORS, CompiledTest, compile_test, _number
+
+try:
+    from ssf.sparsepath import PathEngine
+except ImportError:  # scipy is optional
+    PathEngine = None
+
+'''
+A dictionary-encoded triple store on NumPy arrays, and an evaluator of
+shapes on it.
+
+Every term gets an integer id (int32); the terms are kept in a list and
+the triples as three sorted arrays of ids, one per permutation: SPO (rows
+s, p, o), POS (rows p, o, s) and OSP (rows o, s, p). Every permutation
+has CSR offsets on its first column: the triples with subject (predicate,
+object) i are the rows offsets[i]:offsets[i+1]. numpy is only needed for
+this module.
+
+A graph can be saved to a file and opened again as memory-mapped arrays
+(see STORAGE): opening takes no time, only the pages that are used are
+read, and the graph need not fit in memory.
+
+The evaluator works like ssf.native.Evaluator, on ids: a node set is a
+NodeSet of ssf.nodeset (with a complement flag), of which the backend is
+chosen by cardinality, and a path is a relation: a sorted array of
+(node, value) pairs, encoded as int64 keys node << 32 | value. Joins of relations are vectorized (searchsorted on
+the sorted keys); only the tests and comparisons call rdflib, once per
+distinct term. If scipy is installed, the paths other than properties
+are evaluated with the sparse matrices of ssf.sparsepath and turned into
+keys for the constraints. The values of a path per node (cardinality
+constraints) are counted with a bincount over the ids of the nodes.
+
+PATHS are the ways to evaluate paths: 'keys' (joins of sorted keys) and
+'sparse' (ssf.sparsepath).
+'''
+
+_EMPTY = np.empty(0, dtype=np.int32)
+_EMPTY_KEYS = np.empty(0, dtype=np.int64)
+# counts are sorted instead of bincounted for fewer than 1/_BINCOUNT_RATIO
+# nodes per term of the graph
+_BINCOUNT_RATIO = 16
+PATHS = ['keys', 'sparse']
+
+
+class EncodedGraph:
+    """An immutable graph of dictionary-encoded triples"""
+
+    def __init__(self, terms: Sequence[Node], spo: np.ndarray, pos: np.ndarray,
+                 osp: np.ndarray, offsets: Tuple[np.ndarray, np.ndarray, np.ndarray],
+                 ids: Optional[Dict[Node, int]] = None):
+        self.terms = terms  # id -> term
+        self.spo = spo
+        self.pos = pos
+        self.osp = osp
+        self.s_offsets, self.p_offsets, self.o_offsets = offsets
+        self._ids = ids  # term -> id, built when first needed
+        self._classes = None
+        self._numbers = None  # the values of the numeric literals
+        self._numeric = None  # per id: unknown (-1), not numeric (0), numeric (1)
+
+    @classmethod
+    def from_graph(cls, graph: Graph) -> 'EncodedGraph':
+        return cls.from_triples(graph)
+
+    @classmethod
+    def from_triples(cls, triples: Iterable[Tuple[Node, Node, Node]]) -> 'EncodedGraph':
+        ids: Dict[Node, int] = {}
+        encoded = []
+        for s, p, o in triples:
+            encoded.append(ids.setdefault(s, len(ids)))
+            encoded.append(ids.setdefault(p, len(ids)))
+            encoded.append(ids.setdefault(o, len(ids)))
+        if len(ids) >= 2**31:
+            raise ValueError('Too many terms for int32 ids')
+        spo = np.array(encoded, dtype=np.int32).reshape(-1, 3)
+        return cls.from_arrays(list(ids), spo, ids)
+
+    @classmethod
+    def from_arrays(cls, terms: Sequence[Node], spo: np.ndarray,
+                    ids: Optional[Dict[Node, int]] = None) -> 'EncodedGraph':
+        """the graph of the (s, p, o) rows of spo (in any order)"""
+        spo = _sorted_rows(spo)
+        pos = _sorted_rows(spo[:, [1, 2, 0]])
+        osp = _sorted_rows(spo[:, [2, 0, 1]])
+        offsets = tuple(_offsets(rows[:, 0], len(terms)) for rows in (spo, pos, osp))
+        return cls(terms, spo, pos, osp, offsets, ids)
+
+    def __len__(self) -> int:
+        return len(self.spo)
+
+    @property
+    def ids(self) -> Dict[Node, int]:
+        if self._ids is None:
+            self._ids = {term: i for i, term in enumerate(self.terms)}
+        return self._ids
+
+    def id(self, term: Node) -> Optional[int]:
+        """the id of term, or None if it does not occur in the graph"""
+        return self.ids.get(term)
+
+    def node_ids(self) -> np.ndarray:
+        """the ids of all subjects and objects (sorted)"""
+        return np.flatnonzero((np.diff(self.s_offsets) > 0) |
+                              (np.diff(self.o_offsets) > 0)).astype(np.int32)
+
+    def predicate(self, p: int) -> Tuple[np.ndarray, np.ndarray]:
+        """the subjects and objects of the triples with predicate p"""
+        rows = self.pos[self.p_offsets[p]:self.p_offsets[p + 1]]
+        return rows[:, 2], rows[:, 1]
+
+    def classes(self) -> np.ndarray:
+        """the sorted (node, class) keys of rdf:type/rdfs:subClassOf*
+
+        The closure of rdfs:subClassOf is computed once per graph.
+        """
+        if self._classes is None:
+            types = _EMPTY_KEYS if self.id(RDF.type) is None \
+                else _keys(*self.predicate(self.id(RDF.type)))
+            subclass = _EMPTY_KEYS if self.id(RDFS.subClassOf) is None \
+                else _keys(*self.predicate(self.id(RDFS.subClassOf)))
+            classes = np.unique(np.concatenate(_pairs(subclass) + _pairs(types)[1:]))
+            closure = np.union1d(_keys(classes, classes), _closure(subclass))
+            self._classes = _compose(types, closure)
+        return self._classes
+
+    def numbers(self, ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """the values of the terms as numbers (float64) and whether they are
+        numeric literals, per id
+
+        A term is read once, the numbers are kept as a column of the graph.
+        """
+        if self._numbers is None:
+            self._numbers = np.full(len(self.terms), np.nan)
+            self._numeric = np.full(len(self.terms), -1, dtype=np.int8)
+        for i in np.unique(ids[self._numeric[ids] < 0]):
+            value = _number(self.terms[i])
+            self._numeric[i] = value is not None
+            if value is not None:
+                self._numbers[i] = _float(value)
+        return self._numbers[ids], self._numeric[ids] == 1
+
+    def triples(self) -> Iterable[Tuple[Node, Node, Node]]:
+        for s, p, o in self.spo:
+            yield self.terms[s], self.terms[p], self.terms[o]
+
+    @classmethod
+    def from_keys(cls, keys: List[bytes], spo: np.ndarray) -> 'EncodedGraph':
+        """the graph of the (s, p, o) rows of spo, with term i given by its
+        N-Triples form keys[i] (as produced by Node.n3)
+
+        The terms are kept encoded in a TermDictionary and renumbered in
+        the bytewise order of their keys.
+        """
+        if len(keys) >= 2**31:
+            raise ValueError('Too many terms for int32 ids')
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        rank = np.empty(len(keys), dtype=np.int32)
+        rank[order] = np.arange(len(keys), dtype=np.int32)
+
+        offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum([len(keys[i]) for i in order], out=offsets[1:])
+        data = np.frombuffer(b''.join(keys[i] for i in order), dtype=np.uint8)
+        dictionary = TermDictionary(data, offsets)
+        return cls.from_arrays(dictionary, rank[spo], dictionary)
+
+    def save(self, path: str):
+        """write the graph to path, in the layout described below
+
+        The terms are renumbered in the order of their N-Triples form,
+        so that a term can be looked up in the file by binary search.
+        """
+        graph = self
+        if not isinstance(self.terms, TermDictionary):
+            graph = EncodedGraph.from_keys([t.n3().encode() for t in self.terms],
+                                           self.spo)
+        dictionary = graph.terms
+        sections = [graph.spo, graph.pos, graph.osp, graph.s_offsets,
+                    graph.p_offsets, graph.o_offsets, dictionary.offsets,
+                    dictionary.data]
+
+        with open(path, 'wb') as f:
+            f.write(_MAGIC)
+            f.write(np.array([len(graph), len(dictionary), len(dictionary.data)],
+                             dtype='<u8').tobytes())
+            for section, dtype in zip(sections, _SECTION_TYPES):
+                f.write(np.ascontiguousarray(section, dtype=dtype).tobytes())
+                f.write(bytes(-f.tell() % 8))
+
+    @classmethod
+    def open(cls, path: str) -> 'EncodedGraph':
+        """the graph saved at path, memory-mapped (nothing is read yet)"""
+        with open(path, 'rb') as f:
+            header = f.read(len(_MAGIC) + 24)
+        if len(header) < len(_MAGIC) + 24 or not header.startswith(_MAGIC):
+            raise ValueError(f'Not an encoded graph: {path}')
+        triples, terms, term_bytes = (int(n) for n in
+                                      np.frombuffer(header[len(_MAGIC):], dtype='<u8'))
+
+        shapes = [(triples, 3)] * 3 + [(terms + 1,)] * 4 + [(term_bytes,)]
+        sections = []
+        offset = len(header)
+        for shape, dtype in zip(shapes, _SECTION_TYPES):
+            size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+            if size:
+                sections.append(np.memmap(path, dtype=dtype, mode='r',
+                                          offset=offset, shape=shape))
+            else:  # an empty file region cannot be mapped
+                sections.append(np.empty(shape, dtype=dtype))
+            offset += size + (-size % 8)
+
+        dictionary = TermDictionary(sections[7], sections[6])
+        return cls(dictionary, *sections[:3], tuple(sections[3:6]), dictionary)
+
+
+def _float(value) -> float:
+    try:
+        return float(value)
+    except OverflowError:  # (a huge integer)
+        return float('inf') if value > 0 else float('-inf')
+
+
+def _sorted_rows(rows: np.ndarray) -> np.ndarray:
+    # the distinct rows, sorted on the first, second and third column
+    rows = rows[np.lexsort((rows[:, 2], rows[:, 1], rows[:, 0]))]
+    if len(rows) > 1:
+        distinct = np.any(rows[1:] != rows[:-1], axis=1)
+        rows = rows[np.concatenate(([True], distinct))]
+    return np.ascontiguousarray(rows)
+
+
+def _offsets(column: np.ndarray, size: int) -> np.ndarray:
+    return np.searchsorted(column, np.arange(size + 1)).astype(np.int64)
+
+
+## STORAGE
+
+# An encoded graph is saved as a single file: a header followed by eight
+# sections. Every section starts at a multiple of 8 bytes (the previous
+# section is padded with zero bytes); all numbers are little-endian.
+#
+# header          magic b'SSFENC1\n', then three uint64: the number of
+#                 triples T, the number of terms N, the size B of the
+#                 term data in bytes
+# spo, pos, osp   int32[T, 3], the sorted triples (as in EncodedGraph)
+# s_offsets, p_offsets, o_offsets
+#                 int64[N + 1], the CSR offsets of spo, pos and osp
+# term_offsets    int64[N + 1], term i is term_data[term_offsets[i]:
+#                 term_offsets[i + 1]]
+# term_data       uint8[B], the terms in N-Triples syntax (UTF-8), sorted
+#                 bytewise: the id of a term is its rank in this order
+
+_MAGIC = b'SSFENC1\n'
+_SECTION_TYPES = ['<i4'] * 3 + ['<i8'] * 4 + ['u1']
+
+
+class TermDictionary:
+    """The terms of a saved graph, decoded when they are used
+
+    It is both the sequence of terms (by id) and the mapping from terms
+    to ids (get, by binary search in the file).
+    """
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray):
+        self.data = data
+        self.offsets = offsets
+        # a memoryview slices faster than a memmap
+        self._data = memoryview(np.asarray(data).view(np.ndarray))
+        self._offsets = offsets
+        self._terms: Dict[int, Node] = {}
+        self._ids: Dict[Node, Optional[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def _key(self, i: int) -> bytes:
+        return bytes(self._data[self._offsets[i]:self._offsets[i + 1]])
+
+    def __getitem__(self, i: int) -> Node:
+        i = int(i)
+        if i not in self._terms:
+            term = self._terms[i] = from_n3(self._key(i).decode())
+            self._ids[term] = i
+        return self._terms[i]
+
+    def get(self, term: Node, default=None) -> Optional[int]:
+        if term not in self._ids:
+            key = term.n3().encode()
+            low, high = 0, len(self)
+            while low < high:
+                middle = (low + high) // 2
+                if self._key(middle) < key:
+                    low = middle + 1
+                else:
+                    high = middle
+            found = low < len(self) and self._key(low) == key
+            self._ids[term] = low if found else None
+        found = self._ids[term]
+        return default if found is None else found
+
+
+## RELATIONS
+
+def _keys(nodes: np.ndarray, values: np.ndarray) -> np.ndarray:
+    return np.unique((nodes.astype(np.int64) << 32) | values.astype(np.int64))
+
+
+def _pairs(keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    return (keys >> 32).astype(np.int32), (keys & 0xFFFFFFFF).astype(np.int32)
+
+
+def _lookup(column: np.ndarray, ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # the rows of the sorted column that equal one of ids: (the number of
+    # rows per id, the indices of the rows)
+    starts = np.searchsorted(column, ids, 'left')
+    lengths = np.searchsorted(column, ids, 'right') - starts
+    total = int(lengths.sum())
+    group_starts = np.cumsum(lengths) - lengths
+    return lengths, np.repeat(starts - group_starts, lengths) + np.arange(total)
+
+
+def _compose(first: np.ndarray, second: np.ndarray) -> np.ndarray:
+    # the pairs (a, c) with (a, b) in first and (b, c) in second
+    a, b = _pairs(first)
+    second_nodes, second_values = _pairs(second)
+    lengths, index = _lookup(second_nodes, b)
+    return _keys(np.repeat(a, lengths), second_values[index])
+
+
+def _closure(relation: np.ndarray) -> np.ndarray:
+    # the transitive closure (semi-naive)
+    closure = relation
+    delta = relation
+    while len(delta):
+        delta = np.setdiff1d(_compose(delta, relation), closure, assume_unique=True)
+        closure = np.union1d(closure, delta)
+    return closure
+
+
+class Evaluator:
+    """Evaluates (expanded) shapes on an EncodedGraph
+
+    Like ssf.native.Evaluator, with the same results. The node sets of
+    the subshapes, the relations of the paths and the results of the
+    tests are kept.
+
+    The complement of a node set is relative to the active domain (the
+    subjects and objects of the graph), which is built once. backend
+    forces a backend of ssf.nodeset for all node sets, and paths one of
+    PATHS (by default 'sparse' if scipy is installed).
+    """
+
+    def __init__(self, graph: EncodedGraph, backend: Optional[str] = None,
+                 paths: Optional[str] = None):
+        if paths is None:
+            paths = 'keys' if PathEngine is None else 'sparse'
+        if paths not in PATHS:
+            raise ValueError(f'Unknown path evaluation: {paths}')
+        self.graph = graph
+        self.backend = backend
+        self.paths = paths
+        self._engine = None
+        self.memo: Dict[SANode, Tuple[NodeSet, bool]] = {}
+        self._paths: Dict[PANode, np.ndarray] = {}
+        self._inverse: Dict[PANode, np.ndarray] = {}
+        self._tests: Dict[SANode, np.ndarray] = {}
+        self._compiled: Dict[SANode, CompiledTest] = {}
+        self._values: Dict[Node, int] = {}  # ids of values not in the graph
+        self._all = None
+        self._domain = None
+
+    def __call__(self, node: SANode) -> Set[Node]:
+        """the nodes that conform to node"""
+        return {self.term(i) for i in self.ids(node)}
+
+    def ids(self, node: SANode) -> np.ndarray:
+        """the ids of the nodes that conform to node"""
+        nodes, complement = self.evaluate(node)
+        if complement:
+            return (self.domain - nodes).ids()
+        return nodes.ids()
+
+    def select(self, node: SANode, nodes: Iterable[Node]) -> Set[Node]:
+        """the nodes of nodes that conform to node"""
+        nodes = [n for n in nodes if self.id(n) is not None]
+        ids = np.array([self.id(n) for n in nodes], dtype=np.int32)
+        conforming, complement = self.evaluate(node)
+        if complement:
+            # the complement is relative to the nodes of the graph
+            mask = ~conforming.contains(ids) & self.domain.contains(ids)
+        else:
+            mask = conforming.contains(ids)
+        return {n for n, conforms in zip(nodes, mask) if conforms}
+
+    def evaluate(self, node: SANode) -> Tuple[NodeSet, bool]:
+        """the ids that conform to node, as a (nodes, complement) pair"""
+        return postorder(node, _dependencies, self._evaluate, self.memo)
+
+    def id(self, term: Node) -> Optional[int]:
+        i = self.graph.id(term)
+        return self._values.get(term) if i is None else i
+
+    def term(self, i: int) -> Node:
+        if i < len(self.graph.terms):
+            return self.graph.terms[i]
+        return self._extra[i - len(self.graph.terms)]
+
+    @property
+    def _extra(self) -> List[Node]:
+        return list(self._values)
+
+    def _value_id(self, term: Node) -> int:
+        # the id of a value of a shape (sh:hasValue), which need not occur
+        # in the graph
+        i = self.id(term)
+        if i is None:
+            i = self._values[term] = len(self.graph.terms) + len(self._values)
+        return i
+
+    @property
+    def all_ids(self) -> np.ndarray:
+        if self._all is None:
+            self._all = self.graph.node_ids()
+        return self._all
+
+    @property
+    def domain(self) -> NodeSet:
+        """the active domain: the nodes of the graph, as a NodeSet"""
+        if self._domain is None:
+            self._domain = self._nodes(self.all_ids)
+        return self._domain
+
+    def _nodes(self, ids: np.ndarray) -> NodeSet:
+        # a NodeSet of (sorted, distinct) ids
+        return from_ids(ids, len(self.graph.terms) + len(self._values), self.backend)
+
+    def relation(self, path: PANode) -> np.ndarray:
+        """the sorted (node, value) keys of path"""
+        if path == CLASS_PATH:
+            return self.graph.classes()
+        if self.paths == 'sparse' and path.pop != POp.PROP:
+            # (the relation of a property is read from POS: a matrix of
+            # the size of the graph per property would cost more)
+            if path not in self._paths:
+                if self._engine is None:
+                    self._engine = PathEngine(self.graph, self.all_ids)
+                matrix = self._engine.matrix(path).tocoo()
+                self._paths[path] = _keys(matrix.row, matrix.col)
+            return self._paths[path]
+        return postorder(path, lambda n: list(n.children) if n.pop != POp.PROP else [],
+                         self._relation, self._paths)
+
+    def _relation(self, path: PANode, memo: Dict) -> np.ndarray:
+        if path.pop == POp.PROP:
+            p = self.graph.id(path.children[0])
+            if p is None:
+                return _EMPTY_KEYS
+            return _keys(*self.graph.predicate(p))
+
+        children = [memo[child] for child in path.children]
+
+        if path.pop == POp.INV:
+            nodes, values = _pairs(children[0])
+            return _keys(values, nodes)
+
+        if path.pop == POp.ALT:
+            return np.unique(np.concatenate(children))
+
+        if path.pop == POp.COMP:
+            out = children[0]
+            for child in children[1:]:
+                out = _compose(out, child)
+            return out
+
+        identity = _keys(self.all_ids, self.all_ids)
+
+        if path.pop == POp.KLEENE:
+            return np.union1d(identity, _closure(children[0]))
+
+        if path.pop == POp.ZEROORONE:
+            return np.union1d(identity, children[0])
+
+        raise ValueError(f'Cannot evaluate path: {path.pop}')
+
+    def inverse(self, path: PANode) -> np.ndarray:
+        """the sorted (value, node) keys of path"""
+        if path not in self._inverse:
+            nodes, values = _pairs(self.relation(path))
+            self._inverse[path] = _keys(values, nodes)
+        return self._inverse[path]
+
+    def holds(self, test: SANode, ids: np.ndarray) -> np.ndarray:
+        """whether the nodes pass the test (an Op.TEST node), per id"""
+        if test not in self._tests:
+            self._tests[test] = np.full(len(self.graph.terms), -1, dtype=np.int8)
+        results = self._tests[test]
+        unknown = np.unique(ids[results[ids] < 0])
+        if len(unknown):
+            if test not in self._compiled:
+                self._compiled[test] = compile_test(test.children)
+            compiled = self._compiled[test]
+            if compiled.bounds is not None:
+                results[unknown] = self._in_range(compiled, unknown)
+            else:
+                results[unknown] = [compiled(self.graph.terms[i]) for i in unknown]
+        return results[ids] == 1
+
+    def _in_range(self, test: CompiledTest, ids: np.ndarray) -> np.ndarray:
+        # a numeric range test on the column of numbers; the terms that
+        # are not numeric literals, and the numbers that are too close to
+        # a bound to compare them as floats, are checked one by one
+        values, numeric = self.graph.numbers(ids)
+        passes = numeric.copy()
+        check = ~numeric
+        for op, bound in test.bounds:
+            passes &= OPERATORS[op](values, _float(bound))
+            check |= numeric & np.isclose(values, _float(bound), rtol=1e-9, atol=0)
+        passes[check] = [test(self.graph.terms[i]) for i in ids[check]]
+        return passes
+
+    def _counts(self, nodes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # the distinct ids of nodes and their numbers of occurrences: a
+        # bincount over the ids of the graph, or (for few nodes, for which
+        # an array of the size of the graph would cost more) a sort
+        size = len(self.graph.terms)
+        if len(nodes) * _BINCOUNT_RATIO < size:
+            return np.unique(nodes, return_counts=True)
+        counts = np.bincount(nodes, minlength=size)
+        distinct = np.flatnonzero(counts).astype(np.int32)
+        return distinct, counts[distinct]
+
+    def _member(self, shape: SANode, memo: Dict):
+        # a vectorized membership function for the nodes of a subshape
+        if shape.op == Op.TEST:
+            return lambda ids: self.holds(shape, ids)
+        if shape.op == Op.TOP:
+            return lambda ids: np.ones(len(ids), dtype=bool)
+        nodes, complement = memo[shape]
+        if complement:
+            return lambda ids: ~nodes.contains(ids)
+        return nodes.contains
+
+    def _evaluate(self, node: SANode, memo: Dict) -> Tuple[NodeSet, bool]:
+        nodes, complement = self._evaluate_ids(node, memo)
+        if isinstance(nodes, np.ndarray):
+            nodes = self._nodes(nodes)
+        return nodes, complement
+
+    def _evaluate_ids(self, node: SANode, memo: Dict) -> Tuple[Union[NodeSet, np.ndarray], bool]:
+        # a (nodes, complement) pair, of which nodes is a NodeSet or an
+        # array of (sorted, distinct) ids
+        if node.op == Op.HASSHAPE:
+            raise ValueError('node must be expanded')
+
+        if node.op == Op.TOP:
+            return _EMPTY, True
+
+        if node.op == Op.BOT:
+            return _EMPTY, False
+
+        if node.op == Op.AND:
+            positive = sorted((memo[child][0] for child in node.children
+                               if not memo[child][1]), key=len)
+            negative = [memo[child][0] for child in node.children
+                        if memo[child][1]]
+            if positive:
+                nodes = positive[0]
+                for other in positive[1:]:
+                    nodes = nodes & other
+                if negative:
+                    # a complement only has nodes of the domain (a value
+                    # of sh:hasValue need not be one)
+                    nodes = nodes & self.domain
+                for other in negative:
+                    nodes = nodes - other
+                return nodes, False
+            return _union(negative), True
+
+        if node.op == Op.OR:
+            positive = [memo[child][0] for child in node.children
+                        if not memo[child][1]]
+            negative = sorted((memo[child][0] for child in node.children
+                               if memo[child][1]), key=len)
+            if negative:
+                nodes = negative[0]
+                for other in negative[1:]:
+                    nodes = nodes & other
+                if positive and len(_union(positive) - self.domain):
+                    # a complement cannot hold nodes outside the domain
+                    return _union([self.domain - nodes] + positive), False
+                for other in positive:
+                    nodes = nodes - other
+                return nodes, True
+            return _union(positive), False
+
+        if node.op == Op.NOT:
+            nodes, complement = memo[node.children[0]]
+            return nodes, not complement
+
+        if node.op == Op.HASVALUE:
+            return np.array([self._value_id(node.children[0])], dtype=np.int32), False
+
+        if node.op == Op.TEST:
+            return self.all_ids[self.holds(node, self.all_ids)], False
+
+        if node.op == Op.CLOSED:
+            properties = [self.graph.id(child.children[0]) for child in node.children]
+            properties = [p for p in properties if p is not None]
+            outside = ~np.isin(self.graph.spo[:, 1], properties)
+            return np.unique(self.graph.spo[outside, 0]), True
+
+        if node.op == Op.EQ:
+            if node.children[0].pop == POp.ID:
+                nodes, values = _pairs(self.relation(node.children[1]))
+                single, counts = self._counts(nodes)
+                return np.intersect1d(single[counts == 1], nodes[nodes == values],
+                                      assume_unique=False), False
+            different = np.setxor1d(self.relation(node.children[0]),
+                                    self.relation(node.children[1]), assume_unique=True)
+            return np.unique(_pairs(different)[0]), True
+
+        if node.op == Op.DISJ:
+            if node.children[0].pop == POp.ID:
+                nodes, values = _pairs(self.relation(node.children[1]))
+                return np.unique(nodes[nodes == values]), True
+            common = np.intersect1d(self.relation(node.children[0]),
+                                    self.relation(node.children[1]), assume_unique=True)
+            return np.unique(_pairs(common)[0]), True
+
+        if node.op == Op.FORALL:
+            nodes, values = _pairs(self.relation(node.children[0]))
+            member = self._member(node.children[1], memo)
+            return np.unique(nodes[~member(values)]), True
+
+        if node.op == Op.COUNTRANGE:
+            mincount = int(node.children[0])
+            maxcount = None if node.children[1] is None else int(node.children[1])
+            shape = node.children[3]
+
+            if mincount == 0 and maxcount is None:
+                return _EMPTY, True
+
+            relation = self.relation(node.children[2])
+            if shape.op not in [Op.TEST, Op.TOP] and not memo[shape][1] \
+                    and len(memo[shape][0]) < len(relation):
+                # few conforming nodes (e.g. a class of a target): look
+                # up the nodes of which they are a value
+                values, nodes = _pairs(self.inverse(node.children[2]))
+                nodes = nodes[_lookup(values, memo[shape][0].ids())[1]]
+            else:
+                nodes, values = _pairs(relation)
+                if shape.op != Op.TOP:
+                    nodes = nodes[self._member(shape, memo)(values)]
+            nodes, counts = self._counts(nodes)
+
+            if mincount == 0:
+                return nodes[counts > maxcount], True
+            conforming = counts >= mincount
+            if maxcount is not None:
+                conforming &= counts <= maxcount
+            return nodes[conforming], False
+
+        if node.op == Op.EXACTLY1:
+            nodes, counts = self._counts(_pairs(self.relation(node.children[0]))[0])
+            return nodes[counts == 1], False
+
+        if node.op in [Op.LESSTHAN, Op.LESSTHANEQ]:
+            # a pair of values violates the constraint if the comparison
+            # is true (and not if it raises an error)
+            violation = _relation(_E, '>=' if node.op == Op.LESSTHAN else '>', _P)
+            others = {}
+            for v, p in zip(*_pairs(self.relation(node.children[1]))):
+                others.setdefault(v, []).append(self.graph.terms[p])
+            violating = set()
+            for v, e in zip(*_pairs(self.relation(node.children[0]))):
+                if v not in violating:
+                    e = self.graph.terms[e]
+                    if any(_ebv(violation, {_E: e, _P: p})
+                           for p in others.get(v, ())):
+                        violating.add(v)
+            return np.array(sorted(violating), dtype=np.int32), True
+
+        if node.op == Op.UNIQUELANG:
+            seen = set()
+            violating = set()
+            for v, value in zip(*_pairs(self.relation(node.children[0]))):
+                term = self.graph.terms[value]
+                if isinstance(term, Literal) and term.language:
+                    if (v, term.language) in seen:
+                        violating.add(v)
+                    seen.add((v, term.language))
+            return np.array(sorted(violating), dtype=np.int32), True
+
+        raise ValueError(f'Unknown Op encountered: {node.op}')
+
+
+def _union(sets: List[NodeSet]) -> NodeSet:
+    nodes = sets[0]
+    for other in sets[1:]:
+        nodes = nodes | other
+    return nodes
+
+
+def evaluate(graph: EncodedGraph, node: SANode) -> Set[Node]:
+    """the nodes of graph that conform to node (an expanded shape)"""
+    return Evaluator(graph)(node)
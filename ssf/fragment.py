@@ -0,0 +1,297 @@
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from rdflib import Graph
+from rdflib.plugins.sparql.evalutils import _ebv
+from rdflib.term import Literal, Node
+
+from slsparser.shapels import SANode, Op
+from slsparser.pathls import PANode, POp
+from slsparser.utilities import Normalizer, FRAGMENT_RULES, postorder
+from ssf.algebra import _relation, to_algebra_path
+from ssf.native import Evaluator, _E, _P
+
+'''
+Direct computation of shape fragments on an rdflib graph.
+
+The fragment queries of ssf.sfquery grow with every path step (a
+sequence doubles the query, a Kleene star joins the whole path again);
+the Extractor computes the same fragments without a query. It walks the
+shape for every conforming focus node, following the rules that
+to_sfquery encodes per operator, and collects the triples of the
+neighbourhood itself. Conformance is decided by the Evaluator of
+ssf.native, shared by all shapes.
+
+A path is traced from a node: the traces map every value node to the
+triples on the paths from the node to it (the rows (?t ?s ?p ?o ?h) of
+sfquery.graph_paths). The traces of a node are computed once, so the
+work is proportional to the neighbourhoods that are visited, not to the
+size of the query.
+'''
+
+Triple = Tuple[Node, Node, Node]
+Traces = Dict[Node, Set[Triple]]  # value node, triples on the paths to it
+Item = Tuple[Node, SANode]  # a node, a shape of which it has a neighbourhood
+
+
+class Extractor:
+    """Computes the shape fragments of (expanded, normalized) shapes on a
+    graph
+
+    The node sets of the Evaluator and the traces of the paths are kept,
+    so shapes extracted by the same Extractor share them. The graph
+    should not change while the Extractor is used.
+    """
+
+    def __init__(self, graph: Graph):
+        self.graph = graph
+        self.evaluator = Evaluator(graph)
+        self._traces: Dict[PANode, Dict[Node, Traces]] = {}
+        self._nnf = Normalizer({}, rules=[], expand=False)
+
+    def triples(self, node: SANode, nodes: Optional[Iterable[Node]] = None) -> Iterator[Triple]:
+        """the triples of the fragment of node (of the nodes of nodes that
+        conform to node, by default of all conforming nodes); a triple can
+        be yielded more than once"""
+        conforming = self.evaluator(node) if nodes is None \
+            else self.evaluator.select(node, nodes)
+        for v in conforming:
+            yield from self.neighbourhood(v, node)
+
+    def fragment(self, nodes: Iterable[SANode]) -> Graph:
+        """the shape fragment of the shapes of nodes, as a graph"""
+        fragment = Graph()
+        for node in nodes:
+            for triple in self.triples(node):
+                fragment.add(triple)
+        return fragment
+
+    def conforms(self, v: Node, node: SANode) -> bool:
+        if node.op == Op.TEST:
+            return self.evaluator.holds(node, v)
+        return bool(self.evaluator.select(node, [v]))
+
+    def neighbourhood(self, v: Node, node: SANode) -> Set[Triple]:
+        """the triples that the fragment query of node returns for v"""
+        # the neighbourhoods that it contains are computed first, without
+        # recursion (the chains of value nodes can be long)
+        parts: Dict[Item, Tuple[Set[Triple], List[Item]]] = {}
+
+        def split(item: Item) -> Tuple[Set[Triple], List[Item]]:
+            if item not in parts:
+                parts[item] = self._parts(*item)
+            return parts[item]
+
+        return postorder((v, node), lambda item: split(item)[1],
+                         lambda item, memo: split(item)[0].union(
+                             *(memo[dep] for dep in split(item)[1])))
+
+    def _parts(self, v: Node, node: SANode) -> Tuple[Set[Triple], List[Item]]:
+        # the triples of the neighbourhood of v for node, and the value
+        # nodes and subshapes of which the neighbourhoods are part of it
+        # OR and the negated constraints have no conformance check of
+        # their own (see sfquery._to_sfquery_node)
+        if node.op == Op.OR:
+            return set(), [(v, child) for child in node.children]
+
+        if node.op == Op.NOT:
+            return self._violations(v, node.children[0]), []
+
+        if node.op not in [Op.AND, Op.COUNTRANGE, Op.FORALL, Op.EQ, Op.EXACTLY1] \
+                or not self.conforms(v, node):
+            return set(), []
+
+        if node.op == Op.AND:
+            return set(), [(v, child) for child in node.children]
+
+        if node.op == Op.COUNTRANGE:
+            mincount = int(node.children[0])
+            traces = self.traces(node.children[2], v)
+            shape = node.children[3]
+            triples: Set[Triple] = set()
+            values: List[Item] = []
+            if mincount > 0 and shape.op == Op.TOP:
+                triples = _all(traces)
+            elif mincount > 0:
+                triples, values = self._qualified(traces, shape)
+            if node.children[1] is not None and shape.op != Op.TOP:
+                more, more_values = self._qualified(
+                    traces, self._nnf(SANode(Op.NOT, [shape])))
+                triples |= more
+                values += more_values
+            return triples, values
+
+        if node.op == Op.FORALL:
+            traces = self.traces(node.children[0], v)
+            if node.children[1].op == Op.TOP:
+                return _all(traces), []
+            return _all(traces), [(h, node.children[1]) for h in traces]
+
+        if node.op == Op.EQ:
+            return _all(self.traces(node.children[0], v)) | \
+                _all(self.traces(node.children[1], v)), []
+
+        # EXACTLY1
+        return _all(self.traces(node.children[0], v)), []
+
+    def traces(self, path: PANode, t: Node) -> Traces:
+        """a mapping: value node of t for path, the triples on the paths
+        from t to it"""
+        memo = self._traces.setdefault(path, {})
+        if t not in memo:
+            memo[t] = self._trace(path, t)
+        return memo[t]
+
+    def _qualified(self, traces: Traces, shape: SANode) -> Tuple[Set[Triple], List[Item]]:
+        # the paths to the value nodes that conform to shape, and those
+        # value nodes (their neighbourhoods are part of the fragment too)
+        triples: Set[Triple] = set()
+        values = []
+        for h, path_triples in traces.items():
+            if self.conforms(h, shape):
+                triples |= path_triples
+                values.append((h, shape))
+        return triples, values
+
+    def _violations(self, v: Node, node: SANode) -> Set[Triple]:
+        # the triples that show that v does not conform to node
+        if node.op == Op.CLOSED:
+            properties = {to_algebra_path(child) for child in node.children}
+            return {(v, p, o) for p, o in self.graph.predicate_objects(v)
+                    if p not in properties}
+
+        if node.op == Op.UNIQUELANG:
+            traces = self.traces(node.children[0], v)
+            languages: Dict[str, int] = {}
+            for h in traces:
+                if isinstance(h, Literal) and h.language:
+                    languages[h.language] = languages.get(h.language, 0) + 1
+            return set().union(*(triples for h, triples in traces.items()
+                                 if isinstance(h, Literal) and h.language
+                                 and languages[h.language] > 1))
+
+        if node.op not in [Op.EQ, Op.DISJ, Op.LESSTHAN, Op.LESSTHANEQ]:
+            return set()
+
+        traces1 = self.traces(node.children[0], v)
+        traces2 = self.traces(node.children[1], v)
+        if node.op == Op.EQ:
+            violating1 = [h for h in traces1 if h not in traces2]
+            violating2 = [h for h in traces2 if h not in traces1]
+        elif node.op == Op.DISJ:
+            violating1 = [h for h in traces1 if h in traces2]
+            violating2 = [h for h in traces2 if h in traces1]
+        else:
+            # the pairs for which the comparison is false (and not an error)
+            violation = _relation(_E, '>=' if node.op == Op.LESSTHAN else '>', _P)
+            pairs = [(e, p) for e in traces1 for p in traces2
+                     if _ebv(violation, {_E: e, _P: p})]
+            violating1 = {e for e, _ in pairs}
+            violating2 = {p for _, p in pairs}
+        return set().union(*(traces1[h] for h in violating1),
+                           *(traces2[h] for h in violating2))
+
+    def _trace(self, path: PANode, t: Node) -> Traces:
+        if path.pop == POp.ID:
+            return {t: set()}
+
+        if path.pop == POp.PROP:
+            p = path.children[0]
+            return {o: {(t, p, o)} for o in self.graph.objects(t, p)}
+
+        if path.pop == POp.INV:
+            # the paths of the inverse from t are the paths to t
+            child = path.children[0]
+            return {s: set(triples) for s, triples in self._inverse(child, t).items()}
+
+        if path.pop == POp.ALT:
+            traces: Traces = {}
+            for child in path.children:
+                _merge(traces, self.traces(child, t))
+            return traces
+
+        if path.pop == POp.COMP:
+            traces = {t: set()}
+            for child in path.children:
+                step: Traces = {}
+                for m, triples in traces.items():
+                    for h, more in self.traces(child, m).items():
+                        step.setdefault(h, set()).update(triples, more)
+                traces = step
+            return traces
+
+        if path.pop == POp.ZEROORONE:
+            traces = {t: set()} if self._in_graph(t) else {}
+            _merge(traces, self.traces(path.children[0], t))
+            return traces
+
+        if path.pop == POp.KLEENE:
+            # the triples of a step x1 -> x2 are on the paths from t to
+            # every node that x2 reaches: propagated along the steps
+            # until nothing changes
+            child = path.children[0]
+            traces = {t: set()} if self._in_graph(t) else {}
+            todo = [t]
+            while todo:
+                x1 = todo.pop()
+                for x2, triples in self.traces(child, x1).items():
+                    new = x2 not in traces
+                    reached = traces.setdefault(x2, set())
+                    size = len(reached)
+                    reached.update(traces.get(x1, ()), triples)
+                    if new or len(reached) > size:
+                        todo.append(x2)
+            return traces
+
+        raise ValueError(f'Cannot trace path: {path.pop}')
+
+    def _inverse(self, path: PANode, h: Node) -> Traces:
+        # a mapping: node t with h a value of t for path, the triples on
+        # the paths from t to h
+        if path.pop == POp.PROP:
+            p = path.children[0]
+            return {s: {(s, p, h)} for s in self.graph.subjects(p, h)}
+        if path.pop == POp.INV:
+            return self.traces(path.children[0], h)
+        # the nodes with h as value, traced forwards
+        return {t: self.traces(path, t)[h]
+                for t in self.evaluator.inverse(path).get(h, ())}
+
+    def _in_graph(self, node: Node) -> bool:
+        return node in self.evaluator.all_nodes
+
+
+def _all(traces: Traces) -> Set[Triple]:
+    return set().union(*traces.values())
+
+
+def _merge(traces: Traces, other: Traces):
+    for h, triples in other.items():
+        traces.setdefault(h, set()).update(triples)
+
+
+def prepare(definitions: Dict, targets: Dict, rules: List = FRAGMENT_RULES) -> List[SANode]:
+    """the shapes of which the fragment is the fragment of the schema: the
+    targeted shapes in conjunction with their targets (as
+    incremental.IncrementalCompiler prepares them)"""
+    return list(prepare_named(definitions, targets, rules).values())
+
+
+def prepare_named(definitions: Dict, targets: Dict,
+                  rules: List = FRAGMENT_RULES) -> Dict[Node, SANode]:
+    """like prepare, a mapping: shapename, prepared shape"""
+    normalizer = Normalizer(definitions, rules)
+    prepared = {}
+    for shape_name in definitions:
+        if shape_name not in targets or targets[shape_name].op == Op.BOT:
+            continue
+        shape = normalizer(SANode(Op.AND, [SANode(Op.HASSHAPE, [shape_name]),
+                                           targets[shape_name]]))
+        if shape.op != Op.BOT:
+            prepared[shape_name] = shape
+    return prepared
+
+
+def extract(graph: Graph, definitions: Dict, targets: Dict,
+            rules: List = FRAGMENT_RULES) -> Graph:
+    """the shape fragment of graph for a schema (see slsparser.shapels.parse)"""
+    return Extractor(graph).fragment(prepare(definitions, targets, rules))
@@ -0,0 +1,100 @@
+import gzip
+import heapq
+import sys
+import tempfile
+from typing import IO, Iterable, List, Optional, Set
+
+from rdflib.plugins.serializers.nt import _nt_row
+
+from ssf.fragment import Triple
+
+'''
+Streaming output of shape fragments as N-Triples, without duplicates.
+
+A fragment returns the same triple once per focus node and once per
+shape. The FragmentWriter keeps the N-Triples lines it has written in a
+set and writes every line once. When the set reaches its limit, its
+lines are sorted into a run in a temporary file and the set is emptied,
+so the memory does not grow with the fragment. The lines that arrive
+after the first run are not written right away (they may be in a run):
+close merges the runs and writes every line that is not in the first run
+(the lines that were already written), once.
+
+Usage: see ssf.ssf --extract.
+'''
+
+SPILL_LIMIT = 1000000  # lines in memory
+
+
+class FragmentWriter:
+    """Writes triples to a text stream as N-Triples, each triple once"""
+
+    def __init__(self, out: IO[str], limit: int = SPILL_LIMIT,
+                 directory: Optional[str] = None):
+        self.out = out
+        self.limit = limit
+        self.directory = directory  # of the runs (by default the system's)
+        self.written = 0  # the number of distinct triples
+        self._lines: Set[str] = set()
+        self._runs: List[IO[str]] = []
+
+    def __enter__(self) -> 'FragmentWriter':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, triple: Triple):
+        line = _nt_row(triple)
+        if line in self._lines:
+            return
+        self._lines.add(line)
+        if not self._runs:
+            self.out.write(line)
+            self.written += 1
+        if len(self._lines) >= self.limit:
+            self._spill()
+
+    def write_all(self, triples: Iterable[Triple]):
+        for triple in triples:
+            self.write(triple)
+
+    def close(self):
+        """writes the lines of the runs (and closes them)"""
+        if not self._runs:
+            return
+        self._spill()
+        previous = None
+        for line, i in heapq.merge(*(_tagged(run, i) for i, run in enumerate(self._runs))):
+            # (the first of equal lines is from the first run if it is in it)
+            if line != previous and i > 0:
+                self.out.write(line)
+                self.written += 1
+            previous = line
+        for run in self._runs:
+            run.close()
+        self._runs = []
+
+    def _spill(self):
+        if not self._lines:
+            return
+        run = tempfile.TemporaryFile('w+', encoding='utf-8', dir=self.directory)
+        run.writelines(sorted(self._lines))
+        run.seek(0)
+        self._runs.append(run)
+        self._lines = set()
+
+
+def _tagged(run: IO[str], i: int):
+    for line in run:
+        yield line, i
+
+
+def open_output(path: Optional[str]) -> IO[str]:
+    """the text stream of an output file: stdout for None or '-', gzip
+    compressed for a name that ends with .gz"""
+    if path is None or path == '-':
+        return sys.stdout
+    if path.endswith('.gz'):
+        return gzip.open(path, 'wt', encoding='utf-8')
+    return open(path, 'w', encoding='utf-8')
@@ -0,0 +1,133 @@
+import hashlib
+from typing import Dict, List, Optional
+
+from rdflib.term import Node
+
+from slsparser.shapels import SANode, Op
+from slsparser.pathls import PANode
+from slsparser.utilities import Normalizer, postorder, reference_cycles
+from ssf.sfquery import to_sfquery
+
+'''
+Incremental compilation of shape fragment queries.
+
+Every named shape gets a fingerprint: a digest of its definition in which
+every shape reference (HASSHAPE) is replaced by the fingerprint of the
+referenced shape. The fingerprint thus covers the transitive closure of
+the references, and it does not depend on the names of blank node
+shapes (which change every time a file is parsed). A shape whose
+fingerprint (together with its target) did not change has the same
+fragment query as before, only the other shapes are recompiled.
+'''
+
+
+def _value_key(value) -> str:
+    if type(value) == tuple:
+        return '(' + ','.join(_value_key(v) for v in value) + ')'
+    if isinstance(value, Node):
+        return type(value).__name__ + ':' + value.n3()
+    return type(value).__name__ + ':' + repr(value)
+
+
+def _digest(*parts: str) -> str:
+    return hashlib.blake2b('\0'.join(parts).encode(), digest_size=16).hexdigest()
+
+
+def shape_fingerprints(definitions: Dict) -> Dict[Node, str]:
+    """a mapping: shapename, fingerprint
+
+    Shapes on a reference cycle cannot be expanded; their references are
+    fingerprinted by name.
+    """
+    cyclic = {name for cycle in reference_cycles(definitions)
+              for name in cycle}
+
+    def reference(node: SANode):
+        # the (name) item a HASSHAPE node depends on, if any
+        name = node.children[0]
+        if name in definitions and name not in cyclic:
+            return ('name', name)
+        return None
+
+    def dependencies(item) -> List:
+        if type(item) == tuple:
+            return [definitions[item[1]]]
+        if type(item) == SANode and item.op == Op.HASSHAPE:
+            return [dep for dep in [reference(item)] if dep is not None]
+        return [c for c in item.children if type(c) in (SANode, PANode)]
+
+    def combine(item, memo: Dict) -> str:
+        if type(item) == tuple:
+            return memo[definitions[item[1]]]
+        if type(item) == SANode and item.op == Op.HASSHAPE:
+            ref = reference(item)
+            if ref is not None:
+                return memo[ref]
+            name = item.children[0]
+            if name in cyclic:
+                return _digest('cyclic', _value_key(name))
+            return _digest('undefined', _value_key(name))
+        op = item.op.name if type(item) == SANode else item.pop.name
+        cc = _value_key(getattr(item, 'constraintComponent', None))
+        children = [memo[c] if type(c) in (SANode, PANode) else _value_key(c)
+                    for c in item.children]
+        return _digest(op, cc, *children)
+
+    memo = {}
+    return {name: postorder(('name', name), dependencies, combine, memo)
+            for name in definitions}
+
+
+def node_fingerprint(node: SANode) -> str:
+    """the fingerprint of a shape without shape references (e.g. a target)"""
+    return shape_fingerprints({None: node})[None]
+
+
+class IncrementalCompiler:
+    """Compiles the fragment queries of the targeted shapes of a schema
+
+    The queries of the previous compile are kept by fingerprint, compile
+    only translates the shapes that changed since. The queries can be
+    persisted (they are a plain dict) and given to a new compiler.
+    """
+
+    def __init__(self, rules: List, queries: Optional[Dict] = None):
+        self.rules = rules
+        self.queries = queries or {}  # a mapping: fingerprint, query or None
+        self.compiled = 0  # number of shapes translated by the last compile
+        self.reused = 0  # number of shapes reused by the last compile
+
+    def compile(self, definitions: Dict, targets: Dict) -> List[str]:
+        """the fragment query of every targeted shape
+
+        Raises ShapeCycleError if a changed shape is recursive.
+        """
+        fingerprints = shape_fingerprints(definitions)
+        normalizer = Normalizer(definitions, self.rules)
+
+        queries = {}
+        shape_queries = []
+        self.compiled = self.reused = 0
+        for shape_name in definitions:
+            if shape_name not in targets or targets[shape_name].op == Op.BOT:
+                continue  # we ignore the shapes that do not have any targets
+
+            fingerprint = _digest(fingerprints[shape_name],
+                                  node_fingerprint(targets[shape_name]))
+            if fingerprint in self.queries:
+                query = self.queries[fingerprint]
+                self.reused += 1
+            else:
+                prepared = normalizer(SANode(Op.AND, [
+                    SANode(Op.HASSHAPE, [shape_name]),
+                    targets[shape_name]
+                ]))
+                query = None if prepared.op == Op.BOT else to_sfquery(prepared)
+                self.compiled += 1
+
+            queries[fingerprint] = query
+            if query is not None:
+                shape_queries.append(query)
+
+        self.queries = queries  # forget the shapes that were removed
+        return shape_queries
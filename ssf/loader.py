@@ -0,0 +1,113 @@
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from rdflib.util import from_n3
+
+from ssf.encoded import EncodedGraph
+
+'''
+Parallel bulk loading of N-Triples (and N-Quads) files into an
+EncodedGraph.
+
+The file is split into byte ranges that end at a line break, and the
+ranges are parsed in a process pool. A worker encodes its triples with a
+local term dictionary: it returns the distinct terms of its range (in
+the canonical N-Triples form of the encoded store) and the triples as an
+array of local ids. The merge gives every distinct term a global id and
+maps the local ids with one array lookup per range. The terms are never
+turned into rdflib objects: the graph keeps them encoded in a
+TermDictionary and decodes them when they are used.
+
+The graph names of N-Quads are ignored: the data graph is the union of
+the graphs. Blank node labels are shared by the whole file.
+
+Usage: python -m ssf.loader data.nt graph.ssfg [processes]
+'''
+
+CHUNK_SIZE = 32 * 1024 * 1024  # bytes
+
+_IRI = r'<[^>]*>'
+_BNODE = r'_:[^\s<>"]*[^\s<>".]'
+_LITERAL = r'"(?:[^"\\]|\\.)*"(?:@[A-Za-z0-9-]+|\^\^<[^>]*>)?'
+_LINE = re.compile(rf'\s*({_IRI}|{_BNODE})\s*({_IRI})\s*({_IRI}|{_BNODE}|{_LITERAL})'
+                   rf'\s*(?:(?:{_IRI}|{_BNODE})\s*)?\.\s*(?:#.*)?\r?')
+
+
+def _canonical(term: str) -> bytes:
+    # IRIs, blank nodes and simple (or language-tagged) strings are
+    # written as they are read; other literals are normalized by rdflib
+    # (escapes, lexical forms of numbers, ...)
+    if term[0] == '"' and ('\\' in term or '"^^' in term):
+        return from_n3(term).n3().encode()
+    return term.encode()
+
+
+def _parse_range(path: str, start: int, end: int) -> Tuple[List[bytes], np.ndarray]:
+    """the distinct terms and the triples (as local ids) of a byte range"""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start).decode('utf-8')
+
+    ids: Dict[str, int] = {}
+    triples: List[int] = []
+    for line in text.split('\n'):  # (not splitlines: literals may contain U+2028)
+        match = _LINE.fullmatch(line)
+        if match is None:
+            if line.strip() and not line.lstrip().startswith('#'):
+                raise ValueError(f'Invalid N-Triples line: {line!r}')
+            continue
+        for term in match.groups():
+            triples.append(ids.setdefault(term, len(ids)))
+
+    return [_canonical(term) for term in ids], np.array(triples, dtype=np.int32)
+
+
+def byte_ranges(path: str, chunk_size: int = CHUNK_SIZE) -> List[Tuple[int, int]]:
+    """ranges of about chunk_size bytes that end at a line break"""
+    size = os.path.getsize(path)
+    ranges = []
+    with open(path, 'rb') as f:
+        start = 0
+        while start < size:
+            f.seek(min(start + chunk_size, size))
+            f.readline()
+            end = min(f.tell(), size)
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def load(path: str, processes: Optional[int] = None,
+         chunk_size: int = CHUNK_SIZE) -> EncodedGraph:
+    """the graph of an N-Triples or N-Quads file, parsed in parallel
+
+    processes is the number of worker processes (by default the number of
+    CPUs); with processes=1 the file is parsed without a pool.
+    """
+    ranges = byte_ranges(path, chunk_size)
+    if processes == 1 or len(ranges) <= 1:
+        chunks = [_parse_range(path, start, end) for start, end in ranges]
+    else:
+        with ProcessPoolExecutor(processes) as pool:
+            chunks = list(pool.map(_parse_range, [path] * len(ranges),
+                                   *zip(*ranges)))
+
+    ids: Dict[bytes, int] = {}
+    triples = []
+    for keys, local in chunks:
+        mapping = np.array([ids.setdefault(key, len(ids)) for key in keys],
+                           dtype=np.int32)
+        triples.append(mapping[local])
+    spo = np.concatenate(triples) if triples else np.empty(0, dtype=np.int32)
+    return EncodedGraph.from_keys(list(ids), spo.reshape(-1, 3))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) not in [3, 4]:
+        print('Usage: python -m ssf.loader data.nt graph.ssfg [processes]')
+        exit(1)
+    load(sys.argv[1], int(sys.argv[3]) if len(sys.argv) == 4 else None).save(sys.argv[2])
@@ -0,0 +1,278 @@
+from typing import Dict, Iterable, List, Set, Tuple
+
+from rdflib import Graph
+from rdflib.plugins.sparql.evalutils import _ebv
+from rdflib.term import Literal, Node, Variable
+
+from slsparser.shapels import SANode, Op
+from slsparser.pathls import PANode, POp
+from slsparser.utilities import postorder
+from ssf.algebra import _relation, to_algebra_path
+from ssf.classindex import CLASS_PATH, class_index
+from ssf.predicates import compile_test
+
+'''
+Direct evaluation of shapes on an rdflib graph.
+
+Instead of translating a shape to a query, the evaluator computes the set
+of nodes that conform to every subshape with set algebra: AND is an
+intersection, OR a union and NOT the complement with respect to all nodes
+of the graph (the subjects and objects, as in the unary queries). A path
+is evaluated once into a mapping from every node to its value nodes, on
+which the counting, universal and pair constraints are checked. The
+path rdf:type/rdfs:subClassOf* of class targets and constraints is
+looked up in the ClassIndex of ssf.classindex.
+
+Most constraints hold for all nodes but a few (e.g. a maximum count), so
+a node set is kept as a pair (nodes, complement): with complement True,
+it is all nodes except nodes. The set of all nodes is only built when a
+complement has to be turned into a set.
+
+The results are those of the unary queries of ssf.unaryquery and
+ssf.algebra (which count the distinct value nodes of a path, like the
+evaluator). The tests are the filter conditions of the queries, compiled
+to Python callables by ssf.predicates; a test that raises an error does
+not hold, so it holds for the negation of the test.
+'''
+
+_V = Variable('v')
+_E = Variable('e')
+_P = Variable('p')
+
+NodeSet = Tuple[Set[Node], bool]  # nodes, complement
+
+_EMPTY: Set[Node] = frozenset()
+
+
+class Evaluator:
+    """Evaluates (expanded) shapes on a graph
+
+    The node sets of the subshapes, the values of the paths and the
+    results of the tests are kept, so shapes evaluated by the same
+    Evaluator share their subshapes. The graph should not change while
+    the Evaluator is used.
+    """
+
+    def __init__(self, graph: Graph):
+        self.graph = graph
+        self.memo: Dict[SANode, NodeSet] = {}
+        self._paths: Dict[PANode, Dict[Node, Set[Node]]] = {}
+        self._inverse: Dict[PANode, Dict[Node, Set[Node]]] = {}
+        self._tests: Dict[SANode, Dict[Node, bool]] = {}
+        self._all = None
+
+    def __call__(self, node: SANode) -> Set[Node]:
+        """the nodes that conform to node"""
+        nodes, complement = self.evaluate(node)
+        return self.all_nodes - nodes if complement else set(nodes)
+
+    def select(self, node: SANode, nodes: Iterable[Node]) -> Set[Node]:
+        """the nodes of nodes that conform to node"""
+        conforming, complement = self.evaluate(node)
+        if complement:
+            # the complement is relative to the nodes of the graph
+            return {n for n in nodes
+                    if n not in conforming and n in self.all_nodes}
+        return {n for n in nodes if n in conforming}
+
+    def evaluate(self, node: SANode) -> NodeSet:
+        """the nodes that conform to node, as a (nodes, complement) pair"""
+        return postorder(node, _dependencies, self._evaluate, self.memo)
+
+    @property
+    def all_nodes(self) -> Set[Node]:
+        if self._all is None:
+            self._all = set(self.graph.all_nodes())
+        return self._all
+
+    def values(self, path: PANode) -> Dict[Node, Set[Node]]:
+        """a mapping: node, its (non-empty) set of value nodes for path"""
+        if path not in self._paths and path == CLASS_PATH:
+            # (the classes of the nodes are looked up in the index)
+            self._paths[path] = class_index(self.graph).classes()
+        if path not in self._paths:
+            relation = {}
+            for s, o in self.graph.subject_objects(to_algebra_path(path)):
+                if s not in relation:
+                    relation[s] = set()
+                relation[s].add(o)
+            self._paths[path] = relation
+        return self._paths[path]
+
+    def inverse(self, path: PANode) -> Dict[Node, Set[Node]]:
+        """a mapping: value node, the nodes of which it is a value for path"""
+        if path not in self._inverse:
+            inverse = {}
+            for v, vs in self.values(path).items():
+                for value in vs:
+                    if value not in inverse:
+                        inverse[value] = set()
+                    inverse[value].add(v)
+            self._inverse[path] = inverse
+        return self._inverse[path]
+
+    def holds(self, test: SANode, node: Node) -> bool:
+        """whether node passes the test (an Op.TEST node)"""
+        results = self._tests.get(test)
+        if results is None:
+            results = self._tests[test] = {}
+            results[None] = compile_test(test.children)
+        if node not in results:
+            results[node] = results[None](node)
+        return results[node]
+
+    def _member(self, shape: SANode, memo: Dict):
+        # a membership function for the nodes of a subshape
+        if shape.op == Op.TEST:
+            return lambda node: self.holds(shape, node)
+        if shape.op == Op.TOP:
+            return lambda node: True
+        nodes, complement = memo[shape]
+        if complement:
+            return lambda node: node not in nodes
+        return lambda node: node in nodes
+
+    def _evaluate(self, node: SANode, memo: Dict) -> NodeSet:
+        if node.op == Op.HASSHAPE:
+            raise ValueError('node must be expanded')
+
+        if node.op == Op.TOP:
+            return _EMPTY, True
+
+        if node.op == Op.BOT:
+            return _EMPTY, False
+
+        if node.op == Op.AND:
+            positive = sorted((memo[child][0] for child in node.children
+                               if not memo[child][1]), key=len)
+            negative = [memo[child][0] for child in node.children
+                        if memo[child][1]]
+            if positive:
+                nodes = positive[0].intersection(*positive[1:])
+                if negative:
+                    # a complement only has nodes of the graph (a value
+                    # of sh:hasValue need not be one)
+                    nodes = nodes.intersection(self.all_nodes)
+                return nodes.difference(*negative), False
+            return set().union(*negative), True
+
+        if node.op == Op.OR:
+            positive = [memo[child][0] for child in node.children
+                        if not memo[child][1]]
+            negative = sorted((memo[child][0] for child in node.children
+                               if memo[child][1]), key=len)
+            if negative:
+                nodes = negative[0].intersection(*negative[1:])
+                outside = set().union(*positive).difference(self.all_nodes)
+                if outside:
+                    # a complement cannot hold nodes outside the graph
+                    return (self.all_nodes - nodes).union(*positive), False
+                return nodes.difference(*positive), True
+            return set().union(*positive), False
+
+        if node.op == Op.NOT:
+            nodes, complement = memo[node.children[0]]
+            return nodes, not complement
+
+        if node.op == Op.HASVALUE:
+            return {node.children[0]}, False
+
+        if node.op == Op.TEST:
+            return {n for n in self.all_nodes if self.holds(node, n)}, False
+
+        if node.op == Op.CLOSED:
+            properties = set(to_algebra_path(child) for child in node.children)
+            return {s for s, p in self.graph.subject_predicates()
+                    if p not in properties}, True
+
+        if node.op == Op.EQ:
+            if node.children[0].pop == POp.ID:
+                values = self.values(node.children[1])
+                return {v for v, vs in values.items() if vs == {v}}, False
+            values1 = self.values(node.children[0])
+            values2 = self.values(node.children[1])
+            return {v for v in values1.keys() | values2.keys()
+                    if values1.get(v) != values2.get(v)}, True
+
+        if node.op == Op.DISJ:
+            if node.children[0].pop == POp.ID:
+                values = self.values(node.children[1])
+                return {v for v, vs in values.items() if v in vs}, True
+            values1 = self.values(node.children[0])
+            values2 = self.values(node.children[1])
+            return {v for v, vs in values1.items()
+                    if not vs.isdisjoint(values2.get(v, ()))}, True
+
+        if node.op == Op.FORALL:
+            member = self._member(node.children[1], memo)
+            return {v for v, vs in self.values(node.children[0]).items()
+                    if not all(member(value) for value in vs)}, True
+
+        if node.op == Op.COUNTRANGE:
+            mincount = int(node.children[0])
+            maxcount = None if node.children[1] is None else int(node.children[1])
+            values = self.values(node.children[2])
+            shape = node.children[3]
+
+            if mincount == 0 and maxcount is None:
+                return _EMPTY, True
+
+            if shape.op == Op.TOP:
+                counts = {v: len(vs) for v, vs in values.items()}
+            elif shape.op != Op.TEST and not memo[shape][1] \
+                    and len(memo[shape][0]) < len(values):
+                # few conforming nodes (e.g. a class of a target): count
+                # from the value nodes back to the nodes
+                counts = {}
+                inverse = self.inverse(node.children[2])
+                for value in memo[shape][0]:
+                    for v in inverse.get(value, ()):
+                        counts[v] = counts.get(v, 0) + 1
+            else:
+                member = self._member(shape, memo)
+                counts = {v: sum(1 for value in vs if member(value))
+                          for v, vs in values.items()}
+
+            if mincount == 0:
+                return {v for v, count in counts.items() if count > maxcount}, True
+            return {v for v, count in counts.items() if count >= mincount
+                    and (maxcount is None or count <= maxcount)}, False
+
+        if node.op == Op.EXACTLY1:
+            return {v for v, vs in self.values(node.children[0]).items()
+                    if len(vs) == 1}, False
+
+        if node.op in [Op.LESSTHAN, Op.LESSTHANEQ]:
+            # a pair of values violates the constraint if the comparison
+            # is true (and not if it raises an error)
+            violation = _relation(_E, '>=' if node.op == Op.LESSTHAN else '>', _P)
+            values = self.values(node.children[0])
+            others = self.values(node.children[1])
+            return {v for v, vs in values.items()
+                    if any(_ebv(violation, {_E: e, _P: p})
+                           for e in vs for p in others.get(v, ()))}, True
+
+        if node.op == Op.UNIQUELANG:
+            violating = set()
+            for v, vs in self.values(node.children[0]).items():
+                languages = [value.language for value in vs
+                             if isinstance(value, Literal) and value.language]
+                if len(languages) != len(set(languages)):
+                    violating.add(v)
+            return violating, True
+
+        raise ValueError(f'Unknown Op encountered: {node.op}')
+
+
+def _dependencies(node: SANode) -> List[SANode]:
+    """the subshapes of which the node set is needed for node"""
+    if node.op in [Op.FORALL, Op.COUNTRANGE]:
+        # tests are only evaluated on the value nodes
+        shape = node.children[-1]
+        return [shape] if shape.op not in [Op.TEST, Op.TOP] else []
+    return [child for child in node.children if type(child) == SANode]
+
+
+def evaluate(graph: Graph, node: SANode) -> Set[Node]:
+    """the nodes of graph that conform to node (an expanded shape)"""
+    return Evaluator(graph)(node)
@@ -0,0 +1,238 @@
+from typing import Optional, Set
+
+import numpy as np
+
+'''
+Sets of node ids with interchangeable representations.
+
+The evaluator of ssf.encoded combines node sets with intersections,
+unions and differences. Which representation does that best depends on
+the set:
+- SmallNodeSet: a Python set of ids, for a few nodes (a class of a
+  target, the values of sh:in, the violations of a constraint)
+- DenseNodeSet: a NumPy bool array indexed by id, for large sets; the
+  operations are bitwise
+- RunNodeSet: a compressed bitmap of runs of consecutive ids (sorted
+  start and end arrays), for large sets with few runs (e.g. the nodes of
+  a class in a graph whose ids were given per class, or most of the
+  domain)
+
+from_ids chooses the representation by cardinality and the number of
+runs; the result of an operation is converted again when another
+representation fits it better. Every set has a size: its ids are in
+range(size). Sets of different sizes can be combined.
+'''
+
+SMALL = 4096  # sets of at most SMALL nodes are SmallNodeSets
+BACKENDS = ['set', 'dense', 'runs']
+
+
+class NodeSet:
+    """A set of node ids in range(size)"""
+
+    size: int
+
+    def ids(self) -> np.ndarray:
+        """the ids, sorted"""
+        raise NotImplementedError
+
+    def contains(self, ids: np.ndarray) -> np.ndarray:
+        """a bool array: whether each of ids is in the set"""
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def __and__(self, other: 'NodeSet') -> 'NodeSet':
+        if isinstance(other, SmallNodeSet):
+            return other & self
+        if type(self) == type(other) == RunNodeSet:
+            return _normalize(_combine_runs(self, other, 2))
+        return _normalize(DenseNodeSet(_bits(self, _size(self, other)) &
+                                       _bits(other, _size(self, other))))
+
+    def __or__(self, other: 'NodeSet') -> 'NodeSet':
+        if type(self) == type(other) == RunNodeSet:
+            return _normalize(_combine_runs(self, other, 1))
+        return _normalize(DenseNodeSet(_bits(self, _size(self, other)) |
+                                       _bits(other, _size(self, other))))
+
+    def __sub__(self, other: 'NodeSet') -> 'NodeSet':
+        if type(self) == type(other) == RunNodeSet:
+            return _normalize(_combine_runs(self, _complement_runs(other, self.size), 2))
+        bits = _bits(self, _size(self, other)).copy()
+        if isinstance(other, SmallNodeSet):
+            bits[other.ids()] = False
+        else:
+            bits &= ~_bits(other, len(bits))
+        return _normalize(DenseNodeSet(bits))
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({self.ids().tolist()!r}, size={self.size})'
+
+
+class SmallNodeSet(NodeSet):
+    def __init__(self, ids: Set[int], size: int):
+        self.set = ids
+        self.size = size
+        self._ids = None
+
+    def ids(self) -> np.ndarray:
+        if self._ids is None:
+            self._ids = np.array(sorted(self.set), dtype=np.int32)
+        return self._ids
+
+    def contains(self, ids: np.ndarray) -> np.ndarray:
+        return np.isin(ids, self.ids())
+
+    def __len__(self) -> int:
+        return len(self.set)
+
+    def __and__(self, other: NodeSet) -> NodeSet:
+        ids = self.ids()
+        return SmallNodeSet(set(ids[other.contains(ids)].tolist()),
+                            _size(self, other))
+
+    def __or__(self, other: NodeSet) -> NodeSet:
+        if isinstance(other, SmallNodeSet):
+            return _normalize(SmallNodeSet(self.set | other.set, _size(self, other)))
+        return other | self
+
+    def __sub__(self, other: NodeSet) -> NodeSet:
+        ids = self.ids()
+        return SmallNodeSet(set(ids[~other.contains(ids)].tolist()),
+                            _size(self, other))
+
+
+class DenseNodeSet(NodeSet):
+    def __init__(self, bits: np.ndarray):
+        self.bits = bits
+        self.size = len(bits)
+        self._len = None
+
+    def ids(self) -> np.ndarray:
+        return np.flatnonzero(self.bits).astype(np.int32)
+
+    def contains(self, ids: np.ndarray) -> np.ndarray:
+        inside = ids < self.size
+        out = np.zeros(len(ids), dtype=bool)
+        out[inside] = self.bits[ids[inside]]
+        return out
+
+    def __len__(self) -> int:
+        if self._len is None:
+            self._len = int(np.count_nonzero(self.bits))
+        return self._len
+
+
+class RunNodeSet(NodeSet):
+    def __init__(self, starts: np.ndarray, ends: np.ndarray, size: int):
+        # the runs [starts[i], ends[i]), sorted, not overlapping nor adjacent
+        self.starts = starts
+        self.ends = ends
+        self.size = size
+
+    def ids(self) -> np.ndarray:
+        lengths = self.ends - self.starts
+        total = int(lengths.sum())
+        run_starts = np.cumsum(lengths) - lengths
+        return (np.repeat(self.starts - run_starts, lengths) +
+                np.arange(total)).astype(np.int32)
+
+    def contains(self, ids: np.ndarray) -> np.ndarray:
+        run = np.searchsorted(self.starts, ids, 'right') - 1
+        inside = run >= 0
+        out = np.zeros(len(ids), dtype=bool)
+        out[inside] = ids[inside] < self.ends[run[inside]]
+        return out
+
+    def __len__(self) -> int:
+        return int((self.ends - self.starts).sum())
+
+
+def from_ids(ids: np.ndarray, size: int, backend: Optional[str] = None) -> NodeSet:
+    """the set of ids (sorted, without duplicates), in the given backend
+    or, if backend is None, in the one that fits it best"""
+    if backend is None:
+        if len(ids) <= SMALL:
+            backend = 'set'
+        else:
+            starts, ends = _runs(ids)
+            if len(starts) * 8 <= len(ids):
+                return RunNodeSet(starts, ends, size)
+            backend = 'dense'
+
+    if backend == 'set':
+        return SmallNodeSet(set(ids.tolist()), size)
+    if backend == 'dense':
+        bits = np.zeros(size, dtype=bool)
+        bits[ids] = True
+        return DenseNodeSet(bits)
+    if backend == 'runs':
+        return RunNodeSet(*_runs(ids), size)
+    raise ValueError(f'Unknown node set backend: {backend}')
+
+
+def _normalize(nodes: NodeSet) -> NodeSet:
+    # the set in the backend that fits it best (if it is not a small set
+    # in another backend, the representation is kept)
+    if isinstance(nodes, SmallNodeSet):
+        if len(nodes) <= SMALL:
+            return nodes
+    elif len(nodes) > SMALL:
+        if isinstance(nodes, DenseNodeSet):
+            # a dense set with few runs is compressed
+            edges = np.count_nonzero(np.diff(nodes.bits.view(np.int8)) == 1)
+            if (edges + 1) * 8 > len(nodes):
+                return nodes
+        else:
+            return nodes
+    return from_ids(nodes.ids(), nodes.size)
+
+
+def _size(first: NodeSet, second: NodeSet) -> int:
+    return max(first.size, second.size)
+
+
+def _bits(nodes: NodeSet, size: int) -> np.ndarray:
+    # the set as a bool array of (at least) the given size
+    if isinstance(nodes, DenseNodeSet) and nodes.size >= size:
+        return nodes.bits
+    bits = np.zeros(size, dtype=bool)
+    if isinstance(nodes, DenseNodeSet):
+        bits[:nodes.size] = nodes.bits
+    else:
+        bits[nodes.ids()] = True
+    return bits
+
+
+def _runs(ids: np.ndarray):
+    # the runs of consecutive ids (sorted, without duplicates)
+    if len(ids) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    ids = ids.astype(np.int64)
+    breaks = np.flatnonzero(np.diff(ids) != 1) + 1
+    starts = ids[np.concatenate(([0], breaks))]
+    ends = ids[np.concatenate((breaks - 1, [len(ids) - 1]))] + 1
+    return starts, ends
+
+
+def _combine_runs(first: RunNodeSet, second: RunNodeSet, cover: int) -> RunNodeSet:
+    # the ids in at least cover of the two sets (union: 1, intersection: 2)
+    points = np.concatenate((first.starts, second.starts, first.ends, second.ends))
+    deltas = np.concatenate((np.ones(len(first.starts) + len(second.starts)),
+                             -np.ones(len(first.ends) + len(second.ends))))
+    points, index = np.unique(points, return_inverse=True)
+    # the number of sets that contain [points[i], points[i + 1])
+    covered = np.cumsum(np.bincount(index, weights=deltas, minlength=len(points))) >= cover
+    changes = np.diff(np.concatenate(([False], covered)).astype(np.int8))
+    return RunNodeSet(points[changes == 1], points[changes == -1],
+                      _size(first, second))
+
+
+def _complement_runs(nodes: RunNodeSet, size: int) -> RunNodeSet:
+    size = max(size, nodes.size)
+    starts = np.concatenate(([0], nodes.ends))
+    ends = np.concatenate((nodes.starts, [size]))
+    keep = starts < ends
+    return RunNodeSet(starts[keep], ends[keep], size)
@@ -0,0 +1,153 @@
+import operator
+import re
+from decimal import Decimal
+from typing import Callable, List, Optional, Tuple
+
+from rdflib import SH, RDF, XSD
+from rdflib.plugins.sparql.evalutils import _ebv
+from rdflib.term import BNode, Literal, Node, URIRef
+from rdflib.term import _NUMERIC_LITERAL_TYPES
+
+from ssf.algebra import _V, _test_condition
+
+'''
+Tests (the parameters of Op.TEST nodes) compiled to Python callables.
+
+The queries check a test with a FILTER condition, which rdflib interprets
+for every row. compile_test builds the check once: a compiled regular
+expression, the datatype or node kinds to compare with, the languages as
+a set and the bounds of a range as numbers. The results are those of the
+FILTER conditions (see ssf.algebra._test_condition) as rdflib evaluates
+them: a condition that raises an error does not hold. The few cases in
+which rdflib's comparison rules are not simply those of numbers (e.g. a
+string literal compared with a number) are left to rdflib.
+
+The numeric bounds of a range test are kept (CompiledTest.bounds) so that
+a columnar store can check them on an array of numbers at once (see
+ssf.encoded).
+'''
+
+# the comparison operators of the range tests
+RANGE_OPS = {SH['MinExclusiveConstraintComponent']: '>',
+             SH['MaxExclusiveConstraintComponent']: '<',
+             SH['MinInclusiveConstraintComponent']: '>=',
+             SH['MaxInclusiveConstraintComponent']: '<=',
+             SH['MinLengthConstraintComponent']: '>=',
+             SH['MaxLengthConstraintComponent']: '<='}
+OPERATORS = {'>': operator.gt, '<': operator.lt,
+             '>=': operator.ge, '<=': operator.le}
+
+_NODE_KINDS = {SH.IRI: (URIRef,),
+               SH.Literal: (Literal,),
+               SH.BlankNode: (BNode,),
+               SH.BlankNodeOrIRI: (BNode, URIRef),
+               SH.BlankNodeOrLiteral: (BNode, Literal),
+               SH.IRIOrLiteral: (URIRef, Literal)}
+_REGEX_FLAGS = {'i': re.IGNORECASE, 's': re.DOTALL, 'm': re.MULTILINE}
+
+
+class CompiledTest:
+    """A test as a callable: term -> whether the term passes the test"""
+
+    def __init__(self, parameters: List, holds: Callable[[Node], bool],
+                 bounds: Optional[List[Tuple[str, object]]] = None):
+        self.parameters = parameters
+        self.holds = holds
+        # for numeric ranges: the (operator, number) bounds
+        self.bounds = bounds
+        self._condition = None
+
+    def __call__(self, term: Node) -> bool:
+        return self.holds(term)
+
+    def fallback(self, term: Node) -> bool:
+        """the result of rdflib's evaluation of the FILTER condition"""
+        if self._condition is None:
+            self._condition = _test_condition(self.parameters)
+        try:
+            return _ebv(self._condition, {_V: term})
+        except (ArithmeticError, TypeError):
+            return False  # e.g. NaN compared with a decimal
+
+
+def compile_test(parameters: List) -> CompiledTest:
+    """the test with the given parameters (see slsparser.shapels)"""
+    test_type = parameters[0]
+
+    if test_type == SH['PatternConstraintComponent']:
+        # the parser escapes the backslashes of patterns for query text
+        pattern = str(parameters[1]).replace('\\\\', '\\')
+        flags = 0
+        for flag in ''.join(str(flag) for flag in parameters[2]):
+            flags |= _REGEX_FLAGS.get(flag, 0)
+        regex = re.compile(pattern, flags)
+        return CompiledTest(parameters, lambda term: _is_string(term) and
+                            regex.search(str(term)) is not None)
+
+    if test_type == SH['DatatypeConstraintComponent']:
+        datatype = parameters[1]
+        return CompiledTest(parameters, lambda term: isinstance(term, Literal)
+                            and _datatype(term) == datatype)
+
+    if test_type == SH['NodeKindConstraintComponent']:
+        kinds = _NODE_KINDS[parameters[1]]
+        return CompiledTest(parameters, lambda term: isinstance(term, kinds))
+
+    if test_type in ['numeric_range', 'length_range']:
+        bounds = [(RANGE_OPS[parameters[i]], parameters[i + 1])
+                  for i in range(1, len(parameters) - 1, 2)]
+        if not all(_number(bound) is not None for _, bound in bounds):
+            # e.g. a range of dates: rdflib's rules
+            test = CompiledTest(parameters, None)
+            test.holds = test.fallback
+            return test
+        bounds = [(op, _number(bound)) for op, bound in bounds]
+
+        def in_range(value) -> bool:
+            return all(OPERATORS[op](value, bound) for op, bound in bounds)
+
+        if test_type == 'length_range':
+            return CompiledTest(parameters, lambda term: _is_string(term) and
+                                in_range(len(term)))
+
+        test = CompiledTest(parameters, None, bounds)
+
+        def holds(term: Node) -> bool:
+            if not isinstance(term, Literal):
+                return False
+            value = _number(term)
+            if value is None:
+                return test.fallback(term)
+            return in_range(value)
+
+        test.holds = holds
+        return test
+
+    if test_type == SH['LanguageInConstraintComponent']:
+        languages = {str(language) for language in parameters[1]}
+        return CompiledTest(parameters, lambda term: isinstance(term, Literal)
+                            and (term.language or '') in languages)
+
+    raise ValueError(f'Unknown test: {test_type}')
+
+
+def _is_string(term: Node) -> bool:
+    # a simple, xsd:string or language-tagged literal
+    return isinstance(term, Literal) and term.datatype in (None, XSD.string)
+
+
+def _datatype(term: Literal) -> URIRef:
+    if term.language:
+        return RDF.langString
+    return term.datatype or XSD.string
+
+
+def _number(term: Node):
+    """the value of a numeric literal (int, Decimal or float), or None
+    (also for NaN, which rdflib does not compare as a number)"""
+    if isinstance(term, Literal) and term.datatype in _NUMERIC_LITERAL_TYPES:
+        value = term.value
+        if isinstance(value, (int, Decimal, float)) and not isinstance(value, bool) \
+                and value == value:
+            return value
+    return None
@@ -1,29 +1,104 @@
-from typing import List
+from typing import Dict, List, Optional, Sequence, Tuple
 
 from slsparser.shapels import SANode, Op
-from slsparser.utilities import negation_normal_form
+from slsparser.utilities import Normalizer, postorder
 from slsparser.pathls import PANode, POp
 from ssf import unaryquery
+from ssf.sparql_ast import Fragment, sparql, join, serialize
 
-def _make_simple_comp(complist: List[PANode]) -> PANode:
-    if len(complist) == 1:
-        return complist[0]
-    return PANode(POp.COMP, [complist[0], _make_simple_comp(complist[1:])])
+def _make_simple_comp(complist: Sequence[PANode]) -> PANode:
+    node = complist[-1]
+    for step in reversed(complist[:-1]):
+        node = PANode(POp.COMP, [step, node])
+    return node
 
 
-def graph_paths(node: PANode) -> str:
+def graph_paths(node: PANode, specialized: bool = True) -> Fragment:
+    """the query of the triples on the paths of node: rows (?t ?s ?p ?o ?h)
+    with (?s ?p ?o) a triple on a path from ?t to ?h
+
+    With specialized (the default), inverse properties and sequences of
+    (inverse) properties are a flat group of triple patterns instead of
+    the general construction (nested subqueries, two per step).
+    """
+    if not specialized:
+        return postorder(node, _graph_paths_dependencies,
+                         lambda node, memo: _graph_paths_node(node, memo, False))
+    return postorder(node, _specialized_dependencies, _graph_paths_node)
+
+
+def _steps(node: PANode) -> Optional[List[Tuple[str, bool]]]:
+    # the (property, inverse) steps of a sequence of (inverse) properties
+    if node.pop == POp.PROP:
+        return [(str(node.children[0]), False)]
+    if node.pop == POp.INV and node.children[0].pop == POp.PROP:
+        return [(str(node.children[0].children[0]), True)]
+    if node.pop == POp.COMP:
+        steps = []
+        for child in node.children:
+            child_steps = _steps(child)
+            if child_steps is None:
+                return None
+            steps.extend(child_steps)
+        return steps
+    return None
+
+
+def _chain(steps: List[Tuple[str, bool]]) -> Fragment:
+    # a row per step: the chain of triple patterns from ?t to ?h, with the
+    # triple of the step as (?s ?p ?o)
+    nodes = ['?t'] + [f'?_x{i}' for i in range(1, len(steps))] + ['?h']
+    triples = [(nodes[i + 1], prop, nodes[i]) if inverse else (nodes[i], prop, nodes[i + 1])
+               for i, (prop, inverse) in enumerate(steps)]
+    chain = ' . '.join(f'{s} <{prop}> {o}' for s, prop, o in triples)
+    if len(triples) == 1:
+        s, prop, o = triples[0]
+        return sparql('''
+        # graph_paths ^POp.PROP
+        SELECT ?t ({s} AS ?s) (<{prop}> AS ?p) ({o} AS ?o) ?h
+        WHERE {{ {chain} }}''', s=s, prop=prop, o=o, chain=chain)
+    rows = join('UNION ', [
+        sparql('{{ {chain} BIND({s} AS ?s) BIND(<{prop}> AS ?p) BIND({o} AS ?o) }} ',
+               chain=chain, s=s, prop=prop, o=o)
+        for s, prop, o in triples])
+    return sparql('''
+        # graph_paths sequence of properties
+        SELECT ?t ?s ?p ?o ?h
+        WHERE {{ {rows} }}''', rows=rows)
+
+
+def _specialized_dependencies(node: PANode) -> List[PANode]:
+    if node.pop in [POp.INV, POp.COMP] and _steps(node) is not None:
+        return []
+    return _graph_paths_dependencies(node)
+
+
+def _graph_paths_dependencies(node: PANode) -> List[PANode]:
+    if node.pop in [POp.ID, POp.PROP]:
+        return []
+    if node.pop == POp.COMP:
+        return list(_make_simple_comp(node.children).children)
+    return list(node.children)
+
+
+def _graph_paths_node(node: PANode, memo: Dict, specialized: bool = True) -> Fragment:
+    if specialized and node.pop in [POp.INV, POp.COMP]:
+        steps = _steps(node)
+        if steps is not None:
+            return _chain(steps)
+
     if node.pop == POp.ID:
-        return 'SELECT ?t ?s ?p ?o ?h WHERE {}' #empty
+        return Fragment(['SELECT ?t ?s ?p ?o ?h WHERE {}']) #empty
 
     if node.pop == POp.PROP:
         prop = str(node.children[0])
-        return f'''
+        return sparql('''
         # graph_paths POp.PROP
         SELECT (?s AS ?t) ?s (<{prop}> AS ?p) ?o (?o AS ?h)
-        WHERE {{ ?s <{prop}> ?o }}'''
+        WHERE {{ ?s <{prop}> ?o }}''', prop=prop)
     if node.pop == POp.ZEROORONE:
-        qe1 = graph_paths(node.children[0])
-        return f'''
+        qe1 = memo[node.children[0]]
+        return sparql('''
         # graph_paths POp.ZEROORONE
         SELECT *
         WHERE {{
@@ -32,19 +107,17 @@ def graph_paths(node: PANode) -> str:
         {{
         SELECT (?h AS ?t) ?h
         WHERE {{ {{ ?h ?_p1 ?_o1 }} UNION {{ ?_s2 ?_p2 ?h }} }}
-        }} }}'''
+        }} }}''', qe1=qe1)
 
     if node.pop == POp.ALT:
-        qes = ''
-        for child in node.children:
-            qes += f'{{ {graph_paths(child)} }} UNION '
-        return f'''SELECT ?t ?s ?p ?o ?h WHERE {{ {qes[:-6]} }}'''
+        return sparql('''SELECT ?t ?s ?p ?o ?h WHERE {{ {qes} }}''',
+                      qes=_union_parts([memo[child] for child in node.children]))
 
     if node.pop == POp.COMP:
         node = _make_simple_comp(node.children)
-        qe1 = graph_paths(node.children[0])
-        qe2 = graph_paths(node.children[1])
-        return f'''
+        qe1 = memo[node.children[0]]
+        qe2 = memo[node.children[1]]
+        return sparql('''
         SELECT ?t ?s ?p ?o ?h
         WHERE {{
         {{
@@ -65,16 +138,21 @@ def graph_paths(node: PANode) -> str:
             SELECT (?t AS ?h1) ?s ?p ?o ?h
             WHERE {{ {qe2} }}
           }}
-        }} }}'''
+        }} }}''', qe1=qe1, qe2=qe2)
     
     if node.pop == POp.INV:
-        qe1 = graph_paths(node.children[0])
-        return f'''SELECT (?h AS ?t) ?s ?p ?o (?t AS ?h) WHERE {{ {qe1} }}'''
+        qe1 = memo[node.children[0]]
+        # (?t and ?h are swapped through fresh names: a SELECT cannot
+        # bind a variable that is in scope)
+        return sparql('''
+        SELECT (?h1 AS ?t) ?s ?p ?o (?t1 AS ?h)
+        WHERE {{ SELECT (?t AS ?t1) ?s ?p ?o (?h AS ?h1) WHERE {{ {qe1} }} }}''',
+                      qe1=qe1)
 
     if node.pop == POp.KLEENE:
-        qe1 = graph_paths(node.children[0])
+        qe1 = memo[node.children[0]]
         path = unaryquery.to_path(node)
-        return f'''
+        return sparql('''
         SELECT ?t ?s ?p ?o ?h
         WHERE {{
           ?t {path} ?x1 .
@@ -86,56 +164,102 @@ def graph_paths(node: PANode) -> str:
             SELECT (?h AS ?t) ?h
             WHERE {{ {{ ?h ?_p1 ?_o1 }} UNION {{ ?_s2 ?_p2 ?h }} }}
           }}
-        }}'''
+        }}''', path=path, qe1=qe1)
     
-    return ''
+    return Fragment([])
+
+
+def _union_parts(queries: List[Fragment]) -> Fragment:
+    # { q1 } UNION { q2 } UNION ...
+    return join('UNION ', [sparql('{{ {query} }} ', query=query)
+                           for query in queries])
 
 
 def to_sfquery(node: SANode) -> str:
+    return serialize(build_sfquery(node))
+
+
+def build_sfquery(node: SANode, uq_memo: Optional[Dict] = None,
+                  memo: Optional[Dict] = None) -> Fragment:
+    """like to_sfquery, the query as a Fragment
+
+    The conformance queries (see unaryquery.build_uq) are kept in uq_memo
+    and the fragment queries of the subshapes in memo (if given), so that
+    they can be shared by several translations.
+    """
+    if uq_memo is None:
+        uq_memo = {}  # conformance queries, shared by the whole translation
+    nnf = Normalizer({}, rules=[], expand=False)
+
+    def dependencies(node: SANode) -> List[SANode]:
+        if node.op in [Op.AND, Op.OR]:
+            return list(node.children)
+        if node.op == Op.COUNTRANGE:
+            shape = node.children[3]
+            if shape.op == Op.TOP:
+                return []
+            deps = []
+            if int(node.children[0]) > 0:
+                deps.append(shape)
+            if node.children[1] is not None:
+                deps.append(nnf(SANode(Op.NOT, [shape])))
+            return deps
+        if node.op == Op.FORALL and node.children[1].op != Op.TOP:
+            return [node.children[1]]
+        return []
+
+    return postorder(node, dependencies,
+                     lambda node, memo: _to_sfquery_node(node, memo, uq_memo, nnf), memo)
+
+
+def _to_sfquery_node(node: SANode, memo: Dict, uq_memo: Dict,
+                     nnf: Normalizer) -> Fragment:
     # Optimization: OR does not need conformance
     if node.op == Op.OR:
-        qps = ''
-        for child in node.children:
-            qps += f'{{ {to_sfquery(child)} }} UNION '
-        return f'SELECT ?v ?s ?p ?o WHERE {{ {qps[:-6]} }}'
+        qps = _union_parts([memo[child] for child in node.children])
+        return sparql('SELECT ?v ?s ?p ?o WHERE {{ {qps} }}', qps=qps)
 
-    cqp = unaryquery.to_uq(node)
+    cqp = unaryquery.build_uq(node, uq_memo)
 
     if node.op == Op.AND:
-        qps = ''
-        for child in node.children:
-            qps += f'{{ {to_sfquery(child)} }} UNION '
-        return f'''
+        qps = _union_parts([memo[child] for child in node.children])
+        return sparql('''
         SELECT ?v ?s ?p ?o 
         WHERE {{ 
             {{ {cqp} }} . 
             {{
                 SELECT ?v ?s ?p ?o 
                 WHERE {{
-                    {qps[:-6]} 
+                    {qps} 
                 }}
             }}
-        }}'''
+        }}''', cqp=cqp, qps=qps)
 
     if node.op == Op.COUNTRANGE:
-        cqp1 = unaryquery.to_uq(node.children[2])
-        path = unaryquery.to_path(node.children[1])
-        qp1 = to_sfquery(node.children[2])
-        # TODO Optimization (??): If node is of the form geq_n E.TEST we should incorporate the test
-        # in the graph_paths query.
-        # We do this by adding a filter on the head '?h' in the graph_paths construction
-
-        qe = graph_paths(node.children[1])
-        # Optimization: If node is of the form geq_n E.TOP, we do not need to retrieve psi
-        # we also do not need to conformance check for psi
-        if node.children[2].op == Op.TOP:
-            return f'''
+        mincount = int(node.children[0])
+        maxcount = node.children[1]
+        qe = graph_paths(node.children[2])
+        path = unaryquery.to_path(node.children[2])
+        shape = node.children[3]
+        parts = []
+
+        # the part for >= mincount E.psi
+        if mincount > 0 and shape.op == Op.TOP:
+            # Optimization: If node is of the form geq_n E.TOP, we do not need to retrieve psi
+            # we also do not need to conformance check for psi
+            parts.append(sparql('''
             SELECT (?t AS ?v) ?s ?p ?o
             WHERE {{
                 {{ SELECT (?v AS ?t) WHERE {{ {cqp} }} }} .
                 {{ {qe} }} 
-            }}'''
-        return f'''
+            }}''', cqp=cqp, qe=qe))
+        elif mincount > 0:
+            # TODO Optimization (??): If node is of the form geq_n E.TEST we should incorporate the test
+            # in the graph_paths query.
+            # We do this by adding a filter on the head '?h' in the graph_paths construction
+            cqp1 = unaryquery.build_uq(shape, uq_memo)
+            qp1 = memo[shape]
+            parts.append(sparql('''
         SELECT (?t AS ?v) ?s ?p ?o
         WHERE {{ {{
         {{ SELECT (?v AS ?t) WHERE {{ {cqp} }} }} .
@@ -145,23 +269,23 @@ def to_sfquery(node: SANode) -> str:
         {{ SELECT (?v AS ?t) WHERE {{ {cqp} }} }} .
         ?t {path} ?h .
         {{ SELECT (?v AS ?h) ?s ?p ?o
-           WHERE {{ {{ {qp1} }} .  {{ {cqp1} }} }} }} }} }} '''
+           WHERE {{ {{ {qp1} }} .  {{ {cqp1} }} }} }} }} }} ''',
+                cqp=cqp, qe=qe, cqp1=cqp1, path=path, qp1=qp1))
 
-    # Optimization: If the statement is of the form leq_n E.TOP, then nothing is returned
-    if node.op == Op.LEQ and node.children[2].op != Op.TOP:
-        qe = graph_paths(node.children[1])
-        np1 = negation_normal_form(SANode(Op.NOT, [node.children[2]]))
-        cqnp1 = unaryquery.to_uq(np1)
-        qnp1 = to_sfquery(np1)
-        path = unaryquery.to_path(node.children[1])
+        # the part for <= maxcount E.psi
+        # Optimization: If the statement is of the form leq_n E.TOP, then nothing is returned
+        if maxcount is not None and shape.op != Op.TOP:
+            np1 = nnf(SANode(Op.NOT, [shape]))
+            cqnp1 = unaryquery.build_uq(np1, uq_memo)
+            qnp1 = memo[np1]
 
-        return f'''
+            parts.append(sparql('''
         SELECT (?t AS ?v) ?s ?p ?o
         WHERE {{
         {{
           {{ SELECT (?v AS ?t) WHERE {{ {cqp} }} }} .
           {{ {qe} }} .
-          {{ SELECT (?v AS ?h) WHERE {{ {cqnp1 } }} }}
+          {{ SELECT (?v AS ?h) WHERE {{ {cqnp1} }} }}
         }} UNION {{
           {{ SELECT (?v AS ?t) WHERE {{ {cqp} }} }} .
           ?t {path} ?h .
@@ -169,7 +293,13 @@ def to_sfquery(node: SANode) -> str:
             SELECT (?v AS ?h) ?s ?p ?o
             WHERE {{ {{ {qnp1} }} . {{ {cqnp1} }} }}
         }} }} }}
-        '''
+        ''', cqp=cqp, qe=qe, cqnp1=cqnp1, path=path, qnp1=qnp1))
+
+        if len(parts) == 1:
+            return parts[0]
+        if parts:
+            return sparql('SELECT ?v ?s ?p ?o WHERE {{ {qps} }}',
+                          qps=_union_parts(parts))
 
     if node.op == Op.FORALL:
         qe = graph_paths(node.children[0])
@@ -177,15 +307,15 @@ def to_sfquery(node: SANode) -> str:
         # We do not need conformance because all nodes
         # conform to forall E.TOP and all nodes conform to TOP.
         if node.children[1].op == Op.TOP:
-            return f'''
+            return sparql('''
             SELECT (?t AS ?v) ?s ?p ?o
             WHERE {{ {{ {qe} }} }}
-            '''
+            ''', qe=qe)
 
         path = unaryquery.to_path(node.children[0])
-        qp1 = to_sfquery(node.children[1])
+        qp1 = memo[node.children[1]]
 
-        return f'''
+        return sparql('''
         SELECT (?t AS ?v) ?s ?p ?o
         WHERE {{
         {{
@@ -198,28 +328,28 @@ def to_sfquery(node: SANode) -> str:
             SELECT (?v AS ?h) ?s ?p ?o
             WHERE {{ {qp1} }}
         }} }} }}
-        '''
+        ''', cqp=cqp, qe=qe, path=path, qp1=qp1)
 
     if node.op == Op.EQ: # TODO: add EQ ID
         qe = graph_paths(node.children[0])
         qp = graph_paths(node.children[1])
 
-        return f'''
+        return sparql('''
 SELECT (?t AS ?v) ?s ?p ?o
 WHERE {{
 {{ SELECT (?v AS ?t) WHERE {{ {cqp} }} }} .
 {{ {{ {qe} }} UNION {{ {qp} }} }} }}
-'''
+''', cqp=cqp, qe=qe, qp=qp)
 
     # Optimization
     if node.op == Op.EXACTLY1:
         qe = graph_paths(node.children[0])
-        return f'''
+        return sparql('''
         SELECT (?t AS ?v) ?s ?p ?o
         WHERE {{
             {{ SELECT (?v AS ?t) WHERE {{ {cqp} }} }} .
             {{ {qe} }} 
-        }}'''
+        }}''', cqp=cqp, qe=qe)
 
     if node.op == Op.NOT:
         child = node.children[0]
@@ -229,25 +359,25 @@ WHERE {{
                 notinlist += f'{str(prop)} ,'
             notinlist = f'( {notinlist[:-1]} )'
         # Optimization: we do not need conformance
-            return f'''
+            return sparql('''
 SELECT ?v (?v AS ?s) ?p ?o
 WHERE {{
 ?v ?p ?o .
 FILTER (?p NOT IN {notinlist})
 }}
-'''
+''', notinlist=notinlist)
         if child.op == Op.UNIQUELANG:
             qe = graph_paths(child.children[0])
             path = unaryquery.to_path(child.children[0])
 
-            return f'''
+            return sparql('''
 SELECT ( ?t AS ?v ) ?s ?p ?o
 WHERE {{
 {{ SELECT (?v AS ?t) WHERE {{ {cqp} }} .
 {{ {qe} }} .
 {{ ?t {path} ?h2 }}
 FILTER (?h != ?h2 && lang(?h) = lang(?h2))
-'''
+''', cqp=cqp, qe=qe, path=path)
 
         if child.op in [Op.EQ, Op.DISJ, Op.LESSTHAN, Op.LESSTHANEQ]:
             qe = graph_paths(child.children[0])
@@ -257,47 +387,47 @@ FILTER (?h != ?h2 && lang(?h) = lang(?h2))
 
             if child.op == Op.EQ:
                 # Optimization: no conformance needed
-                return f'''
+                return sparql('''
 SELECT (?t AS ?v) ?s ?p ?o
 WHERE {{
   {{ {{ {qe} }} MINUS {{ ?t {prop} ?h }} }}
   UNION
   {{ {{ {qp} }} MINUS {{ ?t {path} ?h }} }} 
 }} 
-'''
+''', qe=qe, qp=qp, path=path, prop=prop)
 
             if child.op == Op.DISJ:
                 # Optimization: no conformance needed
-                return f'''
+                return sparql('''
 SELECT (?t AS ?v) ?s ?p ?o
 WHERE {{
   {{ {{ {qe} }} . {{ ?t {prop} ?h }} }}
   UNION
   {{ {{ {qp} }} . {{ ?t {path} ?h }} }} }}
-'''
+''', qe=qe, qp=qp, path=path, prop=prop)
             if child.op == Op.LESSTHAN:
                 # Optimization: no conformance needed
-                return f'''
+                return sparql('''
 SELECT (?t AS ?v) ?s ?p ?o
 WHERE {{
   {{ {{ {qe} }} . {{ ?t {prop} ?h2 }} FILTER (!( ?h < ?h2 )) }}
   UNION
   {{ {{ {qp} }} . {{ ?t {path} ?h2 }} FILTER (!( ?h2 < ?h )) }}
 }} 
-'''
+''', qe=qe, qp=qp, path=path, prop=prop)
             if child.op == Op.LESSTHANEQ:
                 # Optimization: no conformance needed
-                return f'''
+                return sparql('''
 SELECT (?t AS ?v) ?s ?p ?o
 WHERE {{
   {{ {{ {qe} }} . {{ ?t {prop} ?h2 }} FILTER (!( ?h <= ?h2 )) }}
   UNION
   {{ {{ {qp} }} . {{ ?t {path} ?h2 }} FILTER (!( ?h2 <= ?h )) }}
 }}
-'''
+''', qe=qe, qp=qp, path=path, prop=prop)
 
     # In all other cases, we return the empty query
-    return '''
+    return Fragment(['''
     SELECT ?v ?s ?p ?o
     WHERE {}
-    '''
\ No newline at end of file
+    '''])
\ No newline at end of file
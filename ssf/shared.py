@@ -0,0 +1,170 @@
+from typing import Dict, List, Tuple
+
+from rdflib import URIRef
+
+from slsparser.shapels import SANode
+from ssf.incremental import node_fingerprint
+from ssf.sfquery import build_sfquery
+from ssf.sparql_ast import Fragment, sparql, serialize
+from ssf.unaryquery import build_uq
+
+'''
+Fragment queries of a schema that translate their common subqueries
+once.
+
+The fragment query of a targeted shape contains the conformance queries
+(ssf.unaryquery) of its subshapes, and the fragment queries of the
+subshapes, often several times. The shapes of a schema have many
+subshapes in common (a property shape, a class target, a shape that
+other shapes refer to), and the union query of the schema contains
+their queries once per shape. SPARQL has no named subqueries, so a
+subquery that the text would contain several times is materialized
+instead: a SPARQL Update inserts its results in the named graph
+SHARED_GRAPH, and the queries look them up there.
+
+- The nodes that conform to a subshape are the objects of
+  <urn:ssf:shape/fingerprint> <urn:ssf:node> ?v.
+- The rows (?v ?s ?p ?o) of the fragment query of a subshape are blank
+  nodes with <urn:ssf:fragment> <urn:ssf:fragment/fingerprint> and a
+  property per variable. (The rows of the zero-length paths, without
+  triple, are left out.)
+
+The updates are ordered such that a subquery is materialized before the
+subqueries that use it; each is translated once. The data graph is the
+default graph of the dataset: the queries do not see the named graph,
+other than through the lookups.
+'''
+
+SHARED_GRAPH = URIRef('urn:ssf:shared')
+_NODE = URIRef('urn:ssf:node')
+_FRAGMENT = URIRef('urn:ssf:fragment')
+_VARIABLES = ['v', 's', 'p', 'o']
+
+CONFORMANCE = 'shape'
+FRAGMENT = 'fragment'
+
+Subquery = Tuple[str, SANode]  # (CONFORMANCE or FRAGMENT, subshape)
+
+
+def _name(subquery: Subquery) -> URIRef:
+    kind, node = subquery
+    return URIRef(f'urn:ssf:{kind}/{node_fingerprint(node)}')
+
+
+def _pattern(subquery: Subquery) -> str:
+    # the triple patterns of the results of subquery
+    if subquery[0] == CONFORMANCE:
+        return f'<{_name(subquery)}> <{_NODE}> ?v'
+    properties = ' ; '.join(f'<urn:ssf:{var}> ?{var}' for var in _VARIABLES)
+    return f'_:row <{_FRAGMENT}> <{_name(subquery)}> ; {properties}'
+
+
+def _lookup(subquery: Subquery) -> Fragment:
+    variables = '?v' if subquery[0] == CONFORMANCE else '?v ?s ?p ?o'
+    pattern = _pattern(subquery).replace('_:row', '?_row')
+    return sparql('SELECT {variables} WHERE {{ GRAPH <{graph}> {{ {pattern} }} }}',
+                  variables=variables, graph=SHARED_GRAPH, pattern=pattern)
+
+
+class _Translation:
+    """The fragment queries of shapes, with the shared subqueries looked up"""
+
+    def __init__(self, shapes: List[SANode], shared: List[Subquery]):
+        self.shared = shared
+        self.lookups = {subquery: _lookup(subquery) for subquery in shared}
+        self.uq_memo = {node: query for (kind, node), query in self.lookups.items()
+                        if kind == CONFORMANCE}
+        self.memo = {node: query for (kind, node), query in self.lookups.items()
+                     if kind == FRAGMENT}
+        self.queries = [build_sfquery(shape, self.uq_memo, self.memo) for shape in shapes]
+        self.updates = [self._materialization(subquery) for subquery in shared]
+
+    def _materialization(self, subquery: Subquery) -> Fragment:
+        # the query of the subquery itself, with the other shared
+        # subqueries looked up
+        kind, node = subquery
+        uq_memo = dict(self.uq_memo)
+        memo = dict(self.memo)
+        if kind == CONFORMANCE:
+            del uq_memo[node]
+            query = build_uq(node, uq_memo)
+        else:
+            del memo[node]
+            query = build_sfquery(node, uq_memo, memo)
+        return sparql('INSERT {{ GRAPH <{graph}> {{ {pattern} }} }} WHERE {{ {{ {query} }} }}',
+                      graph=SHARED_GRAPH, pattern=_pattern(subquery), query=query)
+
+    def subqueries(self) -> Dict[Subquery, Fragment]:
+        """the subqueries of all shapes, subshapes first"""
+        subqueries = {(CONFORMANCE, node): query for node, query in self.uq_memo.items()}
+        subqueries.update(((FRAGMENT, node), query) for node, query in self.memo.items())
+        return subqueries
+
+
+def _counts(roots: List[Fragment]) -> Tuple[Dict[int, int], Dict[int, int]]:
+    # per Fragment (by id): the number of times its text is part of the
+    # text of the roots, and the length of its text
+    order = []
+    seen = set()
+    stack = [(root, False) for root in roots]
+    while stack:
+        fragment, done = stack.pop()
+        if done:
+            order.append(fragment)
+        elif id(fragment) not in seen:
+            seen.add(id(fragment))
+            stack.append((fragment, True))
+            stack.extend((part, False) for part in fragment.parts
+                         if type(part) == Fragment and id(part) not in seen)
+
+    sizes = {}
+    for fragment in order:  # (parts first)
+        sizes[id(fragment)] = sum(sizes[id(part)] if type(part) == Fragment else len(part)
+                                  for part in fragment.parts)
+    counts = {}
+    for root in roots:
+        counts[id(root)] = counts.get(id(root), 0) + 1
+    for fragment in reversed(order):  # (parts last)
+        for part in fragment.parts:
+            if type(part) == Fragment:
+                counts[id(part)] = counts.get(id(part), 0) + counts.get(id(fragment), 0)
+    return counts, sizes
+
+
+def shared_subqueries(shapes: List[SANode]) -> List[Subquery]:
+    """the subqueries that are worth materializing: the subqueries that the
+    text of the queries would contain several times, longer than their
+    lookups, in the order of their materialization"""
+    shared: List[Subquery] = []
+    order = None
+    while True:
+        translation = _Translation(shapes, shared)
+        subqueries = translation.subqueries()
+        if order is None:
+            # (the conformance queries do not use fragment queries)
+            order = {subquery: i for i, subquery in enumerate(subqueries)}
+        counts, sizes = _counts(translation.updates + translation.queries)
+
+        new = []
+        for subquery, query in subqueries.items():
+            count, size = counts.get(id(query), 0), sizes.get(id(query), 0)
+            lookup = len(serialize(_lookup(subquery)))
+            # the text saved by the lookups, the text of the materialization
+            if subquery not in translation.lookups and \
+                    count * (size - lookup) > size + lookup:
+                new.append(subquery)
+        if not new:
+            return shared
+        # (a materialized subquery is a single use of its own subqueries,
+        # which may then no longer be worth materializing: they are not
+        # removed, but no more are added than needed)
+        shared = sorted(shared + new, key=order.get)
+
+
+def compile_shared(shapes: List[SANode]) -> Tuple[str, List[str]]:
+    """the materialization of the shared subqueries (a SPARQL Update) and
+    the fragment query of every shape"""
+    translation = _Translation(shapes, shared_subqueries(shapes))
+    update = ' ;\n'.join([f'DROP SILENT GRAPH <{SHARED_GRAPH}>'] +
+                         [serialize(update) for update in translation.updates])
+    return update, [serialize(query) for query in translation.queries]
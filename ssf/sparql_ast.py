@@ -0,0 +1,94 @@
+from functools import lru_cache
+from string import Formatter
+from typing import Iterable, List, Tuple, Union
+
+'''
+A lightweight syntax tree for building SPARQL queries.
+
+The query builders nest queries in templates many levels deep. Formatting
+the nested queries into strings copies the text of every subquery at
+every level, which is quadratic in the depth of a shape. Instead, the
+builders produce Fragments: a Fragment is a sequence of text pieces and
+other Fragments. A subquery is included by reference, so building a
+query is linear in the size of the tree (and a subquery that is used
+several times is only built once). The query text is produced once, by
+serialize, at the end of the translation.
+'''
+
+
+class Fragment:
+    """A piece of SPARQL: text interleaved with (shared) subfragments"""
+
+    __slots__ = ('parts',)
+
+    def __init__(self, parts: Iterable[Union[str, 'Fragment']]):
+        self.parts = tuple(parts)
+
+    def __add__(self, other: Union[str, 'Fragment']) -> 'Fragment':
+        return Fragment((self, other))
+
+    def __radd__(self, other: Union[str, 'Fragment']) -> 'Fragment':
+        return Fragment((other, self))
+
+    def __str__(self) -> str:
+        return serialize(self)
+
+    def __format__(self, format_spec: str) -> str:
+        return format(str(self), format_spec)
+
+    def __repr__(self) -> str:
+        return f'Fragment({str(self)!r})'
+
+
+def serialize(fragment: Union[str, Fragment]) -> str:
+    """the text of the fragment (without recursion)"""
+    out = []
+    stack = [fragment]
+    while stack:
+        item = stack.pop()
+        if type(item) == str:
+            out.append(item)
+        else:
+            stack.extend(reversed(item.parts))
+    return ''.join(out)
+
+
+@lru_cache(maxsize=None)
+def _parse_template(template: str) -> Tuple[Tuple[str, str], ...]:
+    # (text, field) pairs; Formatter splits the text at every escaped
+    # brace, the pieces of text are merged again
+    parsed = []
+    text = ''
+    for literal, field, _, _ in Formatter().parse(template):
+        text += literal
+        if field is not None:
+            parsed.append((text, field))
+            text = ''
+    parsed.append((text, None))
+    return tuple(parsed)
+
+
+def sparql(template: str, **fields: Union[str, Fragment]) -> Fragment:
+    """the template (str.format syntax) with its fields filled in
+
+    Fragments in fields are included by reference, other values are
+    converted with str.
+    """
+    parts = []
+    for literal, field in _parse_template(template):
+        if literal:
+            parts.append(literal)
+        if field is not None:
+            value = fields[field]
+            parts.append(value if type(value) == Fragment else str(value))
+    return Fragment(parts)
+
+
+def join(separator: str, fragments: List[Union[str, Fragment]]) -> Fragment:
+    """like str.join, for fragments"""
+    parts = []
+    for fragment in fragments:
+        if parts:
+            parts.append(separator)
+        parts.append(fragment)
+    return Fragment(parts)
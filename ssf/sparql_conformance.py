@@ -1,70 +1,77 @@
-from typing import List, Optional
+from typing import List, Optional, Sequence
 
 from rdflib import SH
 
+from ssf.sparql_ast import Fragment, sparql, join
+
+# The builders return Fragments (see ssf.sparql_ast): subqueries are
+# included by reference, the query text is only produced at the end.
+
 ## GENERAL
 
-def _build_query(body: str) -> str:
-    return f'SELECT ?v WHERE {{ {body} }}'
+def _build_query(body: Fragment) -> Fragment:
+    return sparql('SELECT ?v WHERE {{ {body} }}', body=body)
 
 ## TOP
 
-def _build_all_query() -> str:
-    return _build_query('{ ?v ?_a ?_b. } UNION { ?_c ?_d ?v }')
+_ALL_QUERY = _build_query('{ ?v ?_a ?_b. } UNION { ?_c ?_d ?v }')
+
+def _build_all_query() -> Fragment:
+    return _ALL_QUERY
+
+## BOT
+
+def _build_none_query() -> Fragment:
+    return _build_query('FILTER (false)')
 
 ## AND
 
-def _build_join(queries: List[str]) -> str:
-    out = ''
-    for query in queries:
-        out += f'{{ {query} }} . '
-    return _build_query(out[:-2])
+def _build_join(queries: List[Fragment]) -> Fragment:
+    return _build_query(join('. ', [sparql('{{ {query} }} ', query=query)
+                                    for query in queries]))
 
 ## OR
 
-def _build_union(queries: List[str]) -> str:
-    out = ''
-    for query in queries:
-        out += f'{{ {query} }} UNION '
-    return _build_query(out[:-6])
+def _build_union(queries: List[Fragment]) -> Fragment:
+    return _build_query(join('UNION ', [sparql('{{ {query} }} ', query=query)
+                                        for query in queries]))
 
 ## NOT
 
-def _build_negate(shape: str) -> str:
-    return _build_query(f'{{ {_build_all_query()} }} MINUS {{ {shape} }}')
+def _build_negate(shape: Fragment) -> Fragment:
+    return _build_query(sparql('{{ {all} }} MINUS {{ {shape} }}',
+                               all=_build_all_query(), shape=shape))
 
 ## CLOSED
 
-def _build_closed_query(properties: List[str]) -> str:
-    propstr = ''
-    for prop in properties:
-        propstr += prop + ', '
-    return _build_negate(f'?v ?p ?o FILTER (?p NOT IN ( {propstr[:-2]} ))')
+def _build_closed_query(properties: List[str]) -> Fragment:
+    propstr = ', '.join(properties)
+    return _build_negate(f'?v ?p ?o FILTER (?p NOT IN ( {propstr} ))')
 
 ## DISJOINT
 
-def _build_disjoint_query(path1: str, path2: str) -> str:
+def _build_disjoint_query(path1: str, path2: str) -> Fragment:
     '''N_G minus v {p1} o . v {p2} o'''
     return _build_negate(_build_not_disjoint_query(path1, path2))
 
-def _build_not_disjoint_query(path1: str, path2: str) -> str:
+def _build_not_disjoint_query(path1: str, path2: str) -> Fragment:
     return _build_query(f'''
     ?v {path1} ?o .
     ?v {path2} ?o
     ''')
 
-def _build_disjoint_id_query(path: str) -> str:
+def _build_disjoint_id_query(path: str) -> Fragment:
     return _build_negate(_build_not_disjoint_id_query(path))
 
-def _build_not_disjoint_id_query(path: str) -> str:
+def _build_not_disjoint_id_query(path: str) -> Fragment:
     return _build_query(f'?v {path} ?v')
 
 ## EQUALITY
 
-def _build_equality_query(path1: str, path2: str) -> str:
+def _build_equality_query(path1: str, path2: str) -> Fragment:
     return _build_negate(_build_not_equality_query(path1, path2))
 
-def _build_not_equality_query(path1: str, path2: str) -> str:
+def _build_not_equality_query(path1: str, path2: str) -> Fragment:
     return _build_query(f'''
     {{
       ?v {path1} ?o 
@@ -75,31 +82,31 @@ def _build_not_equality_query(path1: str, path2: str) -> str:
     }}
     ''')
 
-def _build_equality_id_query(path: str) -> str:
-    return _build_query(f'?v :p ?v . ?v :p ?o') + \
-    ' GROUP BY ?v HAVING (COUNT(?o) = 1) '
+def _build_equality_id_query(path: str) -> Fragment:
+    return _build_query(f'?v {path} ?v . ?v {path} ?o') + \
+    ' GROUP BY ?v HAVING (COUNT(DISTINCT ?o) = 1) '
 
 
-def _build_not_equality_id_query(path: str) -> str:
+def _build_not_equality_id_query(path: str) -> Fragment:
     return _build_negate(_build_equality_id_query(path))
 
 ## FORALL
 
-def _build_forall_query(path: str, shape: str) -> str:
+def _build_forall_query(path: str, shape: Fragment) -> Fragment:
     return _build_negate(
-        _build_query(f'''
+        _build_query(sparql('''
         ?v {path} ?o.
         {{
           SELECT (?v AS ?o)
-          WHERE {{ {_build_negate(shape)} }}
-        }}'''))
+          WHERE {{ {negated} }}
+        }}''', path=path, negated=_build_negate(shape))))
 
 
-def _build_forall_test_query(path: str, filter_condition: str):
-    # Note: neg_filter_condition must be the negation of the 
-    # original filter condition 
+def _build_forall_test_query(path: str, filter_condition: str) -> Fragment:
+    # the values that do not pass the test, also those for which the
+    # filter condition raises an error
     return _build_negate(
-        _build_query(f' ?v {path} ?o FILTER ( !({filter_condition}) ) '))
+        _build_query(f' ?v {path} ?o MINUS {{ ?v {path} ?o FILTER ({filter_condition}) }} '))
 
 ## COUNTRANGE
 
@@ -109,75 +116,89 @@ def _countrange_group_condition(mincount: int, maxcount: Optional[int]):
     if mincount == 1 and maxcount is None: # then it must only exist
         return ''
     if mincount == maxcount:
-        return f' GROUP BY ?v HAVING ( COUNT(?o) = {str(mincount)} )'
-    return f' GROUP BY ?v HAVING ( COUNT(?o) >= {str(mincount)} ' + \
-           f'{ f"&& COUNT(?o) <= {str(maxcount)} )" if maxcount else ")" }'
+        return f' GROUP BY ?v HAVING ( COUNT(DISTINCT ?o) = {str(mincount)} )'
+    return f' GROUP BY ?v HAVING ( COUNT(DISTINCT ?o) >= {str(mincount)} ' + \
+           f'{ f"&& COUNT(DISTINCT ?o) <= {str(maxcount)} )" if maxcount else ")" }'
 
 
 def _build_countrange_query(mincount: int, maxcount: Optional[int], 
-                            path: str, shape: str) -> str:
-    return _build_query(f'?v {path} ?o . ' + \
-                        f'{{ SELECT (?v AS ?o) WHERE {{ {shape} }} }}') + \
+                            path: str, shape: Fragment) -> Fragment:
+    return _build_query(sparql('?v {path} ?o . ' + \
+                               '{{ SELECT (?v AS ?o) WHERE {{ {shape} }} }}',
+                               path=path, shape=shape)) + \
         _countrange_group_condition(mincount, maxcount)
 
 
 def _build_countrange_top_query(mincount: int, maxcount: Optional[int], 
-                                path: str) -> str:
+                                path: str) -> Fragment:
     return _build_query(f'?v {path} ?o') + \
         _countrange_group_condition(mincount, maxcount)
         
 
 def _build_countrange_test_query(mincount: int, maxcount: Optional[int],
-                                 path: str, filter_condition: str) -> str:
+                                 path: str, filter_condition: str) -> Fragment:
     return _build_query(f'?v {path} ?o FILTER ({filter_condition})') + \
         _countrange_group_condition(mincount, maxcount)
 
 
-def _build_exists_hasvalue_query(path: str, value: str) -> str:
+def _build_exists_hasvalue_query(path: str, value: str) -> Fragment:
     return _build_query(f'?v {path} {value}')
 
 
-def _build_maxcount_qualified_query(num: int, path: str, shape: str) -> str:
+def _build_maxcount_qualified_query(num: int, path: str,
+                                    shape: Fragment) -> Fragment:
     return _build_negate(
-        _build_query(f'''
+        _build_query(sparql('''
 ?v {path} ?o .
 {{ SELECT (?v AS ?o) WHERE {{ {shape} }} }}
-''') + f' GROUP BY ?v HAVING (COUNT(?o) > {str(num)} )')
+''', path=path, shape=shape)) + f' GROUP BY ?v HAVING (COUNT(DISTINCT ?o) > {str(num)} )')
 
 
-def _build_maxcount_top_query(num: int, path: str) -> str:
+def _build_maxcount_top_query(num: int, path: str) -> Fragment:
     return _build_negate(
         _build_query(f'?v {path} ?o') + \
-            f' GROUP BY ?v HAVING (COUNT(?o) > {str(num)} )')
+            f' GROUP BY ?v HAVING (COUNT(DISTINCT ?o) > {str(num)} )')
 
 
 def _build_maxcount_test_query(num: int, path: str, 
-                               filter_condition: str) -> str:
+                               filter_condition: str) -> Fragment:
     return _build_negate(
         _build_query(f'?v {path} ?o FILTER ({filter_condition})') + \
-            f' GROUP BY ?v HAVING (COUNT(?o) > {str(num)} )')
+            f' GROUP BY ?v HAVING (COUNT(DISTINCT ?o) > {str(num)} )')
 
 
 ## LESSTHAN
 
-def _build_lt_query(path: str, prop: str) -> str:
-    return _build_query(f'?v {path} ?e ' + 
-        f'FILTER NOT EXISTS {{ ?v {prop} ?p FILTER ( ?e >= ?p )}}')
+def _build_comparison_query(path: str, prop: str, op: str) -> Fragment:
+    # the nodes minus those of which some pair of values violates the
+    # comparison (a node without values for path conforms)
+    return _build_negate(f'?v {path} ?e . ?v {prop} ?p FILTER ( ?e {op} ?p )')
+
+def _build_lt_query(path: str, prop: str) -> Fragment:
+    return _build_comparison_query(path, prop, '>=')
 
 ## LESSTHANEQ
 
-def _build_lte_query(path: str, prop: str) -> str:
-    return _build_query(f'?v {path} ?e' + 
-        f'FILTER NOT EXISTS {{ ?v {prop} ?p FILTER ( ?e > ?p )}}')
+def _build_lte_query(path: str, prop: str) -> Fragment:
+    return _build_comparison_query(path, prop, '>')
 
 ## HASVALUE
 
-def _build_hasvalue_query(value: str) -> str:
-    return _build_query(f'BIND ( <{str(value)}> AS ?v )')
+def _build_hasvalue_query(value: str) -> Fragment:
+    return _build_query(f'BIND ( {value} AS ?v )')
+
+
+def _build_values_query(values: List[str]) -> Fragment:
+    return _build_query(f'VALUES ?v {{ {" ".join(values)} }}')
+
+
+def _build_exists_values_query(path: str, values: List[str]) -> Fragment:
+    return sparql('SELECT DISTINCT ?v WHERE {{ ?v {path} ?_c VALUES ?_c {{ {values} }} }}',
+                  path=path, values=' '.join(values))
 
 ## UNIQUELANG
 
-def _build_uniquelang_query(path: str) -> str:
+def _build_uniquelang_query(path: str) -> Fragment:
     return _build_negate(
         _build_query(f'''
         SELECT ?v
@@ -190,9 +211,10 @@ def _build_uniquelang_query(path: str) -> str:
 
 ## TEST
 
-def _build_test_query(parameters: List, negate: bool=False) -> str:
-    return _build_query(
-        f'{{ {_build_all_query()} }} FILTER ({_build_filter_condition(parameters, negate=negate)})')
+def _build_test_query(parameters: Sequence) -> Fragment:
+    return _build_query(sparql(
+        '{{ {all} }} FILTER ({condition})', all=_build_all_query(),
+        condition=_build_filter_condition(parameters)))
 
 def _build_filter_condition(parameters: List, negate: bool=False, var: str='?v') -> str:
     neg = '!' if negate else ''
@@ -0,0 +1,119 @@
+from functools import reduce
+from typing import Dict, Optional
+
+import numpy as np
+from scipy import sparse
+
+from slsparser.pathls import PANode, POp
+
+'''
+Evaluation of paths on an EncodedGraph with sparse matrices.
+
+Every predicate is a sparse adjacency matrix over the term ids (CSR, with
+a 1 at (s, o) for every triple s p o), and a path is evaluated with
+matrix operations: an inverse path is a transpose, an alternative a sum,
+a sequence a product and p* a breadth-first search.
+
+A path can be evaluated from a set of seed nodes: the result only has the
+rows of the seeds. In a sequence, every step is evaluated from the
+frontier of the previous one (the value nodes it reached), and p* is a
+search from the seeds that only expands the nodes it has not reached
+yet. The identity of p* and p? is restricted to the domain (the subjects
+and objects of the graph), as in ssf.encoded. scipy is only needed for
+this module.
+'''
+
+Matrix = sparse.csr_matrix
+
+
+class PathEngine:
+    """Evaluates paths on a graph as sparse matrices
+
+    The matrices of the predicates and of the paths evaluated from all
+    nodes are kept.
+    """
+
+    def __init__(self, graph, domain: np.ndarray):
+        self.graph = graph
+        self.size = len(graph.terms)
+        self.domain = domain
+        self._in_domain = np.zeros(self.size, dtype=bool)
+        self._in_domain[domain] = True
+        self._matrices: Dict[PANode, Matrix] = {}
+
+    def matrix(self, path: PANode) -> Matrix:
+        """the matrix of path: (node, value) is 1 if value is a value of node"""
+        if path not in self._matrices:
+            self._matrices[path] = self.reach(path, None)
+        return self._matrices[path]
+
+    def reach(self, path: PANode, seeds: Optional[np.ndarray]) -> Matrix:
+        """the rows of the matrix of path for seeds (sorted ids, or None for
+        all nodes); the other rows are empty"""
+        if seeds is None and path in self._matrices:
+            return self._matrices[path]
+
+        if path.pop == POp.PROP:
+            p = self.graph.id(path.children[0])
+            if p is None:
+                return self._matrix([], [])
+            if path not in self._matrices:
+                self._matrices[path] = self._matrix(*self.graph.predicate(p))
+            return self._rows(self._matrices[path], seeds)
+
+        if path.pop == POp.INV:
+            return self._rows(self.matrix(path.children[0]).T.tocsr(), seeds)
+
+        if path.pop == POp.ALT:
+            reached = [self.reach(child, seeds) for child in path.children]
+            return _binary(reduce(lambda first, second: first + second, reached))
+
+        if path.pop == POp.COMP:
+            reached = self.reach(path.children[0], seeds)
+            for child in path.children[1:]:
+                reached = _binary(reached @ self.reach(child, _frontier(reached)))
+            return reached
+
+        identity = self._identity(self.domain if seeds is None
+                                  else seeds[self._in_domain[seeds]])
+
+        if path.pop == POp.KLEENE:
+            reached = identity
+            frontier = identity
+            while frontier.nnz:
+                step = _binary(frontier @ self.reach(path.children[0], _frontier(frontier)))
+                frontier = _binary(step - step.multiply(reached))
+                reached = _binary(reached + frontier)
+            return reached
+
+        if path.pop == POp.ZEROORONE:
+            return _binary(identity + self.reach(path.children[0], seeds))
+
+        raise ValueError(f'Cannot evaluate path: {path.pop}')
+
+    def _matrix(self, nodes, values) -> Matrix:
+        matrix = Matrix((np.ones(len(nodes), dtype=np.int32), (nodes, values)),
+                        shape=(self.size, self.size))
+        return _binary(matrix)
+
+    def _identity(self, ids: np.ndarray) -> Matrix:
+        return self._matrix(ids, ids)
+
+    def _rows(self, matrix: Matrix, seeds: Optional[np.ndarray]) -> Matrix:
+        if seeds is None:
+            return matrix
+        return self._identity(seeds) @ matrix
+
+
+def _frontier(matrix: Matrix) -> np.ndarray:
+    # the value nodes in matrix
+    return np.unique(matrix.indices)
+
+
+def _binary(matrix: Matrix) -> Matrix:
+    # the matrix with every non-zero entry set to 1
+    matrix = matrix.tocsr()
+    matrix.eliminate_zeros()
+    matrix.sum_duplicates()
+    matrix.data[:] = 1
+    return matrix
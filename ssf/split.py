@@ -0,0 +1,121 @@
+import threading
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor, \
+    as_completed
+from functools import partial
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional
+
+from rdflib import Graph
+from rdflib.plugins.sparql import prepareQuery
+from rdflib.query import Result
+from rdflib.term import Node
+from rdflib.util import guess_format
+
+from ssf.fragment import Triple
+
+'''
+Split execution of shape fragment queries.
+
+The union of the fragment queries of all shapes (see ssf.ssf --frag) is
+a single query: the engine evaluates it as a whole, and the rows of a
+fast shape wait for the slowest one. run_split instead runs the fragment
+query of every shape on its own, in a pool of workers, and yields the
+triples of each shape as soon as its query is done, with its time. The
+caller merges them (the shapes share triples: see
+ssf.fragmentwriter.FragmentWriter).
+
+The queries run on a data graph (rdflib) or on a SPARQL endpoint (HTTP,
+SPARQL results in JSON). In a thread pool the workers share one graph
+(and parse the queries one at a time); rdflib holds the GIL while it
+evaluates a query, so on a data graph a process pool (every worker
+parses the data file once) is what runs the queries in parallel. An
+endpoint evaluates them itself: threads suffice.
+
+Usage: see ssf.ssf --frag --split.
+'''
+
+Run = Callable[[str], List[Triple]]  # a query, the triples of its rows
+
+_graphs: Dict[str, Graph] = {}  # the data graphs of a worker, by file
+_parsing = threading.Lock()  # rdflib's query parser is not thread-safe
+
+
+class ShapeResult(NamedTuple):
+    """the outcome of the fragment query of a shape"""
+    shape: Node
+    triples: List[Triple]
+    seconds: float
+    error: Optional[str] = None  # the query failed, with this message
+
+
+def _triples(result: Result) -> List[Triple]:
+    # (the rows of the zero-length paths have no triple)
+    return [(row.s, row.p, row.o) for row in result if row.s is not None]
+
+
+def query_graph(graph: Graph, query: str) -> List[Triple]:
+    """the triples of the rows of a fragment query, evaluated by rdflib"""
+    with _parsing:
+        prepared = prepareQuery(query)
+    return _triples(graph.query(prepared))
+
+
+def query_file(path: str, query: str) -> List[Triple]:
+    """like query_graph, on the data graph in a file (parsed once per
+    process)"""
+    if path not in _graphs:
+        graph = Graph()
+        graph.parse(path, format=guess_format(path) or 'ttl')
+        _graphs[path] = graph
+    return query_graph(_graphs[path], query)
+
+
+def query_endpoint(url: str, query: str, timeout: Optional[float] = None) -> List[Triple]:
+    """the triples of the rows of a fragment query, evaluated by the SPARQL
+    endpoint at url"""
+    request = urllib.request.Request(
+        url, data=urllib.parse.urlencode({'query': query}).encode(),
+        headers={'Accept': 'application/sparql-results+json',
+                 'Content-Type': 'application/x-www-form-urlencoded'})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return _triples(Result.parse(response, format='json'))
+
+
+def source_query(source: str, processes: bool = False) -> Run:
+    """the function that runs a query on source: a SPARQL endpoint (an
+    http(s) URL) or the data graph in a file"""
+    if urllib.parse.urlparse(source).scheme in ['http', 'https']:
+        return partial(query_endpoint, source)
+    if processes:
+        return partial(query_file, source)  # (a graph per process)
+    graph = Graph()
+    graph.parse(source, format=guess_format(source) or 'ttl')
+    return partial(query_graph, graph)
+
+
+def _timed_run(run: Run, shape: Node, query: str) -> ShapeResult:
+    start = time.perf_counter()
+    try:
+        triples = run(query)
+    except Exception as e:
+        # (as text: not every exception can be sent back by a process)
+        return ShapeResult(shape, [], time.perf_counter() - start, f'{type(e).__name__}: {e}')
+    return ShapeResult(shape, triples, time.perf_counter() - start)
+
+
+def run_split(queries: Dict[Node, str], run: Run, workers: Optional[int] = None,
+              processes: bool = False) -> Iterator[ShapeResult]:
+    """the results of the fragment query of every shape (a mapping:
+    shapename, query), in the order in which they finish
+
+    workers is the size of the pool (by default the number of CPUs); with
+    processes, run must be picklable (see source_query).
+    """
+    pool: Executor = ProcessPoolExecutor(workers) if processes else ThreadPoolExecutor(workers)
+    with pool:
+        futures = [pool.submit(_timed_run, run, shape, query)
+                   for shape, query in queries.items()]
+        for future in as_completed(futures):
+            yield future.result()
@@ -1,11 +1,23 @@
 import sys
 import os
+import time
+from typing import List, Optional
+
 import slsparser.shapels as shapels
 from slsparser.shapels import SANode, Op
-from slsparser.utilities import negation_normal_form, expand_shape
+from slsparser.utilities import Normalizer, normalize, ShapeCycleError
+from slsparser.utilities import CLEAN_RULES, FRAGMENT_RULES
 
 from rdflib import Graph, URIRef, Namespace
+from rdflib.util import guess_format
 from ssf.sfquery import to_sfquery
+from ssf import cache
+from ssf.classindex import class_values_rule
+from ssf.fragment import Extractor, prepare, prepare_named
+from ssf.fragmentwriter import FragmentWriter, open_output
+from ssf.shared import compile_shared
+from ssf.split import run_split, source_query
+from ssf.incremental import IncrementalCompiler
 
 '''
 ssf stands for Sparql Shape Fragments
@@ -17,16 +29,49 @@ TODO: cleanup cmd argument parsing
 def _cmd_help():
     print('Help:')
     print(
-        f'{sys.argv[0]} [--frag [-i] | --bvg shape | --parser [-neo] shape | --show shape | --latex shape | --info ] file')
+        f'{sys.argv[0]} [--no-cache] [--frag [-i] [--watch] [--ontology onto] [--shared updates | --split source [--workers n] [--processes] [--output out]] | --extract data [-i] [--ontology onto] [--output out] | --bvg shape | --parser [-neo] shape | --show shape | --latex shape | --info ] file')
     print('Note: shape should be a prefixed iri where the prefix should be defined in the')
     print('      shapes graph. File should be a filename of a Turtle file containing a')
     print('      shapes graph.')
     print('Description:')
     print('Only one mode can be used at a time.')
+    print('    --no-cache')
+    print('        do not use (or fill) the cache of compiled shapes graphs. The')
+    print('        queries of --frag and --bvg are cached in $SSF_CACHE_DIR')
+    print('        (default ~/.cache/ssf), keyed by the file contents and options')
     print('    --frag [-i] file')
     print('        shows the SPARQL query representing the Shape Fragment of the')
     print('        shape schema given by file')
     print('        -i    ignore all test constraints')
+    print('        --watch  keep running, and print the query again every time')
+    print('                 file changes. Only changed shapes are recompiled')
+    print('        --ontology onto  take the class hierarchy from the ontology')
+    print('                 file onto: class targets and sh:class constraints')
+    print('                 list the subclasses in a VALUES block instead of')
+    print('                 using the path rdf:type/rdfs:subClassOf*')
+    print('        --shared updates  translate the subqueries that the shapes have')
+    print('                 in common once: they are materialized in a named')
+    print('                 graph by the SPARQL Update written to updates, to')
+    print('                 run on the dataset before the query (not cached)')
+    print('        --split source  run the query of every shape on its own,')
+    print('                 concurrently, on source (a data file or the URL of')
+    print('                 a SPARQL endpoint), and write the fragment as')
+    print('                 N-Triples, every triple once, with the time of every')
+    print('                 shape on stderr (the queries are those of --frag,')
+    print('                 with their known wrong results on rdflib)')
+    print('        --workers n  the number of queries that run at the same time')
+    print('                 (default: the number of CPUs)')
+    print('        --processes  run the queries in processes instead of threads')
+    print('                 (rdflib evaluates a query on a data file in one')
+    print('                 thread at a time; an endpoint does not need this)')
+    print('        --output out  as for --extract')
+    print('    --extract data [-i] [--output out] file')
+    print('        computes the Shape Fragment of the shape schema given by file')
+    print('        on the data graph in data, and writes it as N-Triples, every')
+    print('        triple once (with a fixed memory budget)')
+    print('        -i    ignore all test constraints')
+    print('        --output out  the output file instead of stdout (gzip')
+    print('                 compressed if out ends with .gz)')
     print('    --bvg shape file')
     print('        be default shows the SPARQL query representing the neighborhood')
     print('        of shape')
@@ -82,134 +127,98 @@ def _get_shapesgraph(filename):
     return shapesgraph
 
 
-def _replace_tests_with_top(tree: SANode) -> SANode:
-    new_children = []
-    for child in tree.children:
-        if type(child) == SANode and child.op == Op.TEST:
-            new_children.append(SANode(Op.TOP, []))
-        elif type(child) == SANode:  # and not child.op == Op.TEST
-            new_children.append(_replace_tests_with_top(child))
-        else:
-            new_children.append(child)
-    return SANode(tree.op, new_children)
+def _get_ontology(filename):
+    ontology = Graph()
+    try:
+        ontology.parse(filename, format=guess_format(filename) or 'ttl')
+    except Exception as e:
+        print(f'Could not parse ontology: {filename}')
+        print(e)
+        exit(1)
+    return ontology
 
 
-def _optimize_ignoring_tests(tree: SANode) -> SANode:
-    new_children = []
-    for child in tree.children:
-        if type(child) == SANode:
-            new_children.append(
-                _optimize_ignoring_tests(child))
-        else:
-            new_children.append(child)
+def _options(ontology_file: Optional[str] = None) -> List[str]:
+    # the options that change the output (the ontology by its contents)
+    options = sys.argv[1:-1]
+    if ontology_file is not None:
+        with open(ontology_file, 'rb') as f:
+            options = options + ['--ontology', cache.cache_key(f.read(), [])]
+    return options
 
-    tree = SANode(tree.op, new_children)
 
-    if tree.op == Op.AND:
-        # handle TOP children
-        if any(map(lambda c: c.op == Op.TOP, tree.children)):
-            new_children = list(filter(lambda c: c.op != Op.TOP, tree.children))
-            if len(new_children) == 0:
-                return SANode(Op.TOP, [])
-            elif len(new_children) == 1:
-                return new_children[0]
-            return SANode(Op.AND, new_children)
-
-        # handle NOT TOP children
-        if any(map(lambda c: c.op == Op.NOT and c.children[0].op == Op.TOP, tree.children)):
-            return SANode(Op.NOT, [SANode(Op.TOP, [])])
-
-    if tree.op == Op.OR:
-        # handle NOT TOP children
-        if any(map(lambda c: c.op == Op.NOT and c.children[0].op == Op.TOP, tree.children)):
-            new_children = list(filter(lambda c: not (c.op == Op.NOT and c.children[0].op == Op.TOP), tree.children))
-            if len(new_children) == 0:
-                return SANode(Op.NOT, [SANode(Op.TOP, [])])
-            elif len(new_children) == 1:
-                return new_children[0]
-            return SANode(Op.OR, new_children)
-
-        # handle multiple TOP
-        if any(map(lambda c: c.op == Op.TOP, tree.children)):
-            new_children = list(filter(lambda c: c.op != Op.TOP, tree.children))
-            if len(new_children) == 0:  # they were all TOP
-                return SANode(Op.TOP, [])
-            # they were not all TOP, but we need one to keep conformance semantics
-            new_children.append(SANode(Op.TOP, []))
-            return SANode(Op.OR, new_children)
-
-    if tree.op == Op.NOT:
-        if tree.children[0].op == Op.NOT and \
-                tree.children[0].children[0].op == Op.TOP:
-            return SANode(Op.TOP, [])
-
-    return tree
-
-
-def _optimize_exactly1(tree: SANode) -> SANode:
-    new_children = []
-    for child in tree.children:
-        if type(child) == SANode:
-            new_children.append(
-                _optimize_exactly1(child))
-        else:
-            new_children.append(child)
+def _compile_cached(filename: str, use_cache: bool, compile_output,
+                    options: Optional[List[str]] = None) -> str:
+    # The output of compile_output(shapesgraph, definitions, targets) is
+    # cached under the contents of the file and the options, a cache hit
+    # does not parse the shapes graph at all.
+    with open(filename, 'rb') as f:
+        key = cache.cache_key(f.read(), sys.argv[1:-1] if options is None else options)
 
-    tree = SANode(tree.op, new_children)
+    if use_cache:
+        entry = cache.load(key)
+        if entry is not None:
+            return entry.output
 
-    if tree.op == Op.AND:
-        # Optimization: if there is a GEQ 1 E TOP and LEQ 1 E TOP in its children, replace both with EXACTLY 1
-        is_geq_one_top = lambda c: c.op == Op.GEQ and \
-                                int(c.children[0]) == 1 and \
-                                c.children[2].op == Op.TOP
-        is_leq_one_top = lambda c: c.op == Op.LEQ and \
-                                int(c.children[0]) == 1 and \
-                                c.children[2].op == Op.TOP
-        if any(map(is_geq_one_top, tree.children)) and \
-                any(map(is_leq_one_top, tree.children)):
-            geq_one_tops = list(filter(is_geq_one_top, tree.children))
-            leq_one_tops = list(filter(is_leq_one_top, tree.children))
-
-            for geq_one in geq_one_tops:
-                for leq_one in leq_one_tops:
-                    if geq_one.children[1] == leq_one.children[1]:
-                        tree.children.append(SANode(Op.EXACTLY1, [geq_one.children[1]]))
-                        tree.children.remove(geq_one)
-                        tree.children.remove(leq_one)
-                        break
-
-            return SANode(Op.AND, tree.children)
+    shapesgraph = _get_shapesgraph(filename)
+    definitions, targets = shapels.parse(shapesgraph, indexed=True)
+    output = compile_output(shapesgraph, definitions, targets)
 
-    return tree
+    if use_cache:
+        namespaces = [(prefix, str(uri)) for prefix, uri in
+                      shapesgraph.namespace_manager.namespaces()]
+        cache.store(key, cache.CacheEntry.from_schema(
+            namespaces, output, definitions, targets))
+    return output
 
 
-def _cmd_frag():
-    filename = _get_filename()
-    shapesgraph = _get_shapesgraph(filename)
+def _rule_test_to_top(tree: SANode) -> Optional[SANode]:
+    if tree.op == Op.TEST:
+        return SANode(Op.TOP, [])
 
-    ignore_tests = '-i' in sys.argv  # if -i is in the options, ignore tests
 
-    definitions, targets = shapels.parse(shapesgraph, ignore_tests=False)
+def _rule_exactly1(tree: SANode) -> Optional[SANode]:
+    # Optimization: COUNTRANGE 1 1 E TOP, or a COUNTRANGE 1 None E TOP and
+    # COUNTRANGE 0 1 E TOP in the same conjunction, is EXACTLY 1 E
+    is_one_top = lambda c: c.op == Op.COUNTRANGE and \
+                            int(c.children[0]) == 1 and \
+                            c.children[1] is not None and \
+                            int(c.children[1]) == 1 and \
+                            c.children[3].op == Op.TOP
+    if is_one_top(tree):
+        return SANode(Op.EXACTLY1, [tree.children[2]])
 
+    if tree.op == Op.AND:
+        is_geq_one_top = lambda c: c.op == Op.COUNTRANGE and \
+                                int(c.children[0]) == 1 and \
+                                c.children[1] is None and \
+                                c.children[3].op == Op.TOP
+        is_leq_one_top = lambda c: c.op == Op.COUNTRANGE and \
+                                int(c.children[0]) == 0 and \
+                                c.children[1] is not None and \
+                                int(c.children[1]) == 1 and \
+                                c.children[3].op == Op.TOP
+        geq_one_tops = list(filter(is_geq_one_top, tree.children))
+        leq_one_tops = list(filter(is_leq_one_top, tree.children))
+
+        for geq_one in geq_one_tops:
+            for leq_one in leq_one_tops:
+                if geq_one.children[2] == leq_one.children[2]:
+                    new_children = list(tree.children)
+                    new_children.append(SANode(Op.EXACTLY1, [geq_one.children[2]]))
+                    new_children.remove(geq_one)
+                    new_children.remove(leq_one)
+                    return SANode(Op.AND, new_children)
+
+
+def _fragment_rules(ignore_tests: bool, ontology: Optional[Graph] = None) -> List:
     # expand every shape that is defined in the schema
     # put the shape in negation normal form
     # add its target statement as a conjunction
     # optimize this expression (remove redundancies from algebra)
-    prepared_shapes = []
-    for shape_name in definitions:
-        if shape_name not in targets or targets[shape_name] == SANode(Op.NOT, [SANode(Op.TOP, [])]):
-            continue  # we ignore the shapes that do not have any targets
-
-        prepared_shapes.append(
-            shapels.optimize_tree(
-                SANode(Op.AND, [
-                    negation_normal_form(
-                        expand_shape(definitions, definitions[shape_name])),
-                    targets[shape_name]
-                ])))
-
-    # Until now, everything is processed nicely as usual.
-    # However, when we know we want to ignore tests we can do some nice alterations
+    # All of this is done in a single pass by the normalizer.
+    #
+    # When we know we want to ignore tests we can do some nice alterations
     # on the syntax tree:
     # 1. Replace every occurrence of a test-node to a top-node
     # 2. Apply optimizations:
@@ -220,47 +229,210 @@ def _cmd_frag():
     #    - replace conjunctions with == 0 children with TOP
     #    - replace conjunctions with == 1 child with the child
     #    - search and replace "exactly one pattern"
+    #
+    # With an ontology, the class paths are replaced by the subclasses of
+    # the class (see classindex.class_values_rule).
+    rules = FRAGMENT_RULES
     if ignore_tests:
-        _eo_prepared_shapes = []
-        for shape in prepared_shapes:
-            _tt_shape = _replace_tests_with_top(shape)
-            _it_shape = _optimize_ignoring_tests(_tt_shape)
-            _eo_shape = _optimize_exactly1(_it_shape)
-            _eo_prepared_shapes.append(_eo_shape)
-        prepared_shapes = _eo_prepared_shapes
-
-    # translate every shape to a shape fragment query
-    shape_queries = []
-    for shape in prepared_shapes:
-        # here, the ignore_tests works only at translation time
-        shape_queries.append(to_sfquery(shape, ignore_tests=False))
+        rules = [_rule_test_to_top] + FRAGMENT_RULES + [_rule_exactly1]
+    if ontology is not None:
+        rules = [class_values_rule(ontology)] + rules
+    return rules
+
 
+def _union_query(shape_queries: List[str]) -> str:
     # take the union of every query as the total shape fragment query
-    fragment_query = 'SELECT ?v ?s ?p ?o WHERE { '
-    for query in shape_queries:
-        fragment_query += f'''
+    # (joined at once: the queries of a large schema are megabytes long)
+    parts = [f'''
         # new shape as query
-        {{ {query} }} UNION '''
+        {{ {query} }} ''' for query in shape_queries]
+    return 'SELECT ?v ?s ?p ?o WHERE { ' + 'UNION '.join(parts) + '}'
+
+
+def _cmd_frag(use_cache: bool = True, ontology_file: Optional[str] = None,
+              shared_file: Optional[str] = None):
+    filename = _get_filename()
+
+    ignore_tests = '-i' in sys.argv  # if -i is in the options, ignore tests
+    options = _options(ontology_file)
+    if shared_file is not None:
+        _cmd_frag_shared(filename, shared_file, ignore_tests, ontology_file)
+
+    def compile_frag(shapesgraph, definitions, targets):
+        ontology = None if ontology_file is None else _get_ontology(ontology_file)
+        # the queries of the shapes of the previous version of the file
+        # are reused for the shapes that did not change
+        state_key = cache.cache_key(os.path.abspath(filename).encode(),
+                                    ['incremental'] + options)
+        compiler = IncrementalCompiler(
+            _fragment_rules(ignore_tests, ontology),
+            cache.load_value(state_key) if use_cache else None)
+        try:
+            shape_queries = compiler.compile(definitions, targets)
+        except ShapeCycleError as e:
+            print(e)
+            exit(1)
+
+        if use_cache:
+            cache.store_value(state_key, compiler.queries)
+        return _union_query(shape_queries)
 
-    print(fragment_query[:-6] + '}')
+    print(_compile_cached(filename, use_cache, compile_frag, options))
     exit(0)
 
 
-def _cmd_bvg():
+def _cmd_frag_shared(filename: str, shared_file: str, ignore_tests: bool,
+                     ontology_file: Optional[str] = None):
+    # the subqueries in common are materialized by a separate update
+    ontology = None if ontology_file is None else _get_ontology(ontology_file)
+    definitions, targets = shapels.parse(_get_shapesgraph(filename), indexed=True)
+    try:
+        shapes = prepare(definitions, targets, _fragment_rules(ignore_tests, ontology))
+    except ShapeCycleError as e:
+        print(e)
+        exit(1)
+    update, shape_queries = compile_shared(shapes)
+    with open(shared_file, 'w') as f:
+        f.write(update + '\n')
+    print(_union_query(shape_queries))
+    exit(0)
+
+
+def _cmd_split(source: str, output_file: Optional[str] = None,
+               ontology_file: Optional[str] = None, workers: Optional[int] = None,
+               processes: bool = False):
     filename = _get_filename()
-    prefixed_shapename = sys.argv[-2]
+    ignore_tests = '-i' in sys.argv
+    ontology = None if ontology_file is None else _get_ontology(ontology_file)
     shapesgraph = _get_shapesgraph(filename)
-    shapename = _resolve_prefixed_shapename(shapesgraph.namespace_manager,
-                                            prefixed_shapename)
+    definitions, targets = shapels.parse(shapesgraph, indexed=True)
+    try:
+        shapes = prepare_named(definitions, targets, _fragment_rules(ignore_tests, ontology))
+    except ShapeCycleError as e:
+        print(e)
+        exit(1)
+    queries = {name: to_sfquery(shape) for name, shape in shapes.items()}
+    try:
+        run = source_query(source, processes)
+    except Exception as e:
+        print(f'Could not parse data: {source}')
+        print(e)
+        exit(1)
 
-    definitions, targets = shapels.parse(shapesgraph)
+    start = time.perf_counter()
+    failed = False
+    out = open_output(output_file)
+    with FragmentWriter(out) as writer:
+        for result in run_split(queries, run, workers, processes):
+            shape = result.shape.n3(shapesgraph.namespace_manager)
+            if result.error is not None:
+                failed = True
+                print(f'# {shape}: failed after {result.seconds:.3f} s: {result.error}',
+                      file=sys.stderr, flush=True)
+                continue
+            writer.write_all(result.triples)
+            print(f'# {shape}: {len(result.triples)} row(s) in {result.seconds:.3f} s',
+                  file=sys.stderr, flush=True)
+    if out is not sys.stdout:
+        out.close()
+    print(f'# {writer.written} triple(s) of {len(queries)} shape(s) in '
+          f'{time.perf_counter() - start:.3f} s', file=sys.stderr)
+    exit(1 if failed else 0)
+
+
+def _cmd_watch(interval: float = 0.5, ontology_file: Optional[str] = None):
+    filename = _get_filename()
+    ignore_tests = '-i' in sys.argv
+    ontology = None if ontology_file is None else _get_ontology(ontology_file)
+    compiler = IncrementalCompiler(_fragment_rules(ignore_tests, ontology))
 
-    if shapename not in definitions:
-        print(f'Shape {shapename} is not defined in {filename}')
+    last_modified = None
+    try:
+        while True:
+            try:
+                modified = os.stat(filename).st_mtime_ns
+            except OSError:
+                modified = None  # e.g. while an editor replaces the file
+            if modified is None or modified == last_modified:
+                time.sleep(interval)
+                continue
+            last_modified = modified
+
+            start = time.perf_counter()
+            shapesgraph = Graph()
+            try:
+                shapesgraph.parse(filename, format="ttl")
+                definitions, targets = shapels.parse(shapesgraph, indexed=True)
+                shape_queries = compiler.compile(definitions, targets)
+            except Exception as e:
+                # keep watching, the file is probably being edited
+                print(f'Could not compile file: {filename}', file=sys.stderr)
+                print(e, file=sys.stderr)
+                continue
+
+            print(_union_query(shape_queries), flush=True)
+            print(f'# compiled {compiler.compiled} shape(s), reused '
+                  f'{compiler.reused} in {time.perf_counter() - start:.3f} s',
+                  file=sys.stderr, flush=True)
+    except KeyboardInterrupt:
+        exit(0)
+
+
+def _cmd_extract(data_file: str, output_file: Optional[str] = None,
+                 ontology_file: Optional[str] = None):
+    filename = _get_filename()
+    ignore_tests = '-i' in sys.argv
+    ontology = None if ontology_file is None else _get_ontology(ontology_file)
+    definitions, targets = shapels.parse(_get_shapesgraph(filename), indexed=True)
+
+    datagraph = Graph()
+    try:
+        datagraph.parse(data_file, format=guess_format(data_file) or 'ttl')
+    except Exception as e:
+        print(f'Could not parse data: {data_file}')
+        print(e)
         exit(1)
 
-    print(to_sfquery(shapels.optimize_tree(negation_normal_form(
-        expand_shape(definitions, definitions[shapename])))))
+    start = time.perf_counter()
+    try:
+        shapes = prepare(definitions, targets, _fragment_rules(ignore_tests, ontology))
+    except ShapeCycleError as e:
+        print(e)
+        exit(1)
+    extractor = Extractor(datagraph)
+    out = open_output(output_file)
+    with FragmentWriter(out) as writer:
+        for shape in shapes:
+            writer.write_all(extractor.triples(shape))
+    if out is not sys.stdout:
+        out.close()
+    print(f'# extracted {writer.written} triple(s) in '
+          f'{time.perf_counter() - start:.3f} s', file=sys.stderr)
+    exit(0)
+
+
+def _cmd_bvg(use_cache: bool = True):
+    filename = _get_filename()
+    prefixed_shapename = sys.argv[-2]
+
+    def compile_bvg(shapesgraph, definitions, targets):
+        shapename = _resolve_prefixed_shapename(shapesgraph.namespace_manager,
+                                                prefixed_shapename)
+
+        if shapename not in definitions:
+            print(f'Shape {shapename} is not defined in {filename}')
+            exit(1)
+
+        try:
+            shape = normalize(definitions, SANode(Op.HASSHAPE, [shapename]),
+                              FRAGMENT_RULES)
+        except ShapeCycleError as e:
+            print(e)
+            exit(1)
+
+        return to_sfquery(shape)
+
+    print(_compile_cached(filename, use_cache, compile_bvg))
     exit(0)
 
 
@@ -271,7 +443,7 @@ def _cmd_parser():
     shapename = _resolve_prefixed_shapename(shapesgraph.namespace_manager,
                                             prefixed_shapename)
 
-    definitions, targets = shapels.parse(shapesgraph)
+    definitions, targets = shapels.parse(shapesgraph, indexed=True)
 
     option_n = False
     option_e = False
@@ -289,12 +461,13 @@ def _cmd_parser():
         exit(1)
 
     out = definitions[shapename]
-    if option_e:
-        out = expand_shape(definitions, out)
-    if option_n:
-        out = negation_normal_form(out)
-    if option_o:
-        out = shapels.optimize_tree(out)
+    if option_e or option_n or option_o:
+        try:
+            out = Normalizer(definitions, rules=CLEAN_RULES if option_o else [],
+                             expand=option_e, nnf=option_n)(out)
+        except ShapeCycleError as e:
+            print(e)
+            exit(1)
     print(out)
     exit(0)
 
@@ -306,16 +479,19 @@ def _cmd_latex():
     shapename = _resolve_prefixed_shapename(shapesgraph.namespace_manager,
                                             prefixed_shapename)
 
-    definitions, targets = shapels.parse(shapesgraph)
+    definitions, targets = shapels.parse(shapesgraph, indexed=True)
 
     if shapename not in definitions:
         print(f'Shape {shapename} is not defined in {filename}')
         exit(1)
 
-    out = shapels.optimize_tree(definitions[shapename])
+    try:
+        out = normalize(definitions, definitions[shapename], CLEAN_RULES)
+    except ShapeCycleError as e:
+        print(e)
+        exit(1)
 
-    print(shapels.sa_as_latex(negation_normal_form(
-        expand_shape(definitions, out))))
+    print(shapels.sa_as_latex(out, shapesgraph.namespace_manager))
     exit(0)
 
 
@@ -323,7 +499,7 @@ def _cmd_info():
     filename = sys.argv[-1]
     shapesgraph = _get_shapesgraph(filename)
 
-    definitions, targets = shapels.parse(shapesgraph)
+    definitions, targets = shapels.parse(shapesgraph, indexed=True)
 
     print('Defined prefixes:')
     for prefix, uri in shapesgraph.namespace_manager.namespaces():
@@ -332,8 +508,7 @@ def _cmd_info():
     shapes_with_target = []
     shapes_rest = []
     for shapename in definitions:
-        has_target = targets[shapename] != shapels.SANode(
-            shapels.Op.NOT, [shapels.SANode(shapels.Op.TOP, [])])
+        has_target = targets[shapename].op != shapels.Op.BOT
         if has_target:
             shapes_with_target.append(shapename.n3(shapesgraph.namespace_manager))
         else:
@@ -351,13 +526,80 @@ def _cmd_info():
 
 
 if __name__ == '__main__':
+    use_cache = '--no-cache' not in sys.argv
+    if not use_cache:
+        sys.argv.remove('--no-cache')
+    watch = '--watch' in sys.argv
+    if watch:
+        sys.argv.remove('--watch')
+    ontology_file = None
+    if '--ontology' in sys.argv:
+        index = sys.argv.index('--ontology')
+        if index + 2 >= len(sys.argv) or \
+                '--frag' not in sys.argv and '--extract' not in sys.argv:
+            _cmd_help()
+        ontology_file = sys.argv[index + 1]
+        if not os.path.exists(ontology_file):
+            print(f'Could not find file: {ontology_file}')
+            exit(1)
+        del sys.argv[index:index + 2]
+    shared_file = None
+    if '--shared' in sys.argv:
+        index = sys.argv.index('--shared')
+        if index + 2 >= len(sys.argv) or '--frag' not in sys.argv or watch:
+            _cmd_help()
+        shared_file = sys.argv[index + 1]
+        del sys.argv[index:index + 2]
+    split_source = workers = None
+    processes = '--processes' in sys.argv
+    if processes:
+        sys.argv.remove('--processes')
+    if '--workers' in sys.argv:
+        index = sys.argv.index('--workers')
+        if index + 2 >= len(sys.argv) or not sys.argv[index + 1].isdigit() or \
+                int(sys.argv[index + 1]) < 1:
+            _cmd_help()
+        workers = int(sys.argv[index + 1])
+        del sys.argv[index:index + 2]
+    if '--split' in sys.argv:
+        index = sys.argv.index('--split')
+        if index + 2 >= len(sys.argv) or '--frag' not in sys.argv or \
+                watch or shared_file is not None:
+            _cmd_help()
+        split_source = sys.argv[index + 1]
+        del sys.argv[index:index + 2]
+    elif processes or workers is not None:
+        _cmd_help()
+    data_file = output_file = None
+    if '--output' in sys.argv:
+        index = sys.argv.index('--output')
+        if index + 2 >= len(sys.argv) or \
+                '--extract' not in sys.argv and split_source is None:
+            _cmd_help()
+        output_file = sys.argv[index + 1]
+        del sys.argv[index:index + 2]
+    if '--extract' in sys.argv:
+        index = sys.argv.index('--extract')
+        if index + 2 >= len(sys.argv):
+            _cmd_help()
+        data_file = sys.argv[index + 1]
+        if not os.path.exists(data_file):
+            print(f'Could not find file: {data_file}')
+            exit(1)
+        del sys.argv[index + 1]
     argc = len(sys.argv)
 
     # if only a file name or frag
-    if argc == 2 or ('--frag' in sys.argv and 3 <= argc <= 4):
-        _cmd_frag()
+    if watch and '--frag' in sys.argv and 3 <= argc <= 4:
+        _cmd_watch(ontology_file=ontology_file)
+    elif data_file is not None and 3 <= argc <= 4:
+        _cmd_extract(data_file, output_file, ontology_file)
+    elif split_source is not None and 3 <= argc <= 4:
+        _cmd_split(split_source, output_file, ontology_file, workers, processes)
+    elif argc == 2 or ('--frag' in sys.argv and 3 <= argc <= 4):
+        _cmd_frag(use_cache, ontology_file, shared_file)
     elif '--bvg' in sys.argv and argc == 4:
-        _cmd_bvg()
+        _cmd_bvg(use_cache)
     elif '--parser' in sys.argv and 4 <= argc <= 5:
         _cmd_parser()
     elif '--latex' in sys.argv and argc == 4:
@@ -1,7 +1,11 @@
 from slsparser.shapels import SANode, Op
 from slsparser.pathls import PANode, POp
-from rdflib.namespace import SH, URIRef
-from typing import List, Optional
+from rdflib.namespace import SH
+from rdflib.term import BNode
+from typing import Dict, List, Optional
+
+from slsparser.utilities import postorder
+from ssf.sparql_ast import Fragment, serialize
 
 from ssf.sparql_conformance import (
     _build_all_query,
@@ -14,6 +18,7 @@ from ssf.sparql_conformance import (
     _build_equality_id_query,
     _build_equality_query,
     _build_exists_hasvalue_query,
+    _build_exists_values_query,
     _build_filter_condition,
     _build_forall_query,
     _build_forall_test_query,
@@ -25,61 +30,120 @@ from ssf.sparql_conformance import (
     _build_maxcount_test_query,
     _build_maxcount_top_query,
     _build_negate,
+    _build_none_query,
     _build_not_disjoint_id_query,
     _build_not_disjoint_query,
     _build_not_equality_id_query,
     _build_not_equality_query,
     _build_test_query,
     _build_union,
-    _build_uniquelang_query
+    _build_uniquelang_query,
+    _build_values_query
 )
 
 def to_path(node: PANode) -> str:
     """to sparql path"""
+    return postorder(node, lambda n: list(n.children) if n.pop != POp.PROP else [],
+                     _to_path_node)
+
+
+def _to_path_node(node: PANode, memo: Dict) -> str:
     if node.pop == POp.PROP:
         return '<' + str(node.children[0]) + '>'
 
     if node.pop == POp.INV:
-        return '^(' + to_path(node.children[0]) + ')'
+        return '^(' + memo[node.children[0]] + ')'
 
     if node.pop == POp.ALT:
-        out = ''
-        for child in node.children:
-            out += to_path(child) + '|'
-        return out[:-1]
+        return '|'.join(memo[child] for child in node.children)
 
     if node.pop == POp.COMP:
-        out = ''
-        for child in node.children:
-            out += to_path(child) + '/'
-        return out[:-1]
+        return '/'.join(memo[child] for child in node.children)
 
     if node.pop == POp.KLEENE:
-        return '(' + to_path(node.children[0]) + ')*'
+        return '(' + memo[node.children[0]] + ')*'
 
     if node.pop == POp.ZEROORONE:
-        return '(' + to_path(node.children[0]) + ')+'
+        return '(' + memo[node.children[0]] + ')?'
 
     return ''
 
-def to_uq(node: SANode) -> str:
-    """to unary query; assumes shape is expanded"""
+def to_uq(node: SANode, memo: Optional[Dict] = None) -> str:
+    """to unary query; assumes shape is expanded
+
+    The translations of the subshapes are stored in memo (if given), so
+    that it can be shared by several translations.
+    """
+    return serialize(build_uq(node, memo))
+
+
+def build_uq(node: SANode, memo: Optional[Dict] = None) -> Fragment:
+    """like to_uq, the query as a Fragment"""
+    return postorder(node, uq_dependencies, _to_uq_node, memo)
+
+
+def uq_dependencies(node: SANode) -> List[SANode]:
+    """the subshapes of which the unary query is part of the query of node"""
+    if node.op in [Op.AND, Op.OR]:
+        return list(node.children)
+
+    if node.op == Op.NOT:
+        if node.children[0].op in [Op.TEST, Op.EQ, Op.DISJ]:
+            return []
+        return [node.children[0]]
+
+    if node.op == Op.FORALL:
+        if node.children[1].op == Op.TEST:
+            return []
+        return [node.children[1]]
+
+    if node.op == Op.COUNTRANGE:
+        shape = node.children[3]
+        if shape.op in [Op.TEST, Op.TOP]:
+            return []
+        if int(node.children[0]) == 1 and shape.op == Op.HASVALUE:
+            return []
+        return [shape]
+
+    return []
+
+
+def _values(node: SANode) -> Optional[List[str]]:
+    """the values of a disjunction of HASVALUE nodes (that can be written
+    in a VALUES block), or None"""
+    if node.op != Op.OR or any(child.op != Op.HASVALUE or
+                               isinstance(child.children[0], BNode)
+                               for child in node.children):
+        return None
+    return [child.children[0].n3() for child in node.children]
+
+
+def _to_uq_node(node: SANode, memo: Dict) -> Fragment:
     if node.op == Op.HASSHAPE:
         raise ValueError('node must be expanded')
 
     if node.op == Op.TOP:
         return _build_all_query()
 
+    if node.op == Op.BOT:
+        return _build_none_query()
+
     if node.op == Op.AND:
-        return _build_join([to_uq(child) for child in node.children])
+        return _build_join([memo[child] for child in node.children])
 
     if node.op == Op.OR:
-        return _build_union([to_uq(child) for child in node.children])
+        values = _values(node)
+        if values is not None:
+            # Optimization: a disjunction of values (sh:in, the
+            # subclasses of a class) is a VALUES block
+            return _build_values_query(values)
+        return _build_union([memo[child] for child in node.children])
 
     if node.op == Op.NOT:
         child = node.children[0]
         if child.op == Op.TEST:
-            return _build_test_query(child.children, negate=True)
+            # the complement: a test that raises an error does not hold
+            return _build_negate(_build_test_query(child.children))
         if child.op == Op.EQ:
             if child.children[0].pop == POp.ID:
                 return _build_not_equality_id_query(to_path(child.children[1]))
@@ -91,7 +155,7 @@ def to_uq(node: SANode) -> str:
             return _build_not_disjoint_query(to_path(child.children[0]),
                                              to_path(child.children[1]))
 
-        return _build_negate(to_uq(node.children[0]))
+        return _build_negate(memo[node.children[0]])
 
     if node.op == Op.CLOSED:
         properties = []
@@ -100,7 +164,7 @@ def to_uq(node: SANode) -> str:
         return _build_closed_query(properties)
 
     if node.op == Op.DISJ:
-        if node.children[0] == POp.ID:
+        if node.children[0].pop == POp.ID:
             return _build_disjoint_id_query(to_path(node.children[1]))
         return _build_disjoint_query(to_path(node.children[0]),
                                      to_path(node.children[1]))
@@ -115,11 +179,11 @@ def to_uq(node: SANode) -> str:
         if node.children[1].op == Op.TEST:
             return _build_forall_test_query(to_path(node.children[0]), 
                                             _build_filter_condition(node.children[1].children, var = '?o'))
-        return _build_forall_query(to_path(node.children[0]), to_uq(node.children[1]))
+        return _build_forall_query(to_path(node.children[0]), memo[node.children[1]])
 
     if node.op == Op.COUNTRANGE:
         mincount = int(node.children[0])
-        maxcount = None if not node.children[1] else node.children[1]
+        maxcount = None if node.children[1] is None else int(node.children[1])
         path = to_path(node.children[2])
         shape = node.children[3]
 
@@ -130,14 +194,13 @@ def to_uq(node: SANode) -> str:
                                                 _build_filter_condition(shape.children))
             if shape.op == Op.TOP:
                 return _build_maxcount_top_query(maxcount, path)
-            return _build_maxcount_qualified_query(maxcount, path, to_uq(shape))
+            return _build_maxcount_qualified_query(maxcount, path, memo[shape])
 
         if mincount == 1 and shape.op == Op.HASVALUE:
-            value = shape.children[0]
-            str_value = str(value)
-            if isinstance(value, URIRef):
-                str_value = f'<{str_value}>'
-            return _build_exists_hasvalue_query(path, str_value)
+            return _build_exists_hasvalue_query(path, shape.children[0].n3())
+
+        if mincount == 1 and maxcount is None and _values(shape) is not None:
+            return _build_exists_values_query(path, _values(shape))
 
         if shape.op == Op.TEST:
             return _build_countrange_test_query(mincount, maxcount, path, 
@@ -146,7 +209,10 @@ def to_uq(node: SANode) -> str:
         if shape.op == Op.TOP:
             return _build_countrange_top_query(mincount, maxcount, path)
         
-        return _build_countrange_query(mincount, maxcount, path, to_uq(shape))
+        return _build_countrange_query(mincount, maxcount, path, memo[shape])
+
+    if node.op == Op.EXACTLY1:
+        return _build_countrange_top_query(1, 1, to_path(node.children[0]))
 
     if node.op == Op.LESSTHAN:
         return _build_lt_query(to_path(node.children[0]),
@@ -157,7 +223,7 @@ def to_uq(node: SANode) -> str:
                                 to_path(node.children[1]))
 
     if node.op == Op.HASVALUE:
-        return _build_hasvalue_query(node.children[0])
+        return _build_hasvalue_query(node.children[0].n3())
 
     if node.op == Op.UNIQUELANG:
         return _build_uniquelang_query(to_path(node.children[0]))
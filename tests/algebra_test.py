@@ -0,0 +1,37 @@
+from pytest import raises
+from rdflib import Graph, Namespace
+
+from slsparser.shapels import parse
+from slsparser.utilities import expand_shape
+from ssf.algebra import to_algebra_query, evaluate
+from ssf.conformance import conforms
+
+EX = Namespace('http://example.org/')
+
+
+def test_join_of_subqueries():
+    # the query text of this shape is evaluated wrongly by rdflib (see
+    # unaryquery_test), the algebra does not push bindings into subqueries
+    shapesgraph = Graph()
+    shapesgraph.parse('./tests/uq_user_manager_testfiles/knows_ceo.sh.ttl')
+    datagraph = Graph()
+    datagraph.parse('./tests/uq_user_manager_testfiles/data.ttl')
+
+    definitions, _ = parse(shapesgraph)
+    shape = expand_shape(definitions, definitions[EX.testshape])
+
+    assert evaluate(datagraph, to_algebra_query(shape)) == {EX.user2}
+
+
+def test_conforms_backends():
+    shapesgraph = Graph()
+    shapesgraph.parse('./tests/uq_user_manager_testfiles/user_managed.sh.ttl')
+    datagraph = Graph()
+    datagraph.parse('./tests/uq_user_manager_testfiles/data.ttl')
+
+    result = conforms(datagraph, shapesgraph, backend='algebra')
+    assert result == conforms(datagraph, shapesgraph, backend='sparql')
+    assert result == ([], [{EX.user2}])
+
+    with raises(ValueError):
+        conforms(datagraph, shapesgraph, backend='unknown')
@@ -0,0 +1,49 @@
+import os
+
+from rdflib import Graph
+
+from slsparser.shapels import parse
+from ssf import cache
+
+
+def _schema():
+    shapesgraph = Graph()
+    shapesgraph.parse('tests/uq_user_manager_testfiles/knows_ceo.sh.ttl',
+                      format='ttl')
+    return parse(shapesgraph)
+
+
+def test_entry_roundtrip(tmp_path):
+    definitions, targets = _schema()
+    entry = cache.CacheEntry.from_schema([('ex', 'http://example.org/')],
+                                         'SELECT', definitions, targets)
+    cache.store('key', entry, str(tmp_path))
+
+    loaded = cache.load('key', str(tmp_path))
+    assert loaded.output == 'SELECT'
+    assert loaded.namespaces == [('ex', 'http://example.org/')]
+    # hash-consing makes the decoded trees the very same objects
+    assert loaded.schema() == (definitions, targets)
+
+
+def test_missing_or_corrupt_entry(tmp_path):
+    assert cache.load('key', str(tmp_path)) is None
+    (tmp_path / 'key').write_bytes(b'garbage')
+    assert cache.load('key', str(tmp_path)) is None
+
+
+def test_key_depends_on_content_and_options():
+    assert cache.cache_key(b'a', ['--frag']) != cache.cache_key(b'b', ['--frag'])
+    assert cache.cache_key(b'a', ['--frag']) != cache.cache_key(b'a', ['--frag', '-i'])
+
+
+def test_least_recently_used_are_evicted(tmp_path):
+    entry = cache.CacheEntry.from_schema([], 'x' * 1000, {}, {})
+    size = len(entry.dumps())
+    for i, key in enumerate(['a', 'b', 'c']):
+        cache.store(key, entry, str(tmp_path))
+        os.utime(tmp_path / key, (i, i))
+    cache.load('a', str(tmp_path))  # a is now the most recently used
+
+    cache.evict(str(tmp_path), 2 * size)
+    assert sorted(os.listdir(tmp_path)) == ['a', 'c']
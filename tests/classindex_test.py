@@ -0,0 +1,104 @@
+import pytest
+from rdflib import Graph, Namespace
+from rdflib.namespace import RDF, RDFS
+
+from slsparser.shapels import SANode, Op
+from slsparser.pathls import PANode, POp
+from ssf.algebra import to_algebra_path
+from ssf.classindex import CLASS_PATH, class_index, class_values_rule
+from ssf.native import Evaluator
+from ssf.unaryquery import to_uq
+
+EX = Namespace('http://example.org/')
+
+
+def _graph():
+    graph = Graph()
+    graph.add((EX.Manager, RDFS.subClassOf, EX.Employee))
+    graph.add((EX.Employee, RDFS.subClassOf, EX.Person))
+    graph.add((EX.Person, RDFS.subClassOf, EX.Agent))
+    graph.add((EX.Agent, RDFS.subClassOf, EX.Person))  # a cycle
+    graph.add((EX.alice, RDF.type, EX.Manager))
+    graph.add((EX.bob, RDF.type, EX.Employee))
+    graph.add((EX.carol, RDF.type, EX.Thing))
+    return graph
+
+
+def _instances(graph, cls):
+    shape = SANode(Op.COUNTRANGE, [1, None, CLASS_PATH, SANode(Op.HASVALUE, [cls])])
+    return Evaluator(graph)(shape)
+
+
+def test_class_index():
+    graph = _graph()
+    index = class_index(graph)
+    assert index is class_index(graph)
+    assert index.superclasses(EX.Manager) == \
+        {EX.Manager, EX.Employee, EX.Person, EX.Agent}
+    assert index.superclasses(EX.Thing) == {EX.Thing}
+    assert index.classes()[EX.bob] == {EX.Employee, EX.Person, EX.Agent}
+
+    assert _instances(graph, EX.Person) == {EX.alice, EX.bob}
+    assert _instances(graph, EX.Person) == \
+        {row[0] for row in graph.query(to_uq(
+            SANode(Op.COUNTRANGE, [1, None, CLASS_PATH, SANode(Op.HASVALUE, [EX.Person])])))}
+
+
+def test_invalidation():
+    graph = _graph()
+    index = class_index(graph)
+
+    # new instances do not invalidate the index
+    graph.add((EX.dave, RDF.type, EX.Manager))
+    assert class_index(graph) is index
+    assert _instances(graph, EX.Agent) == {EX.alice, EX.bob, EX.dave}
+
+    graph.add((EX.Thing, RDFS.subClassOf, EX.Agent))
+    assert class_index(graph) is not index
+    assert _instances(graph, EX.Agent) == {EX.alice, EX.bob, EX.carol, EX.dave}
+
+    graph.remove((EX.Employee, RDFS.subClassOf, EX.Person))
+    assert _instances(graph, EX.Agent) == {EX.carol}
+
+
+def test_encoded_classes():
+    pytest.importorskip('numpy')
+    from ssf.encoded import EncodedGraph, Evaluator as EncodedEvaluator, _pairs
+
+    graph = _graph()
+    encoded = EncodedGraph.from_graph(graph)
+    classes = encoded.classes()
+    assert classes is encoded.classes()
+    nodes, values = _pairs(classes)
+    assert {(encoded.terms[n], encoded.terms[v]) for n, v in zip(nodes, values)} == \
+        set(graph.subject_objects(to_algebra_path(CLASS_PATH)))
+    shape = SANode(Op.COUNTRANGE, [1, None, CLASS_PATH, SANode(Op.HASVALUE, [EX.Person])])
+    assert EncodedEvaluator(encoded)(shape) == {EX.alice, EX.bob}
+
+
+def test_class_values_rule():
+    ontology = Graph()
+    for subclass, superclass in _graph().subject_objects(RDFS.subClassOf):
+        ontology.add((subclass, RDFS.subClassOf, superclass))
+    rule = class_values_rule(ontology)
+
+    person = SANode(Op.COUNTRANGE, [1, None, CLASS_PATH, SANode(Op.HASVALUE, [EX.Person])])
+    rewritten = rule(person)
+    assert rewritten.children[2] == PANode(POp.PROP, [RDF.type])
+    assert {child.children[0] for child in rewritten.children[3].children} == \
+        {EX.Manager, EX.Employee, EX.Person, EX.Agent}
+    assert rule(rewritten) is None
+    assert rule(SANode(Op.COUNTRANGE, [2, None, CLASS_PATH,
+                                       SANode(Op.HASVALUE, [EX.Person])])) is None
+
+    query = to_uq(rewritten)
+    assert 'VALUES' in query and 'subClassOf' not in query
+    # the data graph needs no class hierarchy
+    data = Graph()
+    for triple in _graph().triples((None, RDF.type, None)):
+        data.add(triple)
+    assert {row[0] for row in data.query(query)} == _instances(_graph(), EX.Person)
+
+    nobody = SANode(Op.COUNTRANGE, [0, 0, CLASS_PATH, SANode(Op.HASVALUE, [EX.Employee])])
+    assert Evaluator(data)(rule(nobody)) == \
+        Evaluator(_graph())(nobody) & set(data.all_nodes())
@@ -0,0 +1,93 @@
+from pytest import mark
+from rdflib import Graph, Namespace
+from rdflib.namespace import RDF
+
+from ssf.conformance import BACKENDS, CompiledSchema, conforms
+
+EX = Namespace('http://example.org/')
+
+
+@mark.parametrize('backend', ['algebra', 'native', 'sparql'])
+def test_compiled_schema_validates_many_graphs(backend):
+    shapesgraph = Graph()
+    shapesgraph.parse('./tests/uq_user_manager_testfiles/user_managed.sh.ttl')
+    schema = CompiledSchema(shapesgraph, backend)
+
+    datagraph = Graph()
+    datagraph.parse('./tests/uq_user_manager_testfiles/data.ttl')
+    assert schema.validate(datagraph) == conforms(datagraph, shapesgraph, backend)
+
+    message = Graph()
+    message.add((EX.user3, RDF.type, EX.user))
+    message.add((EX.manager4, EX.manages, EX.user3))
+    assert schema.validate(message) == ([], [{EX.user3}])
+    message.add((EX.manager5, EX.manages, EX.user3))
+    assert schema.validate(message) == ([{EX.user3}], [])
+    assert schema.validate(Graph()) == ([set()], [])
+
+
+def test_backends_agree_on_errors_and_comparisons():
+    # a comparison with an IRI raises an error, so the test of the
+    # negation does not hold; lessThan holds for all pairs of values
+    shapesgraph = Graph()
+    shapesgraph.parse(data='''
+        @prefix sh: <http://www.w3.org/ns/shacl#> .
+        @prefix ex: <http://example.org/> .
+        ex:S1 a sh:NodeShape ; sh:targetNode ex:a ;
+            sh:not [ sh:minInclusive 2 ] .
+        ex:S2 a sh:NodeShape ; sh:targetNode ex:b ;
+            sh:property [ sh:path ex:start ; sh:lessThan ex:end ] .
+        ''', format='ttl')
+    datagraph = Graph()
+    datagraph.parse(data='''
+        @prefix ex: <http://example.org/> .
+        ex:a ex:x 1 .
+        ex:b ex:start 1, 5 ; ex:end 3 .
+        ''', format='ttl')
+
+    for backend in BACKENDS:
+        assert conforms(datagraph, shapesgraph, backend) == ([{EX.a}], [{EX.b}])
+
+
+@mark.parametrize('backend', BACKENDS)
+def test_comparison_without_values(backend):
+    # a node without values for the path conforms to lessThan
+    shapesgraph = Graph()
+    shapesgraph.parse(data='''
+        @prefix sh: <http://www.w3.org/ns/shacl#> .
+        @prefix ex: <http://example.org/> .
+        ex:S1 a sh:NodeShape ; sh:targetNode ex:c, ex:d, ex:e ;
+            sh:property [ sh:path ex:start ; sh:lessThan ex:end ] .
+        ex:S2 a sh:NodeShape ; sh:targetNode ex:c, ex:d, ex:e ;
+            sh:property [ sh:path ex:start ; sh:lessThanOrEquals ex:end ] .
+        ''', format='ttl')
+    datagraph = Graph()
+    datagraph.parse(data='''
+        @prefix ex: <http://example.org/> .
+        ex:c ex:end 3 .
+        ex:d ex:start 1 ; ex:end 3 .
+        ex:e ex:start 3 ; ex:end 3 .
+        ''', format='ttl')
+
+    assert conforms(datagraph, shapesgraph, backend) == \
+        ([{EX.c, EX.d, EX.e}], [{EX.e}])
+
+
+@mark.parametrize('backend', BACKENDS)
+def test_results_are_not_shared(backend):
+    # the shapes have the same target: their sets of nodes are distinct
+    shapesgraph = Graph()
+    shapesgraph.parse(data='''
+        @prefix sh: <http://www.w3.org/ns/shacl#> .
+        @prefix ex: <http://example.org/> .
+        ex:S1 a sh:NodeShape ; sh:targetNode ex:a .
+        ex:S2 a sh:NodeShape ; sh:targetNode ex:a ; sh:nodeKind sh:IRI .
+        ''', format='ttl')
+    datagraph = Graph()
+    datagraph.add((EX.a, EX.p, EX.b))
+    schema = CompiledSchema(shapesgraph, backend)
+    valid, _ = schema.validate(datagraph)
+    assert valid == [{EX.a}, {EX.a}]
+    valid[0].clear()
+    assert valid[1] == {EX.a}
+    assert schema.validate(datagraph) == ([{EX.a}, {EX.a}], [])
@@ -0,0 +1,101 @@
+import pytest
+from pytest import mark
+from rdflib import Graph, Namespace
+from rdflib.namespace import RDF
+
+np = pytest.importorskip('numpy')
+
+from slsparser.shapels import parse
+from slsparser.utilities import Normalizer, CLEAN_RULES
+from ssf.conformance import CompiledSchema
+from ssf.encoded import EncodedGraph, evaluate
+from ssf.native import evaluate as native_evaluate
+from tests.native_test import SHAPE_FILES
+
+EX = Namespace('http://example.org/')
+
+
+def test_encoded_graph():
+    graph = Graph()
+    graph.add((EX.a, EX.p, EX.b))
+    graph.add((EX.a, EX.p, EX.c))
+    graph.add((EX.b, EX.q, EX.a))
+    encoded = EncodedGraph.from_triples(list(graph) + list(graph))
+
+    assert len(encoded) == 3
+    assert set(encoded.triples()) == set(graph)
+    a, p, b = encoded.id(EX.a), encoded.id(EX.p), encoded.id(EX.b)
+    assert encoded.id(EX.d) is None
+    assert encoded.s_offsets[a + 1] - encoded.s_offsets[a] == 2
+    assert encoded.o_offsets[b + 1] - encoded.o_offsets[b] == 1
+    subjects, objects = encoded.predicate(p)
+    assert {encoded.terms[i] for i in objects} == {EX.b, EX.c}
+    assert set(subjects) == {a}
+    assert {encoded.terms[i] for i in encoded.node_ids()} == {EX.a, EX.b, EX.c}
+
+
+@mark.parametrize('shape_file', SHAPE_FILES)
+def test_encoded_matches_native(shape_file):
+    shapesgraph = Graph()
+    shapesgraph.parse(shape_file)
+    datagraph = Graph()
+    datagraph.parse(shape_file.rsplit('/', 1)[0] + '/data.ttl')
+
+    definitions, _ = parse(shapesgraph)
+    shape = Normalizer(definitions, CLEAN_RULES)(definitions[EX.testshape])
+    assert evaluate(EncodedGraph.from_graph(datagraph), shape) == \
+        native_evaluate(datagraph, shape)
+
+
+@mark.parametrize('ratio', [0, 10 ** 9])
+def test_counts(ratio, monkeypatch):
+    # sorted and bincounted numbers of values
+    monkeypatch.setattr('ssf.encoded._BINCOUNT_RATIO', ratio)
+    for shape_file in SHAPE_FILES:
+        test_encoded_matches_native(shape_file)
+
+
+def test_encoded_backend():
+    shapesgraph = Graph()
+    shapesgraph.parse('./tests/uq_user_manager_testfiles/user_managed.sh.ttl')
+    schema = CompiledSchema(shapesgraph, 'encoded')
+
+    datagraph = Graph()
+    datagraph.parse('./tests/uq_user_manager_testfiles/data.ttl')
+    assert schema.validate(datagraph) == ([], [{EX.user2}])
+    assert schema.validate(EncodedGraph.from_graph(datagraph)) == ([], [{EX.user2}])
+
+    message = Graph()
+    message.add((EX.user3, RDF.type, EX.user))
+    assert schema.validate(message) == ([], [{EX.user3}])
+
+
+def test_save_and_open(tmp_path):
+    datagraph = Graph()
+    datagraph.parse('./tests/uq_tests_testfiles/data.ttl')
+    datagraph.parse('./tests/uq_user_manager_testfiles/data.ttl')
+    path = str(tmp_path / 'data.ssfg')
+    EncodedGraph.from_graph(datagraph).save(path)
+
+    opened = EncodedGraph.open(path)
+    assert isinstance(opened.spo, np.memmap)
+    assert set(opened.triples()) == set(datagraph)
+    for term in [EX.user1, EX.manages]:
+        assert opened.terms[opened.id(term)] == term
+    assert opened.id(EX.unknown) is None
+
+    shapesgraph = Graph()
+    shapesgraph.parse('./tests/uq_user_manager_testfiles/user_managed.sh.ttl')
+    schema = CompiledSchema(shapesgraph, 'encoded')
+    assert schema.validate(opened) == schema.validate(datagraph)
+
+
+def test_open_empty_and_invalid(tmp_path):
+    path = str(tmp_path / 'empty.ssfg')
+    EncodedGraph.from_triples([]).save(path)
+    assert len(EncodedGraph.open(path)) == 0
+
+    with open(path, 'wb') as f:
+        f.write(b'not a graph')
+    with pytest.raises(ValueError):
+        EncodedGraph.open(path)
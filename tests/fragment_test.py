@@ -0,0 +1,121 @@
+from rdflib import Graph, Literal, Namespace
+from rdflib.namespace import RDF
+
+from slsparser.shapels import parse, SANode, Op
+from slsparser.pathls import PANode, POp
+from slsparser.utilities import Normalizer, FRAGMENT_RULES
+from ssf.fragment import Extractor, extract, prepare
+from ssf.sfquery import to_sfquery
+
+EX = Namespace('http://example.org/')
+DIR = './tests/uq_user_manager_testfiles/'
+
+
+def _data():
+    datagraph = Graph()
+    datagraph.parse(DIR + 'data.ttl')
+    return datagraph
+
+
+def _testshape(shape_file):
+    shapesgraph = Graph()
+    shapesgraph.parse(DIR + shape_file)
+    definitions, _ = parse(shapesgraph)
+    return Normalizer(definitions, FRAGMENT_RULES)(definitions[EX.testshape])
+
+
+def _prop(name):
+    return PANode(POp.PROP, [EX[name]])
+
+
+def test_qualified_neighbourhood():
+    fragment = set(Extractor(_data()).triples(_testshape('knows_ceo.sh.ttl')))
+    assert fragment == {(EX.user2, EX.knows, EX.manager3),
+                        (EX.manager3, EX['CEO-of'], EX.MyCompany)}
+
+
+def test_only_conforming_nodes():
+    # manager3 has no givenName, its firstName is not in the fragment
+    fragment = set(Extractor(_data()).triples(_testshape('name_givenname.sh.ttl')))
+    assert fragment == {(EX.manager1, RDF.type, EX.manager),
+                        (EX.manager1, EX.firstName, Literal('Dantes')),
+                        (EX.manager1, EX.givenName, Literal('Dantes')),
+                        (EX.manager2, RDF.type, EX.manager)}
+
+
+def test_traces():
+    graph = Graph()
+    for s, o in [('a', 'b'), ('b', 'c'), ('c', 'b'), ('c', 'd')]:
+        graph.add((EX[s], EX.knows, EX[o]))
+    graph.add((EX.d, EX.name, Literal('d')))
+    extractor = Extractor(graph)
+    edge = lambda s, o: (EX[s], EX.knows, EX[o])
+
+    traces = extractor.traces(PANode(POp.KLEENE, [_prop('knows')]), EX.a)
+    assert traces[EX.a] == set()
+    assert traces[EX.b] == {edge('a', 'b'), edge('b', 'c'), edge('c', 'b')}
+    assert traces[EX.d] == {edge('a', 'b'), edge('b', 'c'), edge('c', 'b'), edge('c', 'd')}
+
+    path = PANode(POp.COMP, [PANode(POp.INV, [_prop('knows')]), _prop('knows')])
+    assert extractor.traces(path, EX.d) == {EX.b: {edge('c', 'b'), edge('c', 'd')},
+                                            EX.d: {edge('c', 'd')}}
+
+    path = PANode(POp.COMP, [PANode(POp.ZEROORONE, [_prop('knows')]), _prop('name')])
+    assert extractor.traces(path, EX.c) == \
+        {Literal('d'): {edge('c', 'd'), (EX.d, EX.name, Literal('d'))}}
+
+
+def test_violations():
+    graph = _data()
+    extractor = Extractor(graph)
+    closed = SANode(Op.NOT, [SANode(Op.CLOSED, [_prop('knows'), PANode(POp.PROP, [RDF.type])])])
+    assert set(extractor.triples(closed, [EX.user2])) == set()
+    assert set(extractor.triples(closed, [EX.manager3])) == \
+        {(EX.manager3, EX.firstName, Literal('Villefort')),
+         (EX.manager3, EX.onVacation, Literal(True)),
+         (EX.manager3, EX['CEO-of'], EX.MyCompany)}
+
+    different = SANode(Op.NOT, [SANode(Op.EQ, [_prop('colleague'), _prop('friend')])])
+    assert set(extractor.triples(different)) == \
+        {(EX.manager1, EX.friend, EX.manager2), (EX.user1, EX.colleague, EX.user2)}
+
+
+def test_extract():
+    shapesgraph = Graph()
+    shapesgraph.parse(DIR + 'user_managed.sh.ttl')
+    definitions, targets = parse(shapesgraph)
+    datagraph = _data()
+
+    fragment = extract(datagraph, definitions, targets)
+    assert set(fragment) == {(EX.user1, RDF.type, EX.user),
+                             (EX.manager1, EX.manages, EX.user1),
+                             (EX.manager2, EX.manages, EX.user1)}
+    query = to_sfquery(prepare(definitions, targets)[0])
+    # (the rows of the zero-length paths have no triple)
+    assert set(fragment) == {(row.s, row.p, row.o) for row in datagraph.query(query)
+                             if row.s is not None}
+
+
+def test_extract_literal_value():
+    shapesgraph = Graph()
+    shapesgraph.parse(DIR + 'manager_vacation.sh.ttl')
+    definitions, targets = parse(shapesgraph)
+    datagraph = _data()
+
+    fragment = extract(datagraph, definitions, targets)
+    assert (EX.manager3, EX.onVacation, Literal(True)) in fragment
+    query = to_sfquery(prepare(definitions, targets)[0])
+    assert set(fragment) == {(row.s, row.p, row.o) for row in datagraph.query(query)
+                             if row.s is not None}
+
+
+def test_deep_chain_without_recursion():
+    # n0 -> n1 -> ... -> n3000, and a shape that follows the whole chain
+    graph = Graph()
+    for i in range(3000):
+        graph.add((EX[f'n{i}'], EX.next, EX[f'n{i + 1}']))
+    shape = SANode(Op.HASVALUE, [EX.n3000])
+    for _ in range(3000):
+        shape = SANode(Op.COUNTRANGE, [Literal(1), None, _prop('next'), shape])
+    fragment = set(Extractor(graph).triples(shape, [EX.n0]))
+    assert fragment == set(graph)
@@ -0,0 +1,44 @@
+import gzip
+import io
+import random
+
+from pytest import mark
+from rdflib import Graph, Literal, Namespace
+
+from ssf.fragmentwriter import FragmentWriter, open_output
+
+EX = Namespace('http://example.org/')
+
+
+def _triples():
+    rng = random.Random(0)
+    triples = [(EX[f'n{rng.randrange(30)}'], EX.p, Literal(f'line\n{rng.randrange(30)}'))
+               for _ in range(500)]
+    return triples
+
+
+@mark.parametrize('limit', [1, 7, 100, 10000])
+def test_deduplication(limit, tmp_path):
+    out = io.StringIO()
+    with FragmentWriter(out, limit, str(tmp_path)) as writer:
+        writer.write_all(_triples())
+        if limit > 500:
+            # nothing spilled: the lines are written right away
+            assert out.getvalue()
+
+    lines = out.getvalue().splitlines()
+    assert len(lines) == len(set(lines)) == writer.written == len(set(_triples()))
+    graph = Graph()
+    graph.parse(data=out.getvalue(), format='nt')
+    assert set(graph) == set(_triples())
+    assert list(tmp_path.iterdir()) == []  # (the runs are removed)
+
+
+def test_gzip_output(tmp_path):
+    path = str(tmp_path / 'fragment.nt.gz')
+    out = open_output(path)
+    with FragmentWriter(out) as writer:
+        writer.write_all(_triples())
+    out.close()
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        assert len(f.read().splitlines()) == len(set(_triples()))
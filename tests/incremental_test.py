@@ -0,0 +1,50 @@
+from rdflib import Graph, Namespace
+
+from slsparser.shapels import parse
+from slsparser.utilities import FRAGMENT_RULES
+from ssf.incremental import IncrementalCompiler, shape_fingerprints
+
+EX = Namespace('http://example.org/')
+
+SHAPES = '''
+@prefix sh: <http://www.w3.org/ns/shacl#> .
+@prefix : <http://example.org/> .
+:a a sh:NodeShape ; sh:targetClass :A ;
+    sh:property [ sh:path :p ; sh:node :b ] .
+:b a sh:NodeShape ; sh:property [ sh:path :q ; sh:minCount %d ] .
+:c a sh:NodeShape ; sh:targetClass :C ;
+    sh:property [ sh:path :r ; sh:maxCount 1 ] .
+'''
+
+
+def _schema(mincount: int):
+    shapesgraph = Graph()
+    shapesgraph.parse(data=SHAPES % mincount, format='ttl')
+    return parse(shapesgraph)
+
+
+def test_fingerprints_do_not_depend_on_blank_node_names():
+    # every parse gives the property shapes new blank nodes
+    first = shape_fingerprints(_schema(1)[0])
+    second = shape_fingerprints(_schema(1)[0])
+    for name in [EX.a, EX.b, EX.c]:
+        assert first[name] == second[name]
+
+
+def test_fingerprints_cover_references():
+    first = shape_fingerprints(_schema(1)[0])
+    second = shape_fingerprints(_schema(2)[0])
+    assert first[EX.a] != second[EX.a]  # :a refers to :b
+    assert first[EX.b] != second[EX.b]
+    assert first[EX.c] == second[EX.c]
+
+
+def test_only_changed_shapes_are_recompiled():
+    compiler = IncrementalCompiler(FRAGMENT_RULES)
+    compiler.compile(*_schema(1))
+    assert (compiler.compiled, compiler.reused) == (2, 0)
+
+    queries = compiler.compile(*_schema(2))
+    assert (compiler.compiled, compiler.reused) == (1, 1)
+    assert sorted(queries) == \
+        sorted(IncrementalCompiler(FRAGMENT_RULES).compile(*_schema(2)))
@@ -0,0 +1,49 @@
+import pytest
+from rdflib import Graph, Literal, Namespace
+
+pytest.importorskip('numpy')
+
+from ssf.loader import byte_ranges, load
+
+EX = Namespace('http://example.org/')
+
+
+def _datagraph() -> Graph:
+    graph = Graph()
+    graph.parse('./tests/uq_tests_testfiles/data.ttl')
+    graph.parse('./tests/uq_user_manager_testfiles/data.ttl')
+    graph.add((EX.node1, EX.comment, Literal('a "quoted"\nline with separators')))
+    return graph
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_load_ntriples(tmp_path, processes):
+    graph = _datagraph()
+    path = str(tmp_path / 'data.nt')
+    graph.serialize(path, format='nt', encoding='utf-8')
+
+    assert len(byte_ranges(path, 100)) > 1
+    loaded = load(path, processes, chunk_size=100)
+    assert len(loaded) == len(graph)
+    assert set(loaded.triples()) == set(graph)
+
+
+def test_load_nquads(tmp_path):
+    path = str(tmp_path / 'data.nq')
+    with open(path, 'w') as f:
+        f.write('# a comment\n\n')
+        f.write('<http://example.org/a> <http://example.org/p> "1"^^<http://www.w3.org/2001/XMLSchema#integer> <http://example.org/g1> .\n')
+        f.write('<http://example.org/a> <http://example.org/p> "01"^^<http://www.w3.org/2001/XMLSchema#integer> <http://example.org/g2> .\n')
+        f.write('_:b1 <http://example.org/p> <http://example.org/a> .\n')
+
+    loaded = load(path, 1)
+    assert len(loaded) == 2  # the literals are the same integer
+    assert (EX.a, EX.p, Literal(1)) in set(loaded.triples())
+
+
+def test_invalid_line(tmp_path):
+    path = str(tmp_path / 'data.nt')
+    with open(path, 'w') as f:
+        f.write('<http://example.org/a> <http://example.org/p> .\n')
+    with pytest.raises(ValueError):
+        load(path, 1)
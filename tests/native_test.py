@@ -0,0 +1,75 @@
+import glob
+
+from pytest import mark
+from rdflib import Graph, Namespace
+
+from slsparser.shapels import parse
+from slsparser.utilities import Normalizer, CLEAN_RULES, expand_shape
+from ssf.conformance import BACKENDS, conforms
+from ssf.native import evaluate
+from ssf.unaryquery import to_uq
+
+EX = Namespace('http://example.org/')
+
+SHAPE_FILES = sorted(f for f in glob.glob('./tests/uq_*_testfiles/*.ttl')
+                     if not f.endswith('data.ttl'))
+
+
+@mark.parametrize('shape_file', SHAPE_FILES)
+@mark.parametrize('normalized', [False, True])
+def test_native_matches_unary_query(shape_file, normalized):
+    shapesgraph = Graph()
+    shapesgraph.parse(shape_file)
+    datagraph = Graph()
+    datagraph.parse(shape_file.rsplit('/', 1)[0] + '/data.ttl')
+
+    definitions, _ = parse(shapesgraph)
+    if normalized:
+        shape = Normalizer(definitions, CLEAN_RULES)(definitions[EX.testshape])
+    else:
+        shape = expand_shape(definitions, definitions[EX.testshape])
+
+    if shape_file.endswith('knows_ceo.sh.ttl'):
+        expected = {EX.user2}  # rdflib evaluates the query wrongly
+    else:
+        expected = {row[0] for row in datagraph.query(to_uq(shape))}
+    assert evaluate(datagraph, shape) == expected
+
+
+
+DATA = '''
+@prefix ex: <http://example.org/> .
+ex:a ex:x 1 ; ex:start 1, 3 ; ex:end 3 .
+ex:b ex:x ex:b ; ex:start 1 ; ex:end 0 .
+'''
+
+
+@mark.parametrize('constraints, conforming', [
+    # ex:zz is not a node of the graph, so not in a complement
+    ('sh:and ( [ sh:in ( ex:a ex:zz ) ] [ sh:not [ sh:minInclusive 2 ] ] )', {EX.a}),
+    ('sh:or ( [ sh:in ( ex:zz ) ] [ sh:not [ sh:nodeKind sh:IRI ] ] )', {EX.zz}),
+    # the distinct values are counted
+    ('sh:property [ sh:path [ sh:alternativePath ( ex:x ex:x ) ] ; sh:maxCount 1 ]',
+     {EX.a, EX.b}),
+    # a comparison with an IRI raises an error, the test does not hold
+    ('sh:property [ sh:path ex:x ; sh:maxExclusive 2 ]', {EX.a}),
+    ('sh:property [ sh:path ex:start ; sh:lessThanOrEquals ex:end ]', {EX.a}),
+    ('sh:disjoint ex:x', {EX.a}),
+])
+def test_backends_agree_beyond_fixtures(constraints, conforming):
+    shapesgraph = Graph()
+    shapesgraph.parse(data=f'''
+        @prefix sh: <http://www.w3.org/ns/shacl#> .
+        @prefix ex: <http://example.org/> .
+        ex:S a sh:NodeShape ; sh:targetNode ex:a, ex:b, ex:zz ; {constraints} .
+        ''', format='ttl')
+    datagraph = Graph()
+    datagraph.parse(data=DATA, format='ttl')
+
+    targets = {EX.a, EX.b, EX.zz}
+    for backend in BACKENDS:
+        result = conforms(datagraph, shapesgraph, backend)
+        if conforming == targets:
+            assert result == ([targets], [])
+        else:
+            assert result == ([], [targets - conforming])
@@ -0,0 +1,75 @@
+import random
+
+import pytest
+from pytest import mark
+from rdflib import Graph, Namespace
+
+np = pytest.importorskip('numpy')
+
+from slsparser.shapels import parse
+from slsparser.utilities import Normalizer, CLEAN_RULES
+from ssf.encoded import EncodedGraph, Evaluator
+from ssf.native import evaluate as native_evaluate
+from ssf.nodeset import (BACKENDS, SMALL, DenseNodeSet, RunNodeSet, SmallNodeSet,
+                         from_ids)
+from tests.native_test import SHAPE_FILES
+
+EX = Namespace('http://example.org/')
+
+
+def _random_ids(rng, size):
+    # a mix of runs and scattered ids
+    ids = set()
+    for _ in range(rng.randrange(4)):
+        start = rng.randrange(size)
+        ids.update(range(start, min(size, start + rng.randrange(size // 2))))
+    ids.update(rng.sample(range(size), rng.randrange(size // 4)))
+    return ids
+
+
+def test_operations():
+    rng = random.Random(0)
+    for _ in range(200):
+        size1, size2 = rng.choice([(50, 50), (40, 60), (3 * SMALL, 2 * SMALL)])
+        ids1, ids2 = _random_ids(rng, size1), _random_ids(rng, size2)
+        for backend1 in BACKENDS + [None]:
+            for backend2 in BACKENDS + [None]:
+                nodes1 = from_ids(np.array(sorted(ids1), dtype=np.int32), size1, backend1)
+                nodes2 = from_ids(np.array(sorted(ids2), dtype=np.int32), size2, backend2)
+                assert set((nodes1 & nodes2).ids().tolist()) == ids1 & ids2
+                assert set((nodes1 | nodes2).ids().tolist()) == ids1 | ids2
+                assert set((nodes1 - nodes2).ids().tolist()) == ids1 - ids2
+                assert len(nodes1 | nodes2) == len(ids1 | ids2)
+                probe = np.arange(max(size1, size2) + 2, dtype=np.int32)
+                assert probe[nodes1.contains(probe)].tolist() == sorted(ids1)
+
+
+def test_backend_choice():
+    size = 100 * SMALL
+    assert isinstance(from_ids(np.arange(10, dtype=np.int32), size), SmallNodeSet)
+    assert isinstance(from_ids(np.arange(size // 2, dtype=np.int32), size), RunNodeSet)
+    scattered = np.arange(0, size, 2, dtype=np.int32)
+    assert isinstance(from_ids(scattered, size), DenseNodeSet)
+
+    # results are converted when another backend fits them better
+    everything = from_ids(np.arange(size, dtype=np.int32), size, 'dense')
+    assert isinstance(everything - from_ids(np.arange(5, size, dtype=np.int32), size),
+                      SmallNodeSet)
+    assert isinstance(everything - from_ids(scattered[:10], size), RunNodeSet)
+
+    with pytest.raises(ValueError):
+        from_ids(scattered, size, 'roaring')
+
+
+@mark.parametrize('backend', BACKENDS)
+@mark.parametrize('shape_file', SHAPE_FILES)
+def test_evaluator_backends(shape_file, backend):
+    shapesgraph = Graph()
+    shapesgraph.parse(shape_file)
+    datagraph = Graph()
+    datagraph.parse(shape_file.rsplit('/', 1)[0] + '/data.ttl')
+
+    definitions, _ = parse(shapesgraph)
+    shape = Normalizer(definitions, CLEAN_RULES)(definitions[EX.testshape])
+    evaluator = Evaluator(EncodedGraph.from_graph(datagraph), backend)
+    assert evaluator(shape) == native_evaluate(datagraph, shape)
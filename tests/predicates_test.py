@@ -0,0 +1,62 @@
+from decimal import Decimal
+
+import pytest
+from pytest import mark
+from rdflib import BNode, Literal, Namespace, SH, XSD, RDF
+
+from ssf.predicates import compile_test
+
+EX = Namespace('http://example.org/')
+
+TERMS = [
+    EX.a, BNode(), Literal('abc'), Literal('ABC', datatype=XSD.string),
+    Literal('chat', lang='fr'), Literal('hello', lang='en-US'), Literal('hi', lang='en'),
+    Literal(5), Literal(-3), Literal(10), Literal(2**70), Literal(Decimal('4.5')),
+    Literal(4.999999999999), Literal(float('nan')), Literal(float('inf')),
+    Literal('abc', datatype=XSD.integer), Literal('7', datatype=XSD.string),
+    Literal(True), Literal('2020-01-01', datatype=XSD.date),
+    Literal('x', datatype=EX.custom), Literal(''),
+]
+
+TESTS = [
+    [SH.PatternConstraintComponent, Literal('^a'), []],
+    [SH.PatternConstraintComponent, Literal('^a'), [Literal('i')]],
+    [SH.PatternConstraintComponent, Literal('\\\\d'), []],
+    [SH.DatatypeConstraintComponent, XSD.string],
+    [SH.DatatypeConstraintComponent, XSD.integer],
+    [SH.DatatypeConstraintComponent, RDF.langString],
+    [SH.NodeKindConstraintComponent, SH.IRI],
+    [SH.NodeKindConstraintComponent, SH.BlankNodeOrLiteral],
+    [SH.NodeKindConstraintComponent, SH.IRIOrLiteral],
+    ['numeric_range', SH.MinInclusiveConstraintComponent, Literal(5)],
+    ['numeric_range', SH.MinExclusiveConstraintComponent, Literal(-3),
+     SH.MaxExclusiveConstraintComponent, Literal(Decimal('4.5'))],
+    ['numeric_range', SH.MaxInclusiveConstraintComponent, Literal(5.0)],
+    ['numeric_range', SH.MinInclusiveConstraintComponent,
+     Literal('2019-01-01', datatype=XSD.date)],
+    ['length_range', SH.MinLengthConstraintComponent, Literal(3)],
+    ['length_range', SH.MinLengthConstraintComponent, Literal(1),
+     SH.MaxLengthConstraintComponent, Literal(4)],
+    [SH.LanguageInConstraintComponent, [Literal('en'), Literal('fr')]],
+]
+
+
+@mark.parametrize('parameters', TESTS)
+def test_compiled_matches_filter(parameters):
+    test = compile_test(parameters)
+    for term in TERMS:
+        assert test(term) == test.fallback(term), term
+
+
+@mark.parametrize('parameters', [t for t in TESTS if t[0] == 'numeric_range'])
+def test_numeric_column(parameters):
+    pytest.importorskip('numpy')
+    from ssf.encoded import EncodedGraph, Evaluator
+    from slsparser.shapels import SANode, Op
+
+    graph = EncodedGraph.from_triples([(EX.s, EX.p, term) for term in TERMS])
+    test = SANode(Op.TEST, parameters)
+    ids = graph.node_ids()
+    passes = Evaluator(graph).holds(test, ids)
+    assert [graph.terms[i] for i in ids[passes]] == \
+        [graph.terms[i] for i in ids if compile_test(parameters)(graph.terms[i])]
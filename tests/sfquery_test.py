@@ -0,0 +1,64 @@
+import random
+
+from pytest import mark
+from rdflib import Graph, Namespace
+
+from slsparser.pathls import PANode, POp
+from ssf.fragment import Extractor
+from ssf.sfquery import graph_paths
+
+EX = Namespace('http://example.org/')
+
+
+def _prop(i):
+    return PANode(POp.PROP, [EX[f'p{i}']])
+
+
+def _inv(path):
+    return PANode(POp.INV, [path])
+
+
+PATHS = [
+    _prop(0),
+    _inv(_prop(0)),
+    PANode(POp.COMP, [_prop(0), _prop(1)]),
+    PANode(POp.COMP, [_prop(0), _inv(_prop(1)), _prop(2)]),
+    PANode(POp.COMP, [_prop(0), PANode(POp.COMP, [_prop(1), _prop(1)])]),
+    PANode(POp.ALT, [PANode(POp.COMP, [_prop(0), _prop(1)]), _inv(_prop(2))]),
+]
+
+
+def _graph():
+    rng = random.Random(1)
+    graph = Graph()
+    for _ in range(60):
+        graph.add((EX[f'n{rng.randrange(15)}'], EX[f'p{rng.randrange(3)}'],
+                   EX[f'n{rng.randrange(15)}']))
+    return graph
+
+
+def _traced_rows(graph, path):
+    extractor = Extractor(graph)
+    return {(t, *triple, h) for t in graph.all_nodes()
+            for h, triples in extractor.traces(path, t).items()
+            for triple in triples}
+
+
+@mark.parametrize('path', PATHS)
+def test_specialized_graph_paths(path):
+    graph = _graph()
+    query = str(graph_paths(path))
+    assert query.count('SELECT') <= 1 + (path.pop == POp.ALT) * len(path.children)
+    rows = {tuple(row) for row in graph.query(query)}
+    assert rows == _traced_rows(graph, path)
+
+
+@mark.parametrize('path', [_inv(_prop(0)), _inv(PANode(POp.ALT, [_prop(0), _prop(1)]))])
+def test_general_inverse(path):
+    # the general construction swaps ?t and ?h through fresh variables
+    # (a SELECT that binds ?t while it is in scope is not valid SPARQL)
+    graph = _graph()
+    query = str(graph_paths(path, specialized=False))
+    assert '(?h AS ?t)' not in query.split('WHERE')[0]
+    rows = {tuple(row) for row in graph.query(query) if row.s is not None}
+    assert rows == _traced_rows(graph, path)
@@ -0,0 +1,83 @@
+import pickle
+
+from pytest import raises
+from rdflib import Graph, Namespace, Literal
+
+from slsparser.shapels import SANode, Op, parse, sa_as_latex
+from slsparser.pathls import PANode, POp
+from slsparser.utilities import normalize, CLEAN_RULES
+
+EX = Namespace('http://example.org/')
+
+
+def test_structurally_equal_nodes_are_identical():
+    path = PANode(POp.COMP, [PANode(POp.PROP, [EX.p]), PANode(POp.PROP, [EX.q])])
+    shape1 = SANode(Op.COUNTRANGE, [Literal(1), None, path, SANode(Op.TOP, [])])
+    shape2 = SANode(Op.COUNTRANGE, [Literal(1), None,
+                                    PANode(POp.COMP, [PANode(POp.PROP, [EX.p]),
+                                                      PANode(POp.PROP, [EX.q])]),
+                                    SANode(Op.TOP, [])])
+    assert shape1 is shape2
+    assert {shape1: 'x'}[shape2] == 'x'
+    assert SANode(Op.TOP, []) is not SANode(Op.BOT, [])
+    # values that compare equal but differ in type are kept apart
+    assert SANode(Op.COUNTRANGE, [1, None, path, SANode(Op.TOP, [])]) is not shape1
+
+
+def test_nodes_are_immutable():
+    node = SANode(Op.AND, [SANode(Op.TOP, [])])
+    assert node.children == (SANode(Op.TOP, []),)
+    with raises(AttributeError):
+        node.children = []
+
+
+def test_pickle_roundtrip_interns():
+    node = SANode(Op.TEST, [EX.test, ['a', 'b']])
+    assert pickle.loads(pickle.dumps(node)) is node
+
+
+def test_shared_property_shape_is_shared():
+    shapesgraph = Graph()
+    shapesgraph.parse(data='''
+    @prefix sh: <http://www.w3.org/ns/shacl#> .
+    @prefix : <http://example.org/> .
+    :a a sh:NodeShape ; sh:property [ sh:path :p ; sh:minCount 1 ] .
+    :b a sh:NodeShape ; sh:property [ sh:path :p ; sh:minCount 1 ] .
+    ''', format='ttl')
+    definitions, _ = parse(shapesgraph)
+    propertyshapes = [d for name, d in definitions.items()
+                      if name not in (EX.a, EX.b)]
+    assert len(propertyshapes) == 2
+    assert propertyshapes[0] is propertyshapes[1]
+
+
+def test_indexed_parse_matches_graph_parse():
+    shapesgraph = Graph()
+    shapesgraph.parse(data='''
+    @prefix sh: <http://www.w3.org/ns/shacl#> .
+    @prefix : <http://example.org/> .
+    :a a sh:NodeShape ; sh:targetClass :C ; sh:closed true ;
+        sh:ignoredProperties ( :q ) ;
+        sh:property [ sh:path ( :p [ sh:inversePath :q ] ) ;
+                      sh:qualifiedValueShape :b ; sh:qualifiedMinCount 1 ] .
+    :b sh:or ( [ sh:in ( :x :y ) ] [ sh:datatype :dt ] ) ;
+        sh:not [ sh:pattern "^a" ; sh:flags "i" ] .
+    ''', format='ttl')
+    assert parse(shapesgraph, indexed=True) == parse(shapesgraph)
+
+
+def test_sa_as_latex():
+    graph = Graph().parse(format='ttl', data='''
+        @prefix sh: <http://www.w3.org/ns/shacl#> .
+        @prefix ex: <http://example.org/> .
+        ex:s a sh:NodeShape ; sh:targetNode ex:a ;
+            sh:not [ sh:hasValue ex:b_1 ] ;
+            sh:property [ sh:path ( ex:p [ sh:inversePath ex:q ] ) ;
+                          sh:minCount 1 ; sh:maxCount 2 ] .
+        ''')
+    definitions, _ = parse(graph)
+    shape = normalize(definitions, definitions[EX.s], CLEAN_RULES)
+    latex = sa_as_latex(shape, graph.namespace_manager)
+    assert r'\neg \mathrm{hasValue}(\texttt{ex:b\_1})' in latex
+    assert r'{\geq_{1}} (\texttt{ex:p} / (\texttt{ex:q})^{-}).\top' in latex
+    assert r'{\leq_{2}} (\texttt{ex:p} / (\texttt{ex:q})^{-}).\top' in latex
@@ -0,0 +1,66 @@
+from rdflib import Dataset, Graph
+
+from slsparser.shapels import parse
+from ssf.fragment import extract, prepare
+from ssf.sfquery import to_sfquery
+from ssf.shared import CONFORMANCE, FRAGMENT, SHARED_GRAPH, compile_shared, \
+    shared_subqueries
+from ssf.ssf import _union_query
+
+SHAPES = '''
+@prefix sh: <http://www.w3.org/ns/shacl#> .
+@prefix xsd: <http://www.w3.org/2001/XMLSchema#> .
+@prefix ex: <http://example.org/> .
+
+ex:Address a sh:NodeShape ;
+    sh:property [ sh:path ex:street ; sh:minCount 1 ; sh:datatype xsd:string ] .
+ex:named sh:path ex:name ; sh:minCount 1 .
+
+ex:person a sh:NodeShape ; sh:targetClass ex:Person ;
+    sh:property ex:named , [ sh:path ex:address ; sh:node ex:Address ] .
+ex:company a sh:NodeShape ; sh:targetClass ex:Company ;
+    sh:property ex:named , [ sh:path ex:address ; sh:node ex:Address ] .
+'''
+
+DATA = '''
+@prefix ex: <http://example.org/> .
+
+ex:alice a ex:Person ; ex:name "Alice" ; ex:address ex:a1 .
+ex:bob a ex:Person ; ex:name "Bob" ; ex:address ex:a2 .
+ex:acme a ex:Company ; ex:name "ACME" ; ex:address ex:a1, ex:a2 .
+ex:a1 ex:street "Main Street" ; ex:zip 1000 .
+ex:a2 ex:street "Side Street" .
+'''
+
+
+def _schema():
+    definitions, targets = parse(Graph().parse(data=SHAPES, format='ttl'), indexed=True)
+    return definitions, targets, prepare(definitions, targets)
+
+
+def test_shared_subqueries():
+    _, _, shapes = _schema()
+    shared = shared_subqueries(shapes)
+    assert {kind for kind, _ in shared} == {CONFORMANCE, FRAGMENT}
+    update, queries = compile_shared(shapes)
+    assert update.count('INSERT') == len(shared)
+    plain = _union_query([to_sfquery(shape) for shape in shapes])
+    assert len(_union_query(queries)) < len(plain)
+
+
+def test_shared_fragment():
+    definitions, targets, shapes = _schema()
+    data = Graph().parse(data=DATA, format='ttl')
+    dataset = Dataset()
+    for triple in data:
+        dataset.add(triple)
+    update, queries = compile_shared(shapes)
+    dataset.update(update)
+    fragment = {(row.s, row.p, row.o) for row in dataset.query(_union_query(queries))
+                if row.s is not None}
+    # (rdflib evaluates the renaming subqueries of the fragment queries
+    # wrongly, with or without shared subqueries: the rows of the nodes
+    # that are not targeted, or do not conform, are not removed. All
+    # nodes conform to a targeted shape here)
+    assert fragment == set(extract(data, definitions, targets))
+    assert len(dataset.graph(SHARED_GRAPH)) > 0
@@ -0,0 +1,27 @@
+from ssf.sparql_ast import Fragment, sparql, join, serialize
+
+
+def test_template_fields():
+    inner = sparql('SELECT ?v WHERE {{ ?v {p} ?o }}', p='<http://example.org/p>')
+    outer = sparql('{{ {q} }} UNION {{ {q} }}', q=inner)
+    assert str(outer) == \
+        '{ SELECT ?v WHERE { ?v <http://example.org/p> ?o } } UNION ' \
+        '{ SELECT ?v WHERE { ?v <http://example.org/p> ?o } }'
+    # the subquery is included by reference
+    assert outer.parts[1] is inner and outer.parts[3] is inner
+
+
+def test_join_and_concatenation():
+    assert str(join('. ', ['a ', Fragment(['b ']), 'c '])) == 'a . b . c '
+    assert str(join('UNION ', [])) == ''
+    assert str('x' + Fragment(['y']) + 'z') == 'xyz'
+    assert f'{Fragment(["y"])}' == 'y'
+
+
+def test_deep_fragment_serializes():
+    query = Fragment(['?v ?p ?o'])
+    for _ in range(10000):
+        query = sparql('SELECT ?v WHERE {{ {q} }}', q=query)
+    text = serialize(query)
+    assert text.startswith('SELECT ?v WHERE { SELECT ?v WHERE {')
+    assert text.count('SELECT') == 10000
@@ -0,0 +1,82 @@
+import random
+
+import pytest
+from pytest import mark
+from rdflib import Graph, Namespace
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('scipy')
+
+from slsparser.pathls import PANode, POp
+from slsparser.shapels import parse
+from slsparser.utilities import Normalizer, CLEAN_RULES
+from ssf.encoded import EncodedGraph, Evaluator, _pairs
+from ssf.native import evaluate as native_evaluate
+from ssf.sparsepath import PathEngine
+from tests.native_test import SHAPE_FILES
+
+EX = Namespace('http://example.org/')
+
+
+def _graph():
+    rng = random.Random(1)
+    graph = Graph()
+    for _ in range(150):
+        graph.add((EX[f'n{rng.randrange(40)}'], EX[f'p{rng.randrange(3)}'],
+                   EX[f'n{rng.randrange(40)}']))
+    return EncodedGraph.from_graph(graph)
+
+
+def _prop(i):
+    return PANode(POp.PROP, [EX[f'p{i}']])
+
+
+PATHS = [
+    _prop(0),
+    PANode(POp.PROP, [EX.unknown]),
+    PANode(POp.INV, [_prop(1)]),
+    PANode(POp.ALT, [_prop(0), PANode(POp.INV, [_prop(2)])]),
+    PANode(POp.COMP, [_prop(0), _prop(1), _prop(2)]),
+    PANode(POp.KLEENE, [_prop(1)]),
+    PANode(POp.ZEROORONE, [_prop(2)]),
+    PANode(POp.COMP, [_prop(0), PANode(POp.KLEENE, [PANode(POp.INV, [_prop(2)])])]),
+    PANode(POp.KLEENE, [PANode(POp.COMP, [_prop(0), _prop(1)])]),
+]
+
+
+@mark.parametrize('path', PATHS)
+def test_sparse_matches_keys(path):
+    graph = _graph()
+    sparse = Evaluator(graph, paths='sparse').relation(path)
+    keys = Evaluator(graph, paths='keys').relation(path)
+    assert np.array_equal(sparse, keys)
+
+
+@mark.parametrize('path', PATHS)
+def test_reach_from_seeds(path):
+    graph = _graph()
+    engine = PathEngine(graph, graph.node_ids())
+    seeds = graph.node_ids()[::3]
+    reached = engine.reach(path, seeds).tocoo()
+    nodes, values = _pairs(Evaluator(graph, paths='keys').relation(path))
+    expected = set(zip(nodes[np.isin(nodes, seeds)].tolist(),
+                       values[np.isin(nodes, seeds)].tolist()))
+    assert set(zip(reached.row.tolist(), reached.col.tolist())) == expected
+
+
+@mark.parametrize('shape_file', SHAPE_FILES)
+def test_sparse_evaluator(shape_file):
+    shapesgraph = Graph()
+    shapesgraph.parse(shape_file)
+    datagraph = Graph()
+    datagraph.parse(shape_file.rsplit('/', 1)[0] + '/data.ttl')
+
+    definitions, _ = parse(shapesgraph)
+    shape = Normalizer(definitions, CLEAN_RULES)(definitions[EX.testshape])
+    evaluator = Evaluator(EncodedGraph.from_graph(datagraph), paths='sparse')
+    assert evaluator(shape) == native_evaluate(datagraph, shape)
+
+
+def test_unknown_paths():
+    with pytest.raises(ValueError):
+        Evaluator(_graph(), paths='dense')
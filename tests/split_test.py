@@ -0,0 +1,98 @@
+import threading
+from functools import partial
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs
+
+import pytest
+from rdflib import Graph, Namespace
+
+from slsparser.shapels import parse
+from ssf.fragment import prepare_named
+from ssf.sfquery import to_sfquery
+from ssf.split import query_endpoint, query_graph, run_split, source_query
+from ssf.ssf import _union_query
+
+EX = Namespace('http://example.org/')
+DIR = './tests/uq_user_manager_testfiles/'
+
+SHAPES = '''
+@prefix sh: <http://www.w3.org/ns/shacl#> .
+@prefix : <http://example.org/> .
+
+:managers a sh:NodeShape ; sh:targetClass :manager ;
+    sh:property [ sh:path :firstName ; sh:equals :givenName ] .
+:users a sh:NodeShape ; sh:targetClass :user ;
+    sh:property [ sh:path :colleague ; sh:minCount 1 ] .
+:known a sh:NodeShape ; sh:targetObjectsOf :knows ;
+    sh:property [ sh:path :CEO-of ; sh:minCount 1 ] .
+'''
+
+
+def _queries():
+    definitions, targets = parse(Graph().parse(data=SHAPES, format='ttl'), indexed=True)
+    return {name: to_sfquery(shape)
+            for name, shape in prepare_named(definitions, targets).items()}
+
+
+def _data():
+    datagraph = Graph()
+    datagraph.parse(DIR + 'data.ttl')
+    return datagraph
+
+
+@pytest.mark.parametrize('processes', [False, True])
+def test_run_split(processes):
+    queries = _queries()
+    run = source_query(DIR + 'data.ttl', processes)
+    results = list(run_split(queries, run, 2, processes))
+
+    assert sorted(result.shape for result in results) == sorted(queries)
+    for result in results:
+        assert result.error is None
+        assert result.seconds >= 0
+    # the fragment of --split is the fragment of the union query of --frag
+    rows = _data().query(_union_query(list(queries.values())))
+    fragment = {(row.s, row.p, row.o) for row in rows if row.s is not None}
+    triples = {triple for result in results for triple in result.triples}
+    assert triples == fragment
+    assert (EX.manager3, EX['CEO-of'], EX.MyCompany) in triples
+    assert (EX.user1, EX.colleague, EX.user2) in triples
+
+
+def test_failed_query():
+    results = list(run_split({EX.shape: 'SELECT ?s WHERE {'},
+                             partial(query_graph, _data())))
+    assert len(results) == 1
+    assert results[0].triples == [] and results[0].error is not None
+
+
+class _Endpoint(BaseHTTPRequestHandler):
+    graph = None
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length'])).decode()
+        result = self.graph.query(parse_qs(body)['query'][0])
+        payload = result.serialize(format='json')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/sparql-results+json')
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_query_endpoint():
+    datagraph = _data()
+    _Endpoint.graph = datagraph
+    server = HTTPServer(('127.0.0.1', 0), _Endpoint)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        url = f'http://127.0.0.1:{server.server_port}/sparql'
+        query = _queries()[EX.known]
+        triples = query_endpoint(url, query)
+        assert set(triples) == set(query_graph(datagraph, query))
+        assert (EX.manager3, EX['CEO-of'], EX.MyCompany) in triples
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -6,6 +6,7 @@ from rdflib import Literal
 from slsparser.shapels import parse
 from slsparser.utilities import expand_shape
 from ssf.unaryquery import to_uq
+from ssf.algebra import to_algebra_query, evaluate
 
 EX = Namespace('http://example.org/')
 
@@ -55,6 +56,7 @@ def _unary_query_helper(folder, shape_file, expected_nodes):
         resultset.add(row[0])
 
     assert resultset == set(expected_nodes)
+    assert evaluate(datagraph, to_algebra_query(expanded_testshape)) == set(expected_nodes)
 
 def test_simple_query():
     datagraph = Graph()
@@ -70,4 +72,22 @@ def test_simple_query():
     assert resultset == set()
 
 def test_personshape():
-    _unary_query_helper('uq_other_testfiles', 'personshape.ttl', [])
\ No newline at end of file
+    _unary_query_helper('uq_other_testfiles', 'personshape.ttl', [])
+
+def test_literal_values():
+    shapesgraph = Graph()
+    shapesgraph.parse(data='''
+        @prefix sh: <http://www.w3.org/ns/shacl#> .
+        @prefix ex: <http://example.org/> .
+        ex:testshape a sh:NodeShape ; sh:or ( [ sh:hasValue true ]
+                     [ sh:property [ sh:path ex:p ; sh:hasValue "x"@en ] ] ) .
+        ''', format='ttl')
+    datagraph = Graph()
+    datagraph.add((EX.a, EX.p, Literal('x', lang='en')))
+    datagraph.add((EX.b, EX.p, Literal(True)))
+
+    definitions, _ = parse(shapesgraph)
+    shape = expand_shape(definitions, definitions[EX.testshape])
+    expected = {Literal(True), EX.a}
+    assert {row[0] for row in datagraph.query(to_uq(shape))} == expected
+    assert evaluate(datagraph, to_algebra_query(shape)) == expected
@@ -0,0 +1,82 @@
+from pytest import raises
+from rdflib import Graph, Namespace, Literal
+
+from slsparser.shapels import SANode, Op, parse
+from slsparser.pathls import PANode, POp
+from slsparser.utilities import expand_shape, ShapeCycleError
+from slsparser.utilities import normalize, Normalizer, FRAGMENT_RULES
+from ssf.unaryquery import to_uq
+
+EX = Namespace('http://example.org/')
+
+SHAPES = '''
+@prefix sh: <http://www.w3.org/ns/shacl#> .
+@prefix : <http://example.org/> .
+:a a sh:NodeShape ; sh:node :b .
+:b a sh:NodeShape ; sh:node :c ; sh:class :X .
+:c a sh:NodeShape ; sh:node :a .
+:e a sh:NodeShape ; sh:node :f, :g .
+:f a sh:NodeShape ; sh:class :Y .
+:g a sh:NodeShape ; sh:node :f ; sh:class :Z .
+'''
+
+
+def _definitions():
+    shapesgraph = Graph()
+    shapesgraph.parse(data=SHAPES, format='ttl')
+    return parse(shapesgraph)[0]
+
+
+def test_expand_shape_shares_expansions():
+    definitions = _definitions()
+    memo = {}
+    expanded_e = expand_shape(definitions, definitions[EX.e], memo)
+    expanded_f = expand_shape(definitions, definitions[EX.f], memo)
+
+    assert expanded_e.op == Op.AND
+    assert expanded_f in expanded_e.children
+    expanded_g = [c for c in expanded_e.children if c is not expanded_f][0]
+    assert expanded_f in expanded_g.children
+
+
+def test_expand_shape_reports_cycles():
+    definitions = _definitions()
+    with raises(ShapeCycleError) as error:
+        expand_shape(definitions, definitions[EX.a])
+    assert set(error.value.cycle) == {EX.a, EX.b, EX.c}
+
+
+def test_normalize_negation_normal_form():
+    path = PANode(POp.PROP, [EX.p])
+    psi = SANode(Op.HASVALUE, [EX.v])
+    at_least_one = SANode(Op.COUNTRANGE, [Literal(1), None, path, psi])
+    normalized = normalize({}, SANode(Op.NOT, [at_least_one]))
+    assert normalized is SANode(Op.COUNTRANGE, [Literal(0), Literal(0), path, psi])
+
+    forall = SANode(Op.FORALL, [path, SANode(Op.NOT, [psi])])
+    normalized = normalize({}, SANode(Op.NOT, [forall]))
+    assert normalized is SANode(Op.COUNTRANGE, [Literal(1), None, path, psi])
+
+
+def test_normalize_rules():
+    definitions = _definitions()
+    top = SANode(Op.TOP, [])
+    shape = SANode(Op.AND, [SANode(Op.HASSHAPE, [EX.f]), top,
+                            SANode(Op.OR, [SANode(Op.NOT, [top])])])
+    assert normalize(definitions, shape).op == Op.BOT
+    assert normalize(definitions, SANode(Op.OR, [shape, top])) is top
+
+    normalizer = Normalizer(definitions, rules=FRAGMENT_RULES)
+    shape = SANode(Op.AND, [SANode(Op.HASSHAPE, [EX.f]), top])
+    assert normalizer(shape) is normalizer(SANode(Op.HASSHAPE, [EX.f]))
+    assert normalizer(SANode(Op.HASSHAPE, [EX.f])).op == Op.COUNTRANGE
+
+
+def test_deep_shapes_without_recursion():
+    path = PANode(POp.PROP, [EX.next])
+    shape = SANode(Op.HASVALUE, [EX.end])
+    for _ in range(5000):
+        shape = SANode(Op.NOT, [SANode(Op.COUNTRANGE, [Literal(1), None, path, shape])])
+    normalized = normalize({}, shape)
+    assert normalized.op == Op.COUNTRANGE
+    assert to_uq(normalized).count('SELECT') > 5000